@@ -1,17 +1,28 @@
+import os
+import sys
 from matplotlib.pyplot import table
 import numpy as np
 from openfermion import QubitOperator
 
 from zquantum.core.evolution import time_evolution
 from zquantum.core.circuits import Circuit, H
-from qeqiskit.conversions import import_from_qiskit, export_to_qiskit
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-def estimate_number_of_trotter_steps(time, accuracy):
-    # NOTE: this formula might be actually inaccurate
-    # This might provide a better one: https://arxiv.org/abs/1912.08854
-    # TODO: it should also depend on the norm of the Hamiltonian. Worth thinking about it future.
-    return int(np.ceil(time ** 2 / accuracy))
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles
+from circuit_tools.qasm import write_qasm_circuit
+from circuit_tools.sweep import Sweep, parse_sweep_arguments
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
+
+
+def estimate_number_of_trotter_steps(time, accuracy, error_bound=None):
+    # The Trotter error with r steps is at most error_bound * time**2 / r, with
+    # the commutator bound of the Hamiltonian from arXiv:1912.08854 (see
+    # circuit_tools.trotter_error). Without a bound this falls back to taking
+    # it to be 1, which doesn't depend on the Hamiltonian and might be inaccurate
+    if error_bound is None:
+        return int(np.ceil(time ** 2 / accuracy))
+    return number_of_trotter_steps(error_bound, time, accuracy)
 
 
 def create_hadamard_test_circuit(unitary_circuit: Circuit) -> Circuit:
@@ -30,29 +41,56 @@ def create_hadamard_test_circuit(unitary_circuit: Circuit) -> Circuit:
     return circuit
 
 
-def main():
+def generate_toy_hamiltonian():
+    return QubitOperator("X0") + QubitOperator("Z0")
 
-    for time in [1]:
-        for precision in [1e-2, 1e-3]:
-            ### INPUTS ###
-            hamiltonian = QubitOperator("X0") + QubitOperator("Z0")
 
-            trotter_error = precision / 10
+def save_qasm_circuit(circuit, file_name):
+    # Same text as export_to_qiskit(circuit).qasm(), written line by line
+    write_qasm_circuit(circuit, file_name)
+    return WrittenFiles([file_name])
 
-            ### Prepare unitary circuit
-            n_trotter_steps = estimate_number_of_trotter_steps(time, trotter_error)
-            trotter_circuit = time_evolution(
-                hamiltonian, time=time, trotter_order=n_trotter_steps
-            )
 
-            ## Prepare algorithm circuit
-            circuit = create_hadamard_test_circuit(unitary_circuit=trotter_circuit)
-            qiskit_circuit = export_to_qiskit(circuit)
-            file_name = f"time_{time}_error_{trotter_error}"
-            file_name = file_name.replace(".", "_") + ".txt"
-            with open(file_name, "w") as f:
-                f.write(qiskit_circuit.qasm())
+def generate_hadamard_test_trotter_circuit(
+    sweep, hamiltonian, time, precision, error_bound=None
+):
+    trotter_error = precision / 10
+
+    ### Prepare unitary circuit
+    n_trotter_steps = sweep.stage(
+        estimate_number_of_trotter_steps, time, trotter_error, error_bound
+    )
+    trotter_circuit = sweep.stage(
+        time_evolution, hamiltonian, time=time, trotter_order=n_trotter_steps
+    )
+
+    ## Prepare algorithm circuit
+    circuit = sweep.stage(create_hadamard_test_circuit, unitary_circuit=trotter_circuit)
+    file_name = f"time_{time}_error_{trotter_error}"
+    file_name = file_name.replace(".", "_") + ".txt"
+    return sweep.stage(save_qasm_circuit, circuit, file_name)
+
+
+def main():
+    args = parse_sweep_arguments(
+        "Generate Hadamard test circuits for a toy Hamiltonian.",
+        times=[1],
+        precisions=[1e-2, 1e-3],
+    )
+
+    sweep = Sweep()
+    ### INPUTS ###
+    hamiltonian = sweep.stage(generate_toy_hamiltonian)
+    error_bound = None
+    if args.trotter_steps == "commutator":
+        error_bound = sweep.stage(commutator_error_bound, hamiltonian)
+    for time in args.time:
+        for precision in args.precision:
+            generate_hadamard_test_trotter_circuit(
+                sweep, hamiltonian, time, precision, error_bound
+            )
+    sweep.run(args.jobs, store=ArtifactStore(), rebuild=args.rebuild)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,57 +1,56 @@
+import os
+import sys
 import numpy as np
 from openfermion import QubitOperator
 import openfermion as of
-import openfermionpyscf as ofpyscf
 
-from orquestra.quantum.evolution import time_evolution
 from orquestra.quantum.circuits import Circuit, T
-from orquestra.integrations.qiskit.conversions import (
-    export_to_qiskit,
-)
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-def estimate_number_of_trotter_steps(time, accuracy):
-    # NOTE: this formula might be actually inaccurate
-    # This might provide a better one: https://arxiv.org/abs/1912.08854
-    # TODO: it should also depend on the norm of the Hamiltonian. Worth thinking about it future.
-    return int(np.ceil(time**2 / accuracy))
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles
+from circuit_tools.evolution import order_terms_for_ladders, time_evolution
+from circuit_tools.hamiltonians import HamiltonianCache, molecular_hamiltonians
+from circuit_tools.pauli import controlled_qubit_hamiltonian
+from circuit_tools.qasm import write_qasm_circuit
+from circuit_tools.resources import count_resources, write_resource_summary
+from circuit_tools.sweep import Sweep, parse_sweep_arguments
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
 
 
-def generate_h2_jw_qubit_hamiltonian():
+def estimate_number_of_trotter_steps(time, accuracy, error_bound=None):
+    # The Trotter error with r steps is at most error_bound * time**2 / r, with
+    # the commutator bound of the Hamiltonian from arXiv:1912.08854 (see
+    # circuit_tools.trotter_error). Without a bound this falls back to taking
+    # it to be 1, which doesn't depend on the Hamiltonian and might be inaccurate
+    if error_bound is None:
+        return int(np.ceil(time**2 / accuracy))
+    return number_of_trotter_steps(error_bound, time, accuracy)
+
+
+def generate_h2_jw_qubit_hamiltonian(cache=None):
     # Set molecule parameters
     geometry = [("H", (0.0, 0.0, 0.0)), ("H", (0.0, 0.0, 0.8))]
     basis = "sto-3g"
     multiplicity = 1
     charge = 0
 
-    # Perform electronic structure calculations and
-    # obtain Hamiltonian as an InteractionOperator
-    hamiltonian = ofpyscf.generate_molecular_hamiltonian(
-        geometry, basis, multiplicity, charge
+    # Perform electronic structure calculations and map the resulting
+    # InteractionOperator to a QubitOperator using the JWT, unless this
+    # molecule is already in the cache
+    _, hamiltonian_jw = molecular_hamiltonians(
+        geometry, basis, multiplicity, charge, cache=cache
     )
 
-    # Convert to a FermionOperator
-    hamiltonian_ferm_op = of.get_fermion_operator(hamiltonian)
-
-    # Map to QubitOperator using the JWT
-    hamiltonian_jw = of.jordan_wigner(hamiltonian_ferm_op)
-
     return hamiltonian_jw
 
 
 def add_control_qubit_to_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits):
     # Ancilla qubit is set to be last qubit
-    # Create three terms, where we've ignored the identity term
-    # Positive 1/2 of Z on control qubit
-    ancilla_Z = 0.5 * QubitOperator(f"Z{number_of_qubits}")
-    # Positive 1/2 of I on control qubit and Hamiltonian on system
-    system_hamiltonian = 0.5 * qubit_hamiltonian
-    # Negative 1/2 of Z on control qubit and Hamiltonian on system
-    coupling_hamiltonian = qubit_hamiltonian * ancilla_Z
-    control_hamiltonian = ancilla_Z + system_hamiltonian + coupling_hamiltonian
-    # Make Hamiltonian coefficients real
-    control_hamiltonian.compress()
-    return control_hamiltonian
+    # Sum of 1/2 of Z on control qubit, 1/2 of I on control qubit and Hamiltonian
+    # on system, and 1/2 of Z on control qubit and Hamiltonian on system, with
+    # real coefficients. Computed on arrays, but equal to the QubitOperator sum.
+    return controlled_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits)
 
 
 def mock_transpile_clifford_t(circuit):
@@ -65,65 +64,91 @@ def mock_transpile_clifford_t(circuit):
     return new_circuit
 
 
-def generate_trotter_step_circuit(time):
-    number_of_qubits = 4
-    qubit_hamiltonian = generate_h2_jw_qubit_hamiltonian()
-    control_hamiltonian = add_control_qubit_to_qubit_hamiltonian(
-        qubit_hamiltonian, number_of_qubits
-    )
+def save_qasm_circuit(transpiled_circuit, file_name):
+    # We may need to save to cirq for the ICM transpiling
+    # cirq_circuit = export_to_cirq(transpiled_circuit)
+    # Same text as qiskit's QuantumCircuit.qasm(), written line by line
+    write_qasm_circuit(transpiled_circuit, file_name)
+    summary_path = write_resource_summary(count_resources(transpiled_circuit), file_name)
+    return WrittenFiles([file_name, summary_path])
+
+
+def generate_trotter_step_circuit(sweep, control_hamiltonian, time, fuse=False):
+    # Adds the stages building, transpiling and saving the circuit to the
+    # sweep, so that each of them is only rerun when its inputs change
 
     ### Prepare unitary circuit
     n_trotter_steps = 1
-    trotter_circuit = time_evolution(
-        control_hamiltonian, time=time, trotter_order=n_trotter_steps
+    trotter_circuit = sweep.stage(
+        time_evolution,
+        control_hamiltonian,
+        time=time,
+        trotter_order=n_trotter_steps,
+        fuse=fuse,
     )
 
     ## Prepare algorithm circuit
-    circuit = trotter_circuit
-    transpiled_circuit = mock_transpile_clifford_t(circuit)
-    # We may need to save to cirq for the ICM transpiling
-    # cirq_circuit = export_to_cirq(transpiled_circuit)
-    qiskit_circuit = export_to_qiskit(transpiled_circuit)
+    transpiled_circuit = sweep.stage(mock_transpile_clifford_t, trotter_circuit)
     file_name = f"time_{time}_single_step"
     file_name = file_name.replace(".", "_") + ".txt"
-    with open(file_name, "w") as f:
-        f.write(qiskit_circuit.qasm())
-
+    return sweep.stage(save_qasm_circuit, transpiled_circuit, file_name)
 
-def generate_trotter_circuit(time, precision):
-    number_of_qubits = 4
-    qubit_hamiltonian = generate_h2_jw_qubit_hamiltonian()
-    control_hamiltonian = add_control_qubit_to_qubit_hamiltonian(
-        qubit_hamiltonian, number_of_qubits
-    )
 
+def generate_trotter_circuit(
+    sweep, control_hamiltonian, time, precision, error_bound=None, fuse=False
+):
     # TODO: explain where this comes from
     trotter_error = precision / 10
 
     ### Prepare unitary circuit
-    n_trotter_steps = estimate_number_of_trotter_steps(time, trotter_error)
-    trotter_circuit = time_evolution(
-        control_hamiltonian, time=time, trotter_order=n_trotter_steps
+    n_trotter_steps = sweep.stage(
+        estimate_number_of_trotter_steps, time, trotter_error, error_bound
+    )
+    trotter_circuit = sweep.stage(
+        time_evolution,
+        control_hamiltonian,
+        time=time,
+        trotter_order=n_trotter_steps,
+        fuse=fuse,
     )
 
     ## Prepare algorithm circuit
-    circuit = trotter_circuit
-    transpiled_circuit = mock_transpile_clifford_t(circuit)
-    # We may need to save to cirq for the ICM transpiling
-    # cirq_circuit = export_to_cirq(transpiled_circuit)
-    qiskit_circuit = export_to_qiskit(transpiled_circuit)
+    transpiled_circuit = sweep.stage(mock_transpile_clifford_t, trotter_circuit)
     file_name = f"time_{time}_error_{trotter_error}"
     file_name = file_name.replace(".", "_") + ".txt"
-    with open(file_name, "w") as f:
-        f.write(qiskit_circuit.qasm())
+    return sweep.stage(save_qasm_circuit, transpiled_circuit, file_name)
 
 
 def main():
+    args = parse_sweep_arguments(
+        "Generate Trotter circuits for H2.",
+        times=[1],
+        precisions=[1e-2],
+        term_order="hamiltonian",
+    )
+    number_of_qubits = 4
 
-    for time in [1]:
-        generate_trotter_step_circuit(time)
-        for precision in [1e-2]:
-            generate_trotter_circuit(time, precision)
+    # The Hamiltonian is built once and shared by all the circuits
+    sweep = Sweep()
+    qubit_hamiltonian = sweep.stage(
+        generate_h2_jw_qubit_hamiltonian, cache=HamiltonianCache()
+    )
+    control_hamiltonian = sweep.stage(
+        add_control_qubit_to_qubit_hamiltonian, qubit_hamiltonian, number_of_qubits
+    )
+    fuse = args.term_order == "ladder"
+    if fuse:
+        control_hamiltonian = sweep.stage(order_terms_for_ladders, control_hamiltonian)
+    error_bound = None
+    if args.trotter_steps == "commutator":
+        error_bound = sweep.stage(commutator_error_bound, control_hamiltonian)
+    for time in args.time:
+        generate_trotter_step_circuit(sweep, control_hamiltonian, time, fuse)
+        for precision in args.precision:
+            generate_trotter_circuit(
+                sweep, control_hamiltonian, time, precision, error_bound, fuse
+            )
+    sweep.run(args.jobs, store=ArtifactStore(), rebuild=args.rebuild)
     #         ### INPUTS ###
     #         number_of_qubits = 4
     #         qubit_hamiltonian = generate_h2_jw_qubit_hamiltonian()
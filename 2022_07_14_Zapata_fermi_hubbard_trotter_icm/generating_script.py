@@ -1,12 +1,10 @@
+import os
 import pickle
+import sys
 import numpy as np
 from openfermion import QubitOperator
-import openfermion as of
 import openfermionpyscf as ofpyscf
 
-from cirq import to_json
-
-from orquestra.quantum.evolution import time_evolution
 from orquestra.quantum.circuits import Circuit, T, X
 from orquestra.integrations.qiskit.conversions import (
     export_to_qiskit,
@@ -15,19 +13,33 @@ from orquestra.integrations.cirq.conversions import (
     export_to_cirq, import_from_cirq,
 )
 
-from icm.icm_converter import icm_circuit
+# from icm.icm_converter import icm_circuit
 
 from cirq import X as X_cirq
 from cirq import T as T_cirq
 from cirq import CNOT as CNOT_cirq
 from cirq import H as H_cirq
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles
+from circuit_tools.evolution import order_terms_for_ladders, time_evolution
+from circuit_tools.fermi_hubbard import fermi_hubbard_pauli_table
+from circuit_tools.icm import write_icm_circuit
+from circuit_tools.pauli import controlled_qubit_hamiltonian
+from circuit_tools.resources import write_resource_summary
+from circuit_tools.sweep import Sweep, lattice_size, parse_sweep_arguments
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
+
 
-def estimate_number_of_trotter_steps(time, accuracy):
-    # NOTE: this formula might be actually inaccurate
-    # This might provide a better one: https://arxiv.org/abs/1912.08854
-    # TODO: it should also depend on the norm of the Hamiltonian. Worth thinking about it future.
-    return int(np.ceil(time**2 / accuracy))
+def estimate_number_of_trotter_steps(time, accuracy, error_bound=None):
+    # The Trotter error with r steps is at most error_bound * time**2 / r, with
+    # the commutator bound of the Hamiltonian from arXiv:1912.08854 (see
+    # circuit_tools.trotter_error). Without a bound this falls back to taking
+    # it to be 1, which doesn't depend on the Hamiltonian and might be inaccurate
+    if error_bound is None:
+        return int(np.ceil(time**2 / accuracy))
+    return number_of_trotter_steps(error_bound, time, accuracy)
 
 
 def generate_fermi_hubbard_jw_qubit_hamiltonian(x_dimension,
@@ -37,31 +49,23 @@ def generate_fermi_hubbard_jw_qubit_hamiltonian(x_dimension,
                                                 chemical_potential=0.,                  
                                                 spinless=False,):
 
-    hubbard_model = of.fermi_hubbard(x_dimension,
+    # The Jordan-Wigner transform of of.fermi_hubbard with these arguments,
+    # with the same terms, built from the lattice without symbolic operators
+    hamiltonian_jw = fermi_hubbard_pauli_table(x_dimension,
                   y_dimension,
                   tunneling,
                   coulomb,  
-                  chemical_potential,                                
-                  spinless,)
-
-    # Map to QubitOperator using the JWT
-    hamiltonian_jw = of.jordan_wigner(hubbard_model)
+                  chemical_potential=chemical_potential,
+                  spinless=spinless,)
 
     return hamiltonian_jw                                  
 
 def add_control_qubit_to_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits):
     # Ancilla qubit is set to be last qubit
-    # Create three terms, where we've ignored the identity term
-    # Positive 1/2 of Z on control qubit
-    ancilla_Z = 0.5 * QubitOperator(f"Z{number_of_qubits}")
-    # Positive 1/2 of I on control qubit and Hamiltonian on system
-    system_hamiltonian = 0.5 * qubit_hamiltonian
-    # Negative 1/2 of Z on control qubit and Hamiltonian on system
-    coupling_hamiltonian = qubit_hamiltonian * ancilla_Z
-    control_hamiltonian = ancilla_Z + system_hamiltonian + coupling_hamiltonian
-    # Make Hamiltonian coefficients real
-    control_hamiltonian.compress()
-    return control_hamiltonian
+    # Sum of 1/2 of Z on control qubit, 1/2 of I on control qubit and Hamiltonian
+    # on system, and 1/2 of Z on control qubit and Hamiltonian on system, with
+    # real coefficients. Computed on arrays, but equal to the QubitOperator sum.
+    return controlled_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits)
 
 
 def mock_transpile_clifford_t(circuit):
@@ -79,51 +83,7 @@ def mock_transpile_clifford_t(circuit):
 
 
 
-def generate_icm_trotter_circuit(time, precision, x_dimension,
-                  y_dimension,
-                  tunneling,
-                  coulomb,
-                  chemical_potential=0.,                  
-                  spinless=False,
-                ):
-    
-    number_of_qubits = x_dimension*y_dimension * (2 ** (1-spinless))
-
-    qubit_hamiltonian = generate_fermi_hubbard_jw_qubit_hamiltonian(x_dimension,
-                  y_dimension,
-                  tunneling,
-                  coulomb,
-                  chemical_potential,                  
-                  spinless,)
-
-    control_hamiltonian = add_control_qubit_to_qubit_hamiltonian(
-        qubit_hamiltonian, number_of_qubits
-    )
-
-    # TODO: explain where this comes from
-    trotter_error = precision / 10
-
-    ### Prepare unitary circuit
-    n_trotter_steps = estimate_number_of_trotter_steps(time, trotter_error)
-    trotter_circuit = time_evolution(
-        control_hamiltonian, time=time, trotter_order=n_trotter_steps
-    )
-
-    ## Prepare algorithm circuit
-    circuit = trotter_circuit
-    transpiled_circuit = mock_transpile_clifford_t(circuit)
-
-    cirq_circuit = export_to_cirq(transpiled_circuit)
-
-    # # For Athena's testing purposes
-    # file_name = f"for_athena"
-    # file_name = file_name.replace(".", "_") + ".json"
-    # with open(file_name, "w") as f:
-    #     f.write(to_json(cirq_circuit))    
-
-    # ICM Compile
-    icm_cirq_circuit = icm_circuit(cirq_circuit, [X_cirq, T_cirq, CNOT_cirq, H_cirq,])
-    
+def save_icm_circuit(transpiled_circuit, file_name):
     # # Convert to qiskit
     # icm_qiskit_circuit = export_to_qiskit(import_from_cirq(icm_cirq_circuit))
 
@@ -136,22 +96,87 @@ def generate_icm_trotter_circuit(time, precision, x_dimension,
     # with open("circuit.pickle", "wb") as f:
     #     pickle.dump(icm_cirq_circuit, f)
 
+    # ICM compile: every T and T_DAG is teleported onto a fresh ancilla as the
+    # circuit is written, and the counts are taken along the way
+    summary = write_icm_circuit(transpiled_circuit, file_name)
+    summary_path = write_resource_summary(summary, file_name)
+    return WrittenFiles([file_name, summary_path])
+
+
+def generate_icm_trotter_circuit(
+    sweep, control_hamiltonian, time, precision, error_bound=None, fuse=False
+):
+    # Adds the stages building, transpiling, compiling and saving the circuit
+    # to the sweep, so that each of them is only rerun when its inputs change
+
+    # TODO: explain where this comes from
+    trotter_error = precision / 10
+
+    ### Prepare unitary circuit
+    n_trotter_steps = sweep.stage(
+        estimate_number_of_trotter_steps, time, trotter_error, error_bound
+    )
+    trotter_circuit = sweep.stage(
+        time_evolution,
+        control_hamiltonian,
+        time=time,
+        trotter_order=n_trotter_steps,
+        fuse=fuse,
+    )
+
+    ## Prepare algorithm circuit
+    transpiled_circuit = sweep.stage(mock_transpile_clifford_t, trotter_circuit)
+
     file_name = f"time_{time}_error_{trotter_error}"
     file_name = file_name.replace(".", "_") + ".json"
-    with open(file_name, "w") as f:
-        f.write(to_json(icm_cirq_circuit))
+    return sweep.stage(save_icm_circuit, transpiled_circuit, file_name)
 
 
 def main():
-
-    for time in [1]:
-        for precision in [1e-1]:
-            generate_icm_trotter_circuit(time, precision, 2,
-                                  2,
-                                  1.0,
-                                  4.0,
-                                  chemical_potential=0.5,
-                                  spinless=True)
+    args = parse_sweep_arguments(
+        "Generate ICM Trotter circuits for the Fermi-Hubbard model.",
+        times=[1],
+        precisions=[1e-1],
+        sizes=[(2, 2)],
+        size_type=lattice_size,
+        term_order="hamiltonian",
+    )
+    tunneling = 1.0
+    coulomb = 4.0
+    chemical_potential = 0.5
+    spinless = True
+
+    # The Hamiltonians are built once per lattice size and shared by all the
+    # circuits for that size
+    sweep = Sweep()
+    for x_dimension, y_dimension in args.size:
+        number_of_qubits = x_dimension * y_dimension * (2 ** (1 - spinless))
+        qubit_hamiltonian = sweep.stage(
+            generate_fermi_hubbard_jw_qubit_hamiltonian,
+            x_dimension,
+            y_dimension,
+            tunneling,
+            coulomb,
+            chemical_potential,
+            spinless,
+        )
+        control_hamiltonian = sweep.stage(
+            add_control_qubit_to_qubit_hamiltonian, qubit_hamiltonian, number_of_qubits
+        )
+        fuse = args.term_order == "ladder"
+        if fuse:
+            control_hamiltonian = sweep.stage(
+                order_terms_for_ladders, control_hamiltonian
+            )
+        error_bound = None
+        if args.trotter_steps == "commutator":
+            error_bound = sweep.stage(commutator_error_bound, control_hamiltonian)
+        for time in args.time:
+            for precision in args.precision:
+                generate_icm_trotter_circuit(
+                    sweep, control_hamiltonian, time, precision, error_bound, fuse
+                )
+    sweep.run(args.jobs, store=ArtifactStore(), rebuild=args.rebuild)
 
 
 if __name__ == "__main__":
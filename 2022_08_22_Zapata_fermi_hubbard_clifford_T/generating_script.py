@@ -1,17 +1,13 @@
+import os
 import pickle
+import sys
 import numpy as np
 from openfermion import QubitOperator
-import openfermion as of
 import openfermionpyscf as ofpyscf
 
 import time as time_lib
-import subprocess
-import re
 
-from cirq import to_json
-
-from orquestra.quantum.evolution import time_evolution
-from orquestra.quantum.circuits import Circuit, T, X, S, H
+from orquestra.quantum.circuits import Circuit, T, X
 from orquestra.integrations.qiskit.conversions import (
     export_to_qiskit,
 )
@@ -27,16 +23,30 @@ from cirq import T as T_cirq
 from cirq import CNOT as CNOT_cirq
 from cirq import H as H_cirq
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-# TODO: add caching option
-# CACHED_GRIDSYNTH_RESULTS = {}
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles
+from circuit_tools.cirq_json import write_cirq_json
+from circuit_tools.clifford_t import transpile_repeated_circuit
+from circuit_tools.evolution import order_terms_for_ladders
+from circuit_tools.fermi_hubbard import fermi_hubbard_pauli_table
+from circuit_tools.gridsynth import combine_cache_stats, gridsynth_resources
+from circuit_tools.pauli import controlled_qubit_hamiltonian
+from circuit_tools.peephole import optimization_savings, optimize_repeated_circuit
+from circuit_tools.resources import count_resources, write_resource_summary
+from circuit_tools.sweep import Sweep, lattice_size, parse_sweep_arguments
+from circuit_tools.trotter import repeated_trotter_circuit
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
 
 
-def estimate_number_of_trotter_steps(time, accuracy):
-    # NOTE: this formula might be actually inaccurate
-    # This might provide a better one: https://arxiv.org/abs/1912.08854
-    # TODO: it should also depend on the norm of the Hamiltonian. Worth thinking about it future.
-    return int(np.ceil(time**2 / accuracy))
+def estimate_number_of_trotter_steps(time, accuracy, error_bound=None):
+    # The Trotter error with r steps is at most error_bound * time**2 / r, with
+    # the commutator bound of the Hamiltonian from arXiv:1912.08854 (see
+    # circuit_tools.trotter_error). Without a bound this falls back to taking
+    # it to be 1, which doesn't depend on the Hamiltonian and might be inaccurate
+    if error_bound is None:
+        return int(np.ceil(time**2 / accuracy))
+    return number_of_trotter_steps(error_bound, time, accuracy)
 
 
 def generate_fermi_hubbard_jw_qubit_hamiltonian(
@@ -48,62 +58,26 @@ def generate_fermi_hubbard_jw_qubit_hamiltonian(
     spinless=False,
 ):
 
-    hubbard_model = of.fermi_hubbard(
+    # The Jordan-Wigner transform of of.fermi_hubbard with these arguments,
+    # with the same terms, built from the lattice without symbolic operators
+    hamiltonian_jw = fermi_hubbard_pauli_table(
         x_dimension,
         y_dimension,
         tunneling,
         coulomb,
-        chemical_potential,
-        spinless,
+        chemical_potential=chemical_potential,
+        spinless=spinless,
     )
 
-    # Map to QubitOperator using the JWT
-    hamiltonian_jw = of.jordan_wigner(hubbard_model)
-
     return hamiltonian_jw
 
 
 def add_control_qubit_to_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits):
     # Ancilla qubit is set to be last qubit
-    # Create three terms, where we've ignored the identity term
-    # Positive 1/2 of Z on control qubit
-    ancilla_Z = 0.5 * QubitOperator(f"Z{number_of_qubits}")
-    # Positive 1/2 of I on control qubit and Hamiltonian on system
-    system_hamiltonian = 0.5 * qubit_hamiltonian
-    # Negative 1/2 of Z on control qubit and Hamiltonian on system
-    coupling_hamiltonian = qubit_hamiltonian * ancilla_Z
-    control_hamiltonian = ancilla_Z + system_hamiltonian + coupling_hamiltonian
-    # Make Hamiltonian coefficients real
-    control_hamiltonian.compress()
-    return control_hamiltonian
-
-
-def parse_gate_sequence_str(gate_sequence_str, gate_operation):
-
-    # Remove phase gates from gate sequence
-    phase_free_gate_sequence_str = re.sub("W", "", gate_sequence_str.strip("\n"))
-
-    # Reverse gate order (note from gridsynth docs: "Operators are shown in matrix
-    # order, not circuit order. This means they are meant to be applied from
-    # right to left."
-    ordered_phase_free_gate_sequence_str = phase_free_gate_sequence_str[::-1]
-    new_list = []
-
-    for char in ordered_phase_free_gate_sequence_str:
-        if char == "S":
-            new_list.append(S(gate_operation.qubit_indices[0]))
-        elif char == "H":
-            new_list.append(H(gate_operation.qubit_indices[0]))
-        elif char == "T":
-            new_list.append(T(gate_operation.qubit_indices[0]))
-        elif char == "X":
-            new_list.append(X(gate_operation.qubit_indices[0]))
-        else:
-            raise Exception(f"{char} cannot be converted to a gate operation.")
-
-    new_circuit = Circuit(new_list)
-
-    return new_circuit
+    # Sum of 1/2 of Z on control qubit, 1/2 of I on control qubit and Hamiltonian
+    # on system, and 1/2 of Z on control qubit and Hamiltonian on system, with
+    # real coefficients. Computed on arrays, but equal to the QubitOperator sum.
+    return controlled_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits)
 
 
 def mock_transpile_clifford_t(circuit):
@@ -119,142 +93,157 @@ def mock_transpile_clifford_t(circuit):
     return new_circuit
 
 
-def transpile_clifford_t(circuit, synthesis_accuracy):
-    new_list = []
-    for gate_operation in circuit.operations:
-        if gate_operation.gate.name == "RZ":
-            # new_list.append(T(gate_operation.qubit_indices[0]))
-            angle = gate_operation.gate.params[0]
-            # result = subprocess.run(["./gridsynth", str(angle)])
-            result = subprocess.run(
-                ["./gridsynth", str(angle), "-e", str(synthesis_accuracy)],
-                capture_output=True,
-                text=True,
-            )
-            gate_sequence_str = result.stdout
-            gates_from_gridsynth = parse_gate_sequence_str(
-                gate_sequence_str, gate_operation
-            )
-            new_list += gates_from_gridsynth.operations
-            # new_list.append(*gates_from_gridsynth.operations)
-            # T(gate_operation.qubit_indices[0])
-        elif gate_operation.gate.name == "RX":
-            new_list.append(X(gate_operation.qubit_indices[0]))
-        else:
-            new_list.append(gate_operation)
-    # breakpoint()
-    new_circuit = Circuit(new_list)
-    return new_circuit
+def save_clifford_T_trotter_circuit(
+    transpiled_circuit, file_name, unroll_trotter_steps=False, savings=None
+):
+    # Unless requested otherwise, the Trotter step is stored once, in a
+    # CircuitOperation with the number of steps as repetitions
+    cirq_circuit = transpiled_circuit.to_cirq(unroll=unroll_trotter_steps)
 
+    # # For Athena's testing purposes
+    # file_name = f"for_athena"
+    # file_name = file_name.replace(".", "_") + ".json"
+    # with open(file_name, "w") as f:
+    #     f.write(to_json(cirq_circuit))
 
-# TODO: add caching option
-# def transpile_clifford_t_with_cache(circuit):
-#     new_list = []
-#     for gate_operation in circuit.operations:
-#         if gate_operation.gate.name == "RZ":
-#             # new_list.append(T(gate_operation.qubit_indices[0]))
-#             angle = gate_operation.gate.params[0]
-#             if angle in CACHED_GRIDSYNTH_RESULTS.keys():
-#                 gates_from_gridsynth = CACHED_GRIDSYNTH_RESULTS[angle]
-#             else:
-#                 result = subprocess.run(["./gridsynth", str(angle)])
-#                 gate_sequence_str = result.stdout
-#                 gates_from_gridsynth = parse_gate_sequence_str(gate_sequence_str, gate_operation)
-#                 CACHED_GRIDSYNTH_RESULTS[angle] = gates_from_gridsynth
-#             breakpoint()
-#             new_list.append(gates_from_gridsynth)
-#             # T(gate_operation.qubit_indices[0])
-#         elif gate_operation.gate.name == "RX":
-#             new_list.append(X(gate_operation.qubit_indices[0]))
-#         else:
-#             new_list.append(gate_operation)
-#     new_circuit = Circuit(new_list)
-#     return new_circuit
+    # # Convert to qiskit
+    # qiskit_circuit = export_to_qiskit(import_from_cirq(cirq_circuit))
+    # file_name = f"time_{time}_error_{trotter_error}"
+    # file_name = file_name.replace(".", "_") + ".txt"
+    # with open(file_name, "w") as f:
+    #     f.write(qiskit_circuit.qasm())
+
+    # Pickle circuit
+    # with open("circuit.pickle", "wb") as f:
+    #     pickle.dump(cirq_circuit, f)
+
+    write_cirq_json(cirq_circuit, file_name)
+    # Counted from the Trotter step, without unrolling the circuit
+    summary = count_resources(transpiled_circuit)
+    if savings is not None:
+        # T-count and gate count saved by the peephole optimization
+        summary["peephole_savings"] = savings
+    summary_path = write_resource_summary(summary, file_name)
+    return WrittenFiles([file_name, summary_path])
 
 
 def generate_clifford_T_trotter_circuit(
+    sweep,
+    control_hamiltonian,
     time,
     precision,
     synthesis_accuracy,
     x_dimension,
     y_dimension,
-    tunneling,
-    coulomb,
-    chemical_potential=0.0,
-    spinless=False,
+    error_bound=None,
+    fuse=False,
+    unroll_trotter_steps=False,
+    file_extension=".json",
 ):
-
-    number_of_qubits = x_dimension * y_dimension * (2 ** (1 - spinless))
-
-    qubit_hamiltonian = generate_fermi_hubbard_jw_qubit_hamiltonian(
-        x_dimension,
-        y_dimension,
-        tunneling,
-        coulomb,
-        chemical_potential,
-        spinless,
-    )
-
-    control_hamiltonian = add_control_qubit_to_qubit_hamiltonian(
-        qubit_hamiltonian, number_of_qubits
-    )
+    # Adds the stages building, transpiling and saving the circuit to the
+    # sweep, so that each of them is only rerun when its inputs change
 
     # TODO: explain where this comes from
     trotter_error = precision
     # trotter_error = precision / 10
 
     ### Prepare unitary circuit
-    n_trotter_steps = estimate_number_of_trotter_steps(time, trotter_error)
-    trotter_circuit = time_evolution(
-        control_hamiltonian, time=time, trotter_order=n_trotter_steps
+    n_trotter_steps = sweep.stage(
+        estimate_number_of_trotter_steps, time, trotter_error, error_bound
+    )
+    # Trotter steps repeat, so we only build and transpile one step (or, with
+    # fused steps, one block of two steps) and the ends of the circuit
+    trotter_circuit = sweep.stage(
+        repeated_trotter_circuit, control_hamiltonian, time, n_trotter_steps, fuse
     )
 
     ## Prepare algorithm circuit
-    circuit = trotter_circuit
-    transpiled_circuit = transpile_clifford_t(circuit, synthesis_accuracy)
-
-    cirq_circuit = export_to_cirq(transpiled_circuit)
-
-    # # For Athena's testing purposes
-    # file_name = f"for_athena"
-    # file_name = file_name.replace(".", "_") + ".json"
-    # with open(file_name, "w") as f:
-    #     f.write(to_json(cirq_circuit))
-
-    # # Convert to qiskit
-    # qiskit_circuit = export_to_qiskit(import_from_cirq(cirq_circuit))
-    # file_name = f"time_{time}_error_{trotter_error}"
-    # file_name = file_name.replace(".", "_") + ".txt"
-    # with open(file_name, "w") as f:
-    #     f.write(qiskit_circuit.qasm())
-
-    # Pickle circuit
-    # with open("circuit.pickle", "wb") as f:
-    #     pickle.dump(cirq_circuit, f)
+    transpiled_circuit = sweep.stage(
+        transpile_repeated_circuit, trotter_circuit, synthesis_accuracy
+    )
+    # Cancels and merges the gates left redundant where the gridsynth sequences
+    # meet each other and the CNOTs
+    optimized_circuit = sweep.stage(optimize_repeated_circuit, transpiled_circuit)
+    savings = sweep.stage(optimization_savings, transpiled_circuit, optimized_circuit)
 
     file_name = (
         f"fermi_hubbard_{x_dimension}_x_{y_dimension}_time_{time}_error_{trotter_error}"
     )
-    file_name = file_name.replace(".", "_") + ".json"
-    with open(file_name, "w") as f:
-        f.write(to_json(cirq_circuit))
+    file_name = file_name.replace(".", "_") + file_extension
+    return sweep.stage(
+        save_clifford_T_trotter_circuit,
+        optimized_circuit,
+        file_name,
+        unroll_trotter_steps,
+        savings=savings,
+    )
 
 
 def main():
-    synthesis_accuracy = 1e-2
-    for time in [1]:
-        for precision in [1e-1]:
-            generate_clifford_T_trotter_circuit(
-                time,
-                precision,
-                synthesis_accuracy,
-                4,
-                4,
-                1.0,
-                4.0,
-                chemical_potential=0.5,
-                spinless=True,
+    args = parse_sweep_arguments(
+        "Generate Clifford + T Trotter circuits for the Fermi-Hubbard model.",
+        times=[1],
+        precisions=[1e-1],
+        sizes=[(4, 4)],
+        synthesis_accuracies=[1e-2],
+        size_type=lattice_size,
+        term_order="hamiltonian",
+    )
+    tunneling = 1.0
+    coulomb = 4.0
+    chemical_potential = 0.5
+    spinless = True
+
+    # The Hamiltonians are built once per lattice size and shared by all the
+    # circuits for that size
+    sweep = Sweep()
+    for x_dimension, y_dimension in args.size:
+        number_of_qubits = x_dimension * y_dimension * (2 ** (1 - spinless))
+        qubit_hamiltonian = sweep.stage(
+            generate_fermi_hubbard_jw_qubit_hamiltonian,
+            x_dimension,
+            y_dimension,
+            tunneling,
+            coulomb,
+            chemical_potential,
+            spinless,
+        )
+        control_hamiltonian = sweep.stage(
+            add_control_qubit_to_qubit_hamiltonian, qubit_hamiltonian, number_of_qubits
+        )
+        fuse = args.term_order == "ladder"
+        if fuse:
+            control_hamiltonian = sweep.stage(
+                order_terms_for_ladders, control_hamiltonian
             )
+        error_bound = None
+        if args.trotter_steps == "commutator":
+            error_bound = sweep.stage(commutator_error_bound, control_hamiltonian)
+        for time in args.time:
+            for precision in args.precision:
+                for synthesis_accuracy in args.synthesis_accuracy:
+                    generate_clifford_T_trotter_circuit(
+                        sweep,
+                        control_hamiltonian,
+                        time,
+                        precision,
+                        synthesis_accuracy,
+                        x_dimension,
+                        y_dimension,
+                        error_bound=error_bound,
+                        fuse=fuse,
+                    )
+    # The cores are shared out between the circuits generated in parallel
+    n_gridsynth_workers = max(1, (os.cpu_count() or 1) // args.jobs)
+    sweep.run(
+        args.jobs,
+        gridsynth_resources(n_gridsynth_workers),
+        store=ArtifactStore(),
+        rebuild=args.rebuild,
+    )
+    # Hits and misses of the gridsynth caches of all the processes
+    cache_stats = combine_cache_stats(sweep.resource_stats.get("cache", []))
+    print(f"Gridsynth cache: {cache_stats}")
 
 
 if __name__ == "__main__":
@@ -1,52 +1,114 @@
-import numpy as np
-import random
-
-from cirq import to_json
-from cirq import X as X_cirq
-from cirq import T as T_cirq
-from cirq import CNOT as CNOT_cirq
-from cirq import H as H_cirq
-from cirq import TOFFOLI as TOFFOLI_cirq
-from cirq import LineQubit, Circuit
-
-
-def generate_circuit_including_toffoli_gates(number_of_qubits, number_of_gates):
-
-    new_list = []
-
-    for gate_id in range(number_of_gates):
-        # random_index = random.sample(range(0, 2), 1)
-        random_qubit_indices = random.sample(range(0, number_of_qubits), 3)
-        # print(random_index)
-        if random.choice([True, False]):
-            qubit = LineQubit(random_qubit_indices[0])
-            new_list.append(H_cirq(qubit))
-        else:
-            # new_list.append(H_cirq(LineQubit(random_qubit_indices[0])))
-            new_list.append(
-                TOFFOLI_cirq(
-                    LineQubit(random_qubit_indices[0]),
-                    LineQubit(random_qubit_indices[1]),
-                    LineQubit(random_qubit_indices[2]),
-                )
-            )
+import argparse
+import os
+import sys
 
-    new_circuit = Circuit(new_list)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-    return new_circuit
+from circuit_tools.random_circuits import (
+    CLIFFORD_GATE_ARITIES,
+    DEFAULT_CLIFFORD_GATES,
+    DEFAULT_TOFFOLI_FRACTION,
+    write_random_circuit,
+)
+from circuit_tools.resources import write_resource_summary
+from circuit_tools.toffoli import DECOMPOSITIONS
 
 
-number_of_qubits = 10
-number_of_gates = 40
+def generate_circuit_including_toffoli_gates(
+    number_of_qubits,
+    number_of_gates,
+    toffoli_fraction=DEFAULT_TOFFOLI_FRACTION,
+    clifford_gates=DEFAULT_CLIFFORD_GATES,
+    locality=None,
+    seed=None,
+    file_extension=".json",
+    decomposition=None,
+    n_ancilla_sets=1,
+):
+    # Gates and qubits are drawn in bulk with a seeded NumPy generator and
+    # streamed to the file, without building the circuit in cirq. With a
+    # decomposition the Toffolis are written as Clifford + T networks.
+    file_name = (
+        f"random_H_Toffoli_circuit_{number_of_qubits}_qubits_{number_of_gates}_gates"
+    )
+    if decomposition is not None:
+        file_name += f"_{decomposition}_clifford_T"
+    file_name = file_name.replace(".", "_") + file_extension
+    summary = write_random_circuit(
+        file_name,
+        number_of_qubits,
+        number_of_gates,
+        toffoli_fraction,
+        clifford_gates,
+        locality,
+        seed,
+        decomposition,
+        n_ancilla_sets,
+    )
+    write_resource_summary(summary, file_name)
+    return file_name
 
-random_circuit = generate_circuit_including_toffoli_gates(
-    number_of_qubits, number_of_gates
-)
-print(random_circuit)
 
-file_name = (
-    f"random_H_Toffoli_circuit_{number_of_qubits}_qubits_{number_of_gates}_gates"
-)
-file_name = file_name.replace(".", "_") + ".json"
-with open(file_name, "w") as f:
-    f.write(to_json(random_circuit))
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate random Clifford + Toffoli circuits."
+    )
+    parser.add_argument("--qubits", nargs="+", type=int, default=[10])
+    parser.add_argument("--gates", nargs="+", type=int, default=[40])
+    parser.add_argument(
+        "--toffoli-fraction", type=float, default=DEFAULT_TOFFOLI_FRACTION
+    )
+    parser.add_argument(
+        "--clifford-gates",
+        nargs="*",
+        choices=list(CLIFFORD_GATE_ARITIES),
+        default=list(DEFAULT_CLIFFORD_GATES),
+    )
+    parser.add_argument(
+        "--locality",
+        type=int,
+        default=None,
+        help="draw the qubits of each gate from this many consecutive qubits",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="seed of the random circuits, the same seed gives the same circuits",
+    )
+    parser.add_argument(
+        "--format",
+        choices=[".json", ".json.gz", ".json.zip", ".qasm", ".npcircuit"],
+        default=".json",
+    )
+    parser.add_argument(
+        "--decompose",
+        choices=list(DECOMPOSITIONS),
+        default=None,
+        help="decompose the Toffolis into Clifford + T: the 7 T gate network, or "
+        "T-depth 1 with 4 ancillas",
+    )
+    parser.add_argument(
+        "--ancilla-sets",
+        type=int,
+        default=1,
+        help="sets of 4 ancillas the T-depth 1 Toffolis take turns on",
+    )
+    args = parser.parse_args()
+    for number_of_qubits in args.qubits:
+        for number_of_gates in args.gates:
+            generate_circuit_including_toffoli_gates(
+                number_of_qubits,
+                number_of_gates,
+                args.toffoli_fraction,
+                args.clifford_gates,
+                args.locality,
+                args.seed,
+                args.format,
+                args.decompose,
+                args.ancilla_sets,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,14 @@
+import os
 import pickle
+import sys
 import numpy as np
 from openfermion import QubitOperator
 import openfermion as of
-from openfermionpyscf import generate_molecular_hamiltonian
 import warnings
 
 import time as time_lib
-import subprocess
-import re
 
-from cirq import to_json
-
-from orquestra.quantum.evolution import time_evolution
-from orquestra.quantum.circuits import Circuit, T, X, S, H, I
+from orquestra.quantum.circuits import Circuit, T, X
 from orquestra.integrations.cirq.conversions import (
     export_to_cirq,
     import_from_cirq,
@@ -26,81 +22,57 @@ from cirq import T as T_cirq
 from cirq import CNOT as CNOT_cirq
 from cirq import H as H_cirq
 
-
-# TODO: add caching option
-# CACHED_GRIDSYNTH_RESULTS = {}
-
-
-def estimate_number_of_trotter_steps(time, accuracy):
-    # NOTE: this formula might be actually inaccurate
-    # This might provide a better one: https://arxiv.org/abs/1912.08854
-    # TODO: it should also depend on the norm of the Hamiltonian. Worth thinking about it future.
-    return int(np.ceil(time**2 / accuracy))
-
-
-def generate_h_chain_jw_qubit_hamiltonian(basis, system_size, grid_spacing=0.8):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles
+from circuit_tools.cirq_json import write_cirq_json
+from circuit_tools.clifford_t import transpile_repeated_circuit
+from circuit_tools.evolution import order_terms_for_ladders
+from circuit_tools.gridsynth import combine_cache_stats, gridsynth_resources
+from circuit_tools.hamiltonians import HamiltonianCache, molecular_hamiltonians
+from circuit_tools.pauli import controlled_qubit_hamiltonian
+from circuit_tools.peephole import optimization_savings, optimize_repeated_circuit
+from circuit_tools.resources import count_resources, write_resource_summary
+from circuit_tools.sweep import Sweep, parse_sweep_arguments
+from circuit_tools.trotter import repeated_trotter_circuit
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
+
+
+def estimate_number_of_trotter_steps(time, accuracy, error_bound=None):
+    # The Trotter error with r steps is at most error_bound * time**2 / r, with
+    # the commutator bound of the Hamiltonian from arXiv:1912.08854 (see
+    # circuit_tools.trotter_error). Without a bound this falls back to taking
+    # it to be 1, which doesn't depend on the Hamiltonian and might be inaccurate
+    if error_bound is None:
+        return int(np.ceil(time**2 / accuracy))
+    return number_of_trotter_steps(error_bound, time, accuracy)
+
+
+def generate_h_chain_jw_qubit_hamiltonian(
+    basis, system_size, grid_spacing=0.8, cache=None
+):
     # Set molecule parameters
     grid = [grid_spacing * site for site in range(system_size)]
     geometry = [("H", (0.0, 0.0, grid_location)) for grid_location in grid]
     multiplicity = 2
     charge = 0
 
-    # Perform electronic structure calculations and
-    # obtain Hamiltonian as an InteractionOperator
-    hamiltonian = generate_molecular_hamiltonian(geometry, basis, multiplicity, charge)
-
-    # Convert to a FermionOperator
-    hamiltonian_ferm_op = of.get_fermion_operator(hamiltonian)
-
-    # Map to QubitOperator using the JWT
-    hamiltonian_jw = of.jordan_wigner(hamiltonian_ferm_op)
+    # Perform electronic structure calculations and map the resulting
+    # InteractionOperator to a QubitOperator using the JWT, unless this
+    # molecule is already in the cache
+    _, hamiltonian_jw = molecular_hamiltonians(
+        geometry, basis, multiplicity, charge, cache=cache
+    )
 
     return hamiltonian_jw
 
 
 def add_control_qubit_to_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits):
     # Ancilla qubit is set to be last qubit
-    # Create three terms, where we've ignored the identity term
-    # Positive 1/2 of Z on control qubit
-    ancilla_Z = 0.5 * QubitOperator(f"Z{number_of_qubits}")
-    # Positive 1/2 of I on control qubit and Hamiltonian on system
-    system_hamiltonian = 0.5 * qubit_hamiltonian
-    # Negative 1/2 of Z on control qubit and Hamiltonian on system
-    coupling_hamiltonian = qubit_hamiltonian * ancilla_Z
-    control_hamiltonian = ancilla_Z + system_hamiltonian + coupling_hamiltonian
-    # Make Hamiltonian coefficients real
-    control_hamiltonian.compress()
-    return control_hamiltonian
-
-
-def parse_gate_sequence_str(gate_sequence_str, gate_operation):
-
-    # Remove phase gates from gate sequence
-    phase_free_gate_sequence_str = re.sub("W", "", gate_sequence_str.strip("\n"))
-
-    # Reverse gate order (note from gridsynth docs: "Operators are shown in matrix
-    # order, not circuit order. This means they are meant to be applied from
-    # right to left."
-    ordered_phase_free_gate_sequence_str = phase_free_gate_sequence_str[::-1]
-    new_list = []
-
-    for char in ordered_phase_free_gate_sequence_str:
-        if char == "S":
-            new_list.append(S(gate_operation.qubit_indices[0]))
-        elif char == "H":
-            new_list.append(H(gate_operation.qubit_indices[0]))
-        elif char == "T":
-            new_list.append(T(gate_operation.qubit_indices[0]))
-        elif char == "X":
-            new_list.append(X(gate_operation.qubit_indices[0]))
-        elif char == "I":
-            new_list.append(I(gate_operation.qubit_indices[0]))
-        else:
-            raise Exception(f"{char} cannot be converted to a gate operation.")
-
-    new_circuit = Circuit(new_list)
-
-    return new_circuit
+    # Sum of 1/2 of Z on control qubit, 1/2 of I on control qubit and Hamiltonian
+    # on system, and 1/2 of Z on control qubit and Hamiltonian on system, with
+    # real coefficients. Computed on arrays, but equal to the QubitOperator sum.
+    return controlled_qubit_hamiltonian(qubit_hamiltonian, number_of_qubits)
 
 
 def mock_transpile_clifford_t(circuit):
@@ -116,116 +88,139 @@ def mock_transpile_clifford_t(circuit):
     return new_circuit
 
 
-def transpile_clifford_t(circuit, synthesis_accuracy):
-    new_list = []
-    for gate_operation in circuit.operations:
-        if gate_operation.gate.name == "RZ":
-            # new_list.append(T(gate_operation.qubit_indices[0]))
-            angle = gate_operation.gate.params[0]
-            # result = subprocess.run(["./gridsynth", str(angle)])
-            if np.abs(angle) < synthesis_accuracy:
-                warnings.warn("Angle smaller than synthesis accuracym returning identity", UserWarning)
-            result = subprocess.run(
-                ["./gridsynth", str(angle), "-e", str(synthesis_accuracy)],
-                capture_output=True,
-                text=True,
-            )
-            gate_sequence_str = result.stdout
-            gates_from_gridsynth = parse_gate_sequence_str(
-                gate_sequence_str, gate_operation
-            )
-            new_list += gates_from_gridsynth.operations
-            # new_list.append(*gates_from_gridsynth.operations)
-            # T(gate_operation.qubit_indices[0])
-        elif gate_operation.gate.name == "RX":
-            new_list.append(X(gate_operation.qubit_indices[0]))
-        else:
-            new_list.append(gate_operation)
-    # breakpoint()
-    new_circuit = Circuit(new_list)
-    return new_circuit
-
+def save_clifford_T_qpe_circuit(
+    transpiled_circuit, file_name, unroll_trotter_steps=False, savings=None
+):
+    # Unless requested otherwise, the Trotter step is stored once, in a
+    # CircuitOperation with the number of steps as repetitions
+    cirq_circuit = transpiled_circuit.to_cirq(unroll=unroll_trotter_steps)
 
-# TODO: add caching option
-# def transpile_clifford_t_with_cache(circuit):
-#     new_list = []
-#     for gate_operation in circuit.operations:
-#         if gate_operation.gate.name == "RZ":
-#             # new_list.append(T(gate_operation.qubit_indices[0]))
-#             angle = gate_operation.gate.params[0]
-#             if angle in CACHED_GRIDSYNTH_RESULTS.keys():
-#                 gates_from_gridsynth = CACHED_GRIDSYNTH_RESULTS[angle]
-#             else:
-#                 result = subprocess.run(["./gridsynth", str(angle)])
-#                 gate_sequence_str = result.stdout
-#                 gates_from_gridsynth = parse_gate_sequence_str(gate_sequence_str, gate_operation)
-#                 CACHED_GRIDSYNTH_RESULTS[angle] = gates_from_gridsynth
-#             breakpoint()
-#             new_list.append(gates_from_gridsynth)
-#             # T(gate_operation.qubit_indices[0])
-#         elif gate_operation.gate.name == "RX":
-#             new_list.append(X(gate_operation.qubit_indices[0]))
-#         else:
-#             new_list.append(gate_operation)
-#     new_circuit = Circuit(new_list)
-#     return new_circuit
+    write_cirq_json(cirq_circuit, file_name)
+    # Counted from the Trotter step, without unrolling the circuit
+    summary = count_resources(transpiled_circuit)
+    if savings is not None:
+        # T-count and gate count saved by the peephole optimization
+        summary["peephole_savings"] = savings
+    summary_path = write_resource_summary(summary, file_name)
+    return WrittenFiles([file_name, summary_path])
 
 
 def generate_h_chain_clifford_T_qpe_circuit(
+    sweep,
+    control_hamiltonian,
     time,
     precision,
     system_size,
     synthesis_accuracy=0.000001,
-    grid_spacing=0.8,
     basis_set="sto3g",
+    error_bound=None,
+    fuse=False,
+    unroll_trotter_steps=False,
+    file_extension=".json",
 ):
-
-    qubit_hamiltonian = generate_h_chain_jw_qubit_hamiltonian(
-        basis_set,
-        system_size,
-        grid_spacing,
-    )
-
-    number_of_qubits = of.utils.count_qubits(qubit_hamiltonian)
-
-    control_hamiltonian = add_control_qubit_to_qubit_hamiltonian(
-        qubit_hamiltonian, number_of_qubits
-    )
+    # Adds the stages building, transpiling and saving the circuit to the
+    # sweep, so that each of them is only rerun when its inputs change
 
     # TODO: explain where this comes from
     trotter_error = precision
     # trotter_error = precision / 10
 
     ### Prepare unitary circuit
-    n_trotter_steps = estimate_number_of_trotter_steps(time, trotter_error)
+    n_trotter_steps = sweep.stage(
+        estimate_number_of_trotter_steps, time, trotter_error, error_bound
+    )
 
-    trotter_circuit = time_evolution(
-        from_openfermion(control_hamiltonian), time=time, trotter_order=n_trotter_steps
+    # Trotter steps repeat, so we only build and transpile one step (or, with
+    # fused steps, one block of two steps) and the ends of the circuit
+    trotter_circuit = sweep.stage(
+        repeated_trotter_circuit,
+        sweep.stage(from_openfermion, control_hamiltonian),
+        time,
+        n_trotter_steps,
+        fuse,
     )
 
     ## Prepare algorithm circuit
-    circuit = trotter_circuit
-    transpiled_circuit = transpile_clifford_t(circuit, synthesis_accuracy)
-
-    cirq_circuit = export_to_cirq(transpiled_circuit)
+    transpiled_circuit = sweep.stage(
+        transpile_repeated_circuit, trotter_circuit, synthesis_accuracy
+    )
+    # Cancels and merges the gates left redundant where the gridsynth sequences
+    # meet each other and the CNOTs
+    optimized_circuit = sweep.stage(optimize_repeated_circuit, transpiled_circuit)
+    savings = sweep.stage(optimization_savings, transpiled_circuit, optimized_circuit)
 
     file_name = f"hydrogen_chain_{system_size}_sites_{basis_set}_time_{time}_error_{trotter_error}"
-    file_name = file_name.replace(".", "_") + ".json"
-    with open(file_name, "w") as f:
-        f.write(to_json(cirq_circuit))
+    file_name = file_name.replace(".", "_") + file_extension
+    return sweep.stage(
+        save_clifford_T_qpe_circuit,
+        optimized_circuit,
+        file_name,
+        unroll_trotter_steps,
+        savings=savings,
+    )
 
 
 def main():
-    synthesis_accuracy = 1e-5
-    for time in [1]:
-        for precision in [1e-1]:
-            generate_h_chain_clifford_T_qpe_circuit(
-                time,
-                precision,
-                1,
-                synthesis_accuracy,
-                grid_spacing=0.8,
+    args = parse_sweep_arguments(
+        "Generate Clifford + T phase estimation circuits for hydrogen chains.",
+        times=[1],
+        precisions=[1e-1],
+        sizes=[1],
+        synthesis_accuracies=[1e-5],
+        term_order="hamiltonian",
+    )
+    basis_set = "sto3g"
+    grid_spacing = 0.8
+    hamiltonian_cache = HamiltonianCache()
+
+    # The Hamiltonians are built once per chain length and shared by all the
+    # circuits for that length
+    sweep = Sweep()
+    for system_size in args.size:
+        qubit_hamiltonian = sweep.stage(
+            generate_h_chain_jw_qubit_hamiltonian,
+            basis_set,
+            system_size,
+            grid_spacing,
+            cache=hamiltonian_cache,
+        )
+        number_of_qubits = sweep.stage(of.utils.count_qubits, qubit_hamiltonian)
+        control_hamiltonian = sweep.stage(
+            add_control_qubit_to_qubit_hamiltonian, qubit_hamiltonian, number_of_qubits
+        )
+        fuse = args.term_order == "ladder"
+        if fuse:
+            control_hamiltonian = sweep.stage(
+                order_terms_for_ladders, control_hamiltonian
             )
+        error_bound = None
+        if args.trotter_steps == "commutator":
+            error_bound = sweep.stage(commutator_error_bound, control_hamiltonian)
+        for time in args.time:
+            for precision in args.precision:
+                for synthesis_accuracy in args.synthesis_accuracy:
+                    generate_h_chain_clifford_T_qpe_circuit(
+                        sweep,
+                        control_hamiltonian,
+                        time,
+                        precision,
+                        system_size,
+                        synthesis_accuracy,
+                        basis_set=basis_set,
+                        error_bound=error_bound,
+                        fuse=fuse,
+                    )
+    # The cores are shared out between the circuits generated in parallel
+    n_gridsynth_workers = max(1, (os.cpu_count() or 1) // args.jobs)
+    sweep.run(
+        args.jobs,
+        gridsynth_resources(n_gridsynth_workers),
+        store=ArtifactStore(),
+        rebuild=args.rebuild,
+    )
+    # Hits and misses of the gridsynth caches of all the processes
+    cache_stats = combine_cache_stats(sweep.resource_stats.get("cache", []))
+    print(f"Gridsynth cache: {cache_stats}")
 
 
 if __name__ == "__main__":
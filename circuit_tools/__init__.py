@@ -0,0 +1,5 @@
+"""Shared tooling used by the circuit generating scripts in this repository.
+
+The generating scripts live in dated directories and are run from inside them,
+so they add the repository root to ``sys.path`` before importing from here.
+"""
@@ -0,0 +1,180 @@
+"""Content-addressed storage of pipeline stage results.
+
+A stage result is stored under a digest of everything it was computed from:
+the source code of the module defining the stage function and of
+circuit_tools, the versions of the packages the stages compute with, and the
+fingerprints of its arguments, where the arguments produced by other stages
+are represented by their digests. Rerunning a pipeline therefore only
+recomputes the stages whose code or inputs changed, and everything after them.
+"""
+import functools
+import glob
+import hashlib
+import importlib.metadata
+import inspect
+import os
+import pickle
+import tempfile
+
+from .config import default_cache_dir
+
+DEFAULT_STORE_DIRECTORY_NAME = "artifacts"
+# Bump when the stored layout changes, so that old artifacts are not reused
+ARTIFACT_FORMAT_VERSION = 2
+# Packages whose versions are part of every artifact's digest
+DEPENDENCIES = (
+    "cirq-core",
+    "numpy",
+    "openfermion",
+    "orquestra-cirq",
+    "orquestra-quantum",
+    "pyscf",
+)
+_PICKLE_PROTOCOL = 4
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def circuit_tools_version():
+    """Digest of the circuit_tools sources, part of every artifact's digest."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))):
+        digest.update(os.path.basename(path).encode())
+        digest.update(_file_digest(path).encode())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def dependency_versions():
+    """Installed versions of DEPENDENCIES, None for the missing ones."""
+    versions = {}
+    for name in DEPENDENCIES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+@functools.lru_cache(maxsize=None)
+def code_version(function):
+    """Digest of the name of `function` and of the source file defining it.
+
+    The whole file is hashed, so that editing a function it calls, e.g.
+    another function of a generating script, also changes the digest.
+    Functions without a source file are identified by their name only.
+    """
+    name = getattr(function, "__qualname__", type(function).__qualname__)
+    module = getattr(function, "__module__", None)
+    digest = hashlib.sha256(f"{module}.{name}".encode())
+    try:
+        path = inspect.getsourcefile(function)
+    except TypeError:
+        path = None
+    if path is not None and os.path.exists(path):
+        digest.update(_file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def fingerprint(value):
+    """A description of `value` which is equal for equal inputs across runs.
+
+    Objects can define a `fingerprint` method, e.g. caches, whose contents
+    don't change the results computed with them. Other objects are pickled.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        return [type(value).__name__] + [fingerprint(item) for item in value]
+    if isinstance(value, dict):
+        return ["dict"] + [
+            [fingerprint(key), fingerprint(item)] for key, item in sorted(value.items())
+        ]
+    if hasattr(value, "fingerprint"):
+        return value.fingerprint()
+    return hashlib.sha256(pickle.dumps(value, _PICKLE_PROTOCOL)).hexdigest()
+
+
+class WrittenFiles:
+    """Result of a stage which writes files, with the digests of their contents.
+
+    The paths are made absolute, since the scripts write to the current
+    directory. The stored result is only reused from the same directory, so
+    that running a script elsewhere writes its files there, and while the
+    files still exist with the same contents.
+    """
+
+    def __init__(self, paths):
+        self.directory = os.getcwd()
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.digests = [_file_digest(path) for path in self.paths]
+
+    def is_current(self):
+        return os.getcwd() == self.directory and all(
+            os.path.exists(path) and _file_digest(path) == digest
+            for path, digest in zip(self.paths, self.digests)
+        )
+
+    def __repr__(self):
+        return f"WrittenFiles({self.paths})"
+
+
+class ArtifactStore:
+    """Pickled stage results in a directory, one file per digest."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), DEFAULT_STORE_DIRECTORY_NAME)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def _artifact_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest + ".pickle")
+
+    def get(self, digest):
+        """(True, result) for a current stored result, (False, None) otherwise."""
+        path = self._artifact_path(digest)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            if not isinstance(result, WrittenFiles) or result.is_current():
+                self.hits += 1
+                return True, result
+        self.misses += 1
+        return False, None
+
+    def put(self, digest, result):
+        path = self._artifact_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the final path and renamed, so that an interrupted
+        # run never leaves a truncated artifact behind
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), suffix=".tmp", delete=False
+        ) as f:
+            pickle.dump(result, f, _PICKLE_PROTOCOL)
+        os.replace(f.name, path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def stage_digest(function, args, kwargs):
+    """Digest of a call, with Stage arguments given by their digests."""
+    description = [
+        ARTIFACT_FORMAT_VERSION,
+        circuit_tools_version(),
+        dependency_versions(),
+        code_version(function),
+        fingerprint(list(args)),
+        fingerprint(dict(kwargs)),
+    ]
+    return hashlib.sha256(repr(description).encode()).hexdigest()
@@ -0,0 +1,341 @@
+"""Benchmarks of the generating pipeline, stage by stage.
+
+Each case (a model family and size) runs the stages of the generating scripts
+in order: building the Hamiltonian, adding the control qubit, the Trotter step
+circuit, Clifford + T transpilation, conversion to cirq and writing cirq JSON.
+Every stage is timed on its own and run once more under tracemalloc for its
+peak memory. Transpilation gets its gate sequences from a stub synthesizer, so
+the benchmarks measure our code rather than gridsynth and run offline.
+
+Results are appended to a JSON lines history file, and a stage is flagged as a
+regression when its time or peak memory exceeds the median of its previous
+results on the same host by more than a threshold. Run with
+`python -m circuit_tools.benchmarks`; it exits with status 1 on regressions.
+"""
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import warnings
+from functools import partial
+
+from .config import default_cache_dir
+
+DEFAULT_HISTORY_FILE_NAME = "benchmarks.jsonl"
+DEFAULT_THRESHOLD = 0.2
+# Previous results the baseline of a stage is the median of
+DEFAULT_WINDOW = 5
+# Differences below these are noise, whatever their ratio to the baseline
+MIN_SECONDS_DIFFERENCE = 0.01
+MIN_BYTES_DIFFERENCE = 1 << 20
+FAMILIES = ("toy", "h2", "hubbard", "h_chain")
+DEFAULT_HUBBARD_SIZES = tuple(range(1, 8))
+DEFAULT_CHAIN_LENGTHS = (1, 3, 5, 7)
+
+
+class StubSynthesisPool:
+    """Stands in for a GridsynthWorkerPool, returning a fixed sequence per angle.
+
+    The sequences are about as long as those of gridsynth at the same accuracy,
+    so that transpilation and everything after it see realistic gate counts.
+    """
+
+    def synthesize(self, angles, synthesis_accuracy):
+        n_t_gates = math.ceil(3 * math.log2(1 / synthesis_accuracy))
+        gate_sequence = "HT" * n_t_gates + "S"
+        return [(angle, gate_sequence) for angle in angles]
+
+
+def _toy_hamiltonian():
+    from openfermion import QubitOperator
+
+    # The Hamiltonian of 2022_04_11_zapata_toy_trotter
+    return QubitOperator("X0") + QubitOperator("Z0")
+
+
+def _h_chain_hamiltonian(length, basis="sto-3g", grid_spacing=0.8):
+    from .hamiltonians import molecular_hamiltonians
+
+    # The molecules of 2022_06_29_Zapata_H2_trotter and
+    # 2022_10_3_Zapata_hydrogen_chains, computed without the Hamiltonian cache.
+    # Chains with an even number of atoms are singlets.
+    geometry = [("H", (0.0, 0.0, grid_spacing * site)) for site in range(length)]
+    multiplicity = 1 + length % 2
+    return molecular_hamiltonians(geometry, basis, multiplicity, 0)[1]
+
+
+def _hubbard_hamiltonian(size):
+    from .fermi_hubbard import fermi_hubbard_pauli_table
+
+    # The model of 2022_08_22_Zapata_fermi_hubbard_clifford_T
+    return fermi_hubbard_pauli_table(
+        size, size, 1.0, 4.0, chemical_potential=0.5, spinless=True
+    )
+
+
+def benchmark_cases(families=FAMILIES, hubbard_sizes=None, chain_lengths=None):
+    """(case name, function building its qubit Hamiltonian) for each case."""
+    hubbard_sizes = DEFAULT_HUBBARD_SIZES if hubbard_sizes is None else hubbard_sizes
+    chain_lengths = DEFAULT_CHAIN_LENGTHS if chain_lengths is None else chain_lengths
+    cases = []
+    for family in families:
+        if family == "toy":
+            cases.append(("toy", _toy_hamiltonian))
+        elif family == "h2":
+            cases.append(("h2", partial(_h_chain_hamiltonian, 2)))
+        elif family == "hubbard":
+            for size in hubbard_sizes:
+                build_hamiltonian = partial(_hubbard_hamiltonian, size)
+                cases.append((f"hubbard_{size}x{size}", build_hamiltonian))
+        elif family == "h_chain":
+            for length in chain_lengths:
+                build_hamiltonian = partial(_h_chain_hamiltonian, length)
+                cases.append((f"h_chain_{length}", build_hamiltonian))
+        else:
+            raise ValueError(f"Unknown model family {family}.")
+    return cases
+
+
+def _measure(function, repeat):
+    # Best time of `repeat` runs, then the peak memory of one more run. They are
+    # separate, since tracing allocations slows Python code down several times.
+    seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = min(seconds, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    try:
+        result = function()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak_bytes
+
+
+def _write_cirq_json_to_null(cirq_circuit):
+    from .cirq_json import write_cirq_json
+
+    with open(os.devnull, "w") as f:
+        write_cirq_json(cirq_circuit, f)
+
+
+def run_case(build_hamiltonian, synthesis_accuracy=1e-2, repeat=1):
+    """Yields (stage, seconds, peak bytes) for the stages of one case.
+
+    The Trotter circuit is a single step at time 1, which is what the
+    generating scripts transpile and repeat.
+    """
+    import openfermion as of
+    from orquestra.integrations.cirq.conversions import export_to_cirq
+
+    from .clifford_t import transpile_clifford_t
+    from .evolution import time_evolution
+    from .pauli import PauliTable, controlled_qubit_hamiltonian
+
+    # Small angles are expected in molecular Hamiltonians, and warnings about
+    # them would only interleave with the results
+    warnings.filterwarnings("ignore", "Angle smaller than synthesis accuracy")
+    hamiltonian, seconds, peak_bytes = _measure(build_hamiltonian, repeat)
+    yield "hamiltonian", seconds, peak_bytes
+    if isinstance(hamiltonian, PauliTable):
+        n_qubits = hamiltonian.n_qubits
+    else:
+        n_qubits = of.utils.count_qubits(hamiltonian)
+    control_hamiltonian, seconds, peak_bytes = _measure(
+        lambda: controlled_qubit_hamiltonian(hamiltonian, n_qubits), repeat
+    )
+    yield "add_control_qubit", seconds, peak_bytes
+    circuit, seconds, peak_bytes = _measure(
+        lambda: time_evolution(control_hamiltonian, 1.0), repeat
+    )
+    yield "time_evolution", seconds, peak_bytes
+    workers = StubSynthesisPool()
+    transpiled_circuit, seconds, peak_bytes = _measure(
+        lambda: transpile_clifford_t(circuit, synthesis_accuracy, workers=workers),
+        repeat,
+    )
+    yield "transpile_clifford_t", seconds, peak_bytes
+    cirq_circuit, seconds, peak_bytes = _measure(
+        lambda: export_to_cirq(transpiled_circuit), repeat
+    )
+    yield "export_to_cirq", seconds, peak_bytes
+    _, seconds, peak_bytes = _measure(
+        lambda: _write_cirq_json_to_null(cirq_circuit), repeat
+    )
+    yield "to_json", seconds, peak_bytes
+
+
+def default_history_path():
+    return os.path.join(default_cache_dir(), DEFAULT_HISTORY_FILE_NAME)
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(records, path):
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _git_commit():
+    # The commit benchmarked, if the package is run from a git checkout
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def find_regressions(
+    record, history, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW
+):
+    """Metrics of `record` which regressed against the previous results.
+
+    Returns {metric: (value, baseline)} for "seconds" and "peak_bytes" that
+    exceed the median of the last `window` results of the same case and stage
+    on the same host by more than `threshold` (as a fraction).
+    """
+    previous = [
+        entry
+        for entry in history
+        if (entry["case"], entry["stage"], entry["host"])
+        == (record["case"], record["stage"], record["host"])
+    ][-window:]
+    if not previous:
+        return {}
+    regressions = {}
+    for metric, min_difference in [
+        ("seconds", MIN_SECONDS_DIFFERENCE),
+        ("peak_bytes", MIN_BYTES_DIFFERENCE),
+    ]:
+        baseline = statistics.median(entry[metric] for entry in previous)
+        value = record[metric]
+        if value > baseline * (1 + threshold) and value - baseline > min_difference:
+            regressions[metric] = (value, baseline)
+    return regressions
+
+
+def run_benchmarks(
+    cases,
+    history_path=None,
+    synthesis_accuracy=1e-2,
+    repeat=1,
+    threshold=DEFAULT_THRESHOLD,
+    window=DEFAULT_WINDOW,
+    record=True,
+):
+    """Runs the cases, printing each stage as it finishes.
+
+    Cases whose Hamiltonian can't be built here (e.g. molecules without pyscf)
+    are reported as skipped. Returns the new records and the regressions, as
+    (case, stage, {metric: (value, baseline)}) for each regressed stage.
+    """
+    if history_path is None:
+        history_path = default_history_path()
+    history = read_history(history_path)
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "host": platform.node(),
+        "synthesis_accuracy": synthesis_accuracy,
+    }
+    records = []
+    regressions = []
+    print(f"{'case':<16} {'stage':<22} {'seconds':>9} {'peak MB':>9}")
+    for case, build_hamiltonian in cases:
+        try:
+            for stage, seconds, peak_bytes in run_case(
+                build_hamiltonian, synthesis_accuracy, repeat
+            ):
+                stage_record = dict(
+                    run, case=case, stage=stage, seconds=seconds, peak_bytes=peak_bytes
+                )
+                records.append(stage_record)
+                stage_regressions = find_regressions(
+                    stage_record, history, threshold, window
+                )
+                flags = "".join(
+                    f"  {metric} regressed from {baseline:.4g}"
+                    for metric, (_, baseline) in stage_regressions.items()
+                )
+                print(
+                    f"{case:<16} {stage:<22} {seconds:>9.3f} "
+                    f"{peak_bytes / 2**20:>9.1f}{flags}"
+                )
+                if stage_regressions:
+                    regressions.append((case, stage, stage_regressions))
+        except ImportError as error:
+            print(f"{case:<16} skipped: {error}")
+    if record:
+        append_history(records, history_path)
+    return records, regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Time and memory-profile the stages of the generating pipeline."
+    )
+    parser.add_argument("--families", nargs="+", choices=FAMILIES, default=FAMILIES)
+    parser.add_argument(
+        "--hubbard-sizes", nargs="+", type=int, default=DEFAULT_HUBBARD_SIZES
+    )
+    parser.add_argument(
+        "--chain-lengths", nargs="+", type=int, default=DEFAULT_CHAIN_LENGTHS
+    )
+    parser.add_argument("--synthesis-accuracy", type=float, default=1e-2)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs per stage, the best one is kept"
+    )
+    parser.add_argument(
+        "--history",
+        default=None,
+        help=f"JSON lines history file (default: {DEFAULT_HISTORY_FILE_NAME} in the "
+        "cache directory)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative increase over the median of previous runs flagged as a "
+        "regression",
+    )
+    parser.add_argument(
+        "--no-record",
+        action="store_true",
+        help="compare against the history without adding this run to it",
+    )
+    args = parser.parse_args()
+    cases = benchmark_cases(args.families, args.hubbard_sizes, args.chain_lengths)
+    _, regressions = run_benchmarks(
+        cases,
+        args.history,
+        args.synthesis_accuracy,
+        args.repeat,
+        args.threshold,
+        record=not args.no_record,
+    )
+    if regressions:
+        print(f"{len(regressions)} stages regressed.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
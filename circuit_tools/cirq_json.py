@@ -0,0 +1,421 @@
+"""Streaming writer and reader for circuits in the cirq JSON format.
+
+`cirq.to_json` builds the JSON for the whole circuit in memory before anything
+is written. The writer below produces the same text (for circuits without
+subcircuits it is identical to `cirq.to_json`), but writes it moment by moment
+and serializes every distinct operation only once. Likewise `cirq.read_json`
+parses the whole file into cirq objects, while the reader decodes one moment
+at a time.
+"""
+import contextlib
+import gzip
+import io
+import json
+import os
+import re
+import zipfile
+from collections import Counter, deque
+
+import cirq
+
+from .instrumentation import profiled
+
+DEFAULT_MAX_CACHED_OPERATIONS = 100_000
+DEFAULT_READ_BLOCK_SIZE = 1 << 20
+# Whitespace, colons, brackets and commas between "moments" and a moment
+_MOMENT_SEPARATOR = re.compile(r"[\s:\[,]*")
+
+
+def _indent(text, n_spaces):
+    return "\n".join(" " * n_spaces + line for line in text.split("\n"))
+
+
+def _split_empty_list(text, key):
+    # Splits the JSON of an empty container around its empty list, so that the
+    # wrapper around the items is whatever the installed cirq version produces.
+    empty_list = f'"{key}": []'
+    position = text.index(empty_list) + len(empty_list) - 1
+    return text[:position], text[position:]
+
+
+def operation_text(operation):
+    """The JSON of `operation` as it appears in the moments of a circuit file."""
+    return _indent(cirq.to_json(operation), 8)
+
+
+@contextlib.contextmanager
+def open_circuit_file(path, mode="r"):
+    """Opens a circuit file in text mode, compressing based on the extension.
+
+    Files ending with .gz are gzipped, and files ending with .zip are zip
+    archives with a single member named like the archive without ".zip".
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, mode + "t", encoding="utf-8") as f:
+            yield f
+    elif path.endswith(".zip"):
+        zip_mode = "w" if mode == "w" else "r"
+        with zipfile.ZipFile(path, zip_mode, compression=zipfile.ZIP_DEFLATED) as archive:
+            if zip_mode == "w":
+                member_name = os.path.basename(path)[: -len(".zip")]
+            else:
+                member_name = archive.namelist()[0]
+            with archive.open(member_name, zip_mode) as member:
+                with io.TextIOWrapper(member, encoding="utf-8") as f:
+                    yield f
+    else:
+        with open(path, mode) as f:
+            yield f
+
+
+class CirqJsonWriter:
+    """Writes a cirq JSON circuit to an open file, one moment at a time."""
+
+    def __init__(self, file, max_cached_operations=DEFAULT_MAX_CACHED_OPERATIONS):
+        self.file = file
+        self.max_cached_operations = max_cached_operations
+        self.n_moments = 0
+        self._operation_texts = {}
+        self._circuit_head, self._circuit_tail = _split_empty_list(
+            cirq.to_json(cirq.Circuit()), "moments"
+        )
+        moment_head, moment_tail = _split_empty_list(
+            cirq.to_json(cirq.Moment()), "operations"
+        )
+        self._moment_head = _indent(moment_head, 4)
+        self._moment_tail = moment_tail.replace("\n", "\n    ")
+
+    def _operation_text(self, operation):
+        # Keyed by the qubits in order, since operations are equal to those
+        # with their interchangeable qubits (e.g. the controls of a Toffoli)
+        # swapped, but are serialized with the qubits in their own order
+        key = (operation, operation.qubits)
+        text = self._operation_texts.get(key)
+        if text is None:
+            text = operation_text(operation)
+            # Subcircuits are serialized with keys which are only unique within
+            # a single to_json call, so they are never reused.
+            if len(self._operation_texts) < self.max_cached_operations and not (
+                isinstance(operation, cirq.CircuitOperation)
+            ):
+                self._operation_texts[key] = text
+        return text
+
+    def write_moment(self, moment):
+        self.write_operation_texts(
+            [self._operation_text(operation) for operation in moment.operations]
+        )
+
+    def write_operation_texts(self, texts):
+        """Writes a moment given by the texts of its operations (operation_text).
+
+        Callers producing many distinct operations can render their texts
+        from templates, instead of serializing each operation with cirq.
+        """
+        if self.n_moments == 0:
+            self.file.write(self._circuit_head + "\n")
+        else:
+            self.file.write(",\n")
+        self.file.write(self._moment_head)
+        if texts:
+            self.file.write("\n")
+            self.file.write(",\n".join(texts))
+            self.file.write("\n      ")
+        self.file.write(self._moment_tail)
+        self.n_moments += 1
+
+    def close(self):
+        if self.n_moments == 0:
+            self.file.write(self._circuit_head)
+        else:
+            self.file.write("\n  ")
+        self.file.write(self._circuit_tail)
+
+
+def iter_moments(operations, qubits):
+    """Yields the moments of cirq.Circuit(operations) without building it.
+
+    Operations are placed like cirq does by default (InsertStrategy.EARLIEST).
+    A moment is yielded as soon as every qubit in `qubits` has been used in it
+    or after it, since nothing can be added to it afterwards, so only the
+    moments which are still open are kept in memory.
+    """
+    frontier = {qubit: 0 for qubit in qubits}
+    n_qubits_at_frontier = Counter({0: len(frontier)})
+    measurement_key_frontier = {}
+    open_moments = deque()
+    first_open_moment = 0
+    for operation in operations:
+        measurement_keys = ()
+        if isinstance(operation.gate, cirq.MeasurementGate):
+            measurement_keys = cirq.measurement_key_objs(operation)
+        index = max(
+            [frontier[qubit] for qubit in operation.qubits]
+            + [measurement_key_frontier.get(key, 0) for key in measurement_keys]
+        )
+        while index - first_open_moment >= len(open_moments):
+            open_moments.append([])
+        open_moments[index - first_open_moment].append(operation)
+        for qubit in operation.qubits:
+            n_qubits_at_frontier[frontier[qubit]] -= 1
+            n_qubits_at_frontier[index + 1] += 1
+            frontier[qubit] = index + 1
+        for key in measurement_keys:
+            measurement_key_frontier[key] = index + 1
+
+        min_frontier = first_open_moment
+        while frontier and n_qubits_at_frontier[min_frontier] == 0:
+            del n_qubits_at_frontier[min_frontier]
+            min_frontier += 1
+        while first_open_moment < min_frontier:
+            yield cirq.Moment(open_moments.popleft())
+            first_open_moment += 1
+
+    for moment_operations in open_moments:
+        yield cirq.Moment(moment_operations)
+
+
+@profiled
+def write_cirq_json(moments, file_or_path, **writer_kwargs):
+    """Writes a circuit given as a cirq.Circuit or an iterable of cirq.Moments.
+
+    Paths ending with .gz or .zip are compressed, see `open_circuit_file`.
+    """
+    if isinstance(file_or_path, str):
+        with open_circuit_file(file_or_path, "w") as f:
+            return write_cirq_json(moments, f, **writer_kwargs)
+    writer = CirqJsonWriter(file_or_path, **writer_kwargs)
+    for moment in moments:
+        writer.write_moment(moment)
+    writer.close()
+
+
+class CirqJsonReader:
+    """Iterates over the operations of a cirq JSON circuit file moment by moment.
+
+    The file is read in blocks and only one moment is decoded at a time, so
+    memory grows with the largest moment rather than with the file, also for
+    the .gz and .zip files opened with open_circuit_file. Like
+    circuit_tools.qasm.QasmReader, iterating over the reader yields (gate name,
+    qubit indices, params) triples, which ColumnarCircuit.from_operations turns
+    into arrays; `moments` yields cirq Moments instead.
+
+    LineQubits are indexed by their x, and NamedQubits in the order they first
+    appear, with their names in `qubit_names`. Measurements have the index of
+    their key in `measurement_keys` as param. The subcircuit of a
+    CircuitOperation is converted once and its operations repeated; if the
+    circuit is a single repeated CircuitOperation (a Trotter step repeated with
+    cirq.CircuitOperation.repeat), `step_offsets` holds the index of the first
+    operation of each repetition, and the total, once the reader is exhausted.
+    Gates are encoded with `encode_gate`, by default columnar.encode_cirq_gate,
+    once per distinct gate.
+    """
+
+    def __init__(self, file, encode_gate=None, block_size=DEFAULT_READ_BLOCK_SIZE):
+        from .columnar import encode_cirq_gate
+
+        self.file = file
+        self.encode_gate = encode_cirq_gate if encode_gate is None else encode_gate
+        self.block_size = block_size
+        self.n_moments = 0
+        self.n_qubits = 0
+        self.qubit_names = None
+        self.measurement_keys = []
+        self.step_offsets = None
+        self._repeated_block = None
+        self._qubit_type = None
+        self._qubit_indices = {}
+        self._measurement_key_indices = {}
+        self._encoded_gates = {}
+        self._serialized_values = {}
+        self._buffer = ""
+
+    def _read(self, size):
+        block = self.file.read(size)
+        self._buffer += block
+        return bool(block)
+
+    def _iter_moment_json(self):
+        # Yields (decoded JSON, text) of each moment
+        decoder = json.JSONDecoder()
+        while (position := self._buffer.find('"moments"')) < 0:
+            if not self._read(self.block_size):
+                raise ValueError("The file is not a cirq JSON circuit.")
+        position += len('"moments"')
+        while True:
+            position = _MOMENT_SEPARATOR.match(self._buffer, position).end()
+            if position == len(self._buffer):
+                if not self._read(self.block_size):
+                    raise ValueError("The cirq JSON circuit file is truncated.")
+                continue
+            if self._buffer[position] == "]":
+                return
+            try:
+                moment, end = decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                # The moment doesn't fit into the buffer yet. Reading as much
+                # again as is buffered keeps the retries linear in its size.
+                if not self._read(max(self.block_size, len(self._buffer) - position)):
+                    raise
+                continue
+            self.n_moments += 1
+            yield moment, self._buffer[position:end]
+            position = end
+            if position > self.block_size:
+                self._buffer = self._buffer[position:]
+                position = 0
+
+    def moments(self):
+        """Yields the moments of the circuit as cirq.Moments."""
+        for moment, text in self._iter_moment_json():
+            if '"VAL"' in text or '"REF"' in text:
+                text = json.dumps(self._resolved(moment))
+            yield cirq.read_json(json_text=text)
+
+    def _resolved(self, value):
+        # The JSON with the references cirq writes for repeated values (such as
+        # the FrozenCircuit of CircuitOperations) replaced by the values, since
+        # each moment is deserialized on its own
+        if isinstance(value, list):
+            return [self._resolved(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        cirq_type = value.get("cirq_type")
+        if cirq_type == "REF":
+            return self._serialized_values[value["key"]]
+        value = {key: self._resolved(item) for key, item in value.items()}
+        if cirq_type == "VAL":
+            self._serialized_values[value["key"]] = value
+        return value
+
+    def __iter__(self):
+        n_operations = 0
+        for moment, _ in self._iter_moment_json():
+            for operation in moment["operations"]:
+                n_operations += 1
+                yield from self._decoded_operations(operation)
+        if n_operations == 1 and self._repeated_block is not None:
+            block_length, repetitions = self._repeated_block
+            if repetitions < 2:
+                return
+            self.step_offsets = [block_length * step for step in range(repetitions + 1)]
+
+    def _qubit_index(self, qubit_type, label):
+        index = self._qubit_indices.get((qubit_type, label))
+        if index is not None:
+            return index
+        if self._qubit_type is None and qubit_type in ("LineQubit", "NamedQubit"):
+            self._qubit_type = qubit_type
+            if qubit_type == "NamedQubit":
+                self.qubit_names = []
+        if qubit_type != self._qubit_type:
+            raise ValueError(
+                "Only circuits on LineQubits or on NamedQubits are supported."
+            )
+        if qubit_type == "LineQubit":
+            index = label
+        else:
+            index = len(self.qubit_names)
+            self.qubit_names.append(label)
+        self.n_qubits = max(self.n_qubits, index + 1)
+        self._qubit_indices[qubit_type, label] = index
+        return index
+
+    def _measurement(self, qubits, key):
+        if len(qubits) != 1:
+            raise ValueError("Only single qubit measurements are supported.")
+        key_index = self._measurement_key_indices.get(key)
+        if key_index is None:
+            key_index = len(self.measurement_keys)
+            self._measurement_key_indices[key] = key_index
+            self.measurement_keys.append(key)
+        return "MEASURE", qubits, (float(key_index),)
+
+    def _encoded_gate(self, gate):
+        # Gates are cached by their JSON, as a tuple of items if it is flat
+        try:
+            key = tuple(gate.items())
+            encoded_gate = self._encoded_gates.get(key)
+        except TypeError:
+            key = json.dumps(gate, sort_keys=True)
+            encoded_gate = self._encoded_gates.get(key)
+        if encoded_gate is None:
+            encoded_gate = self.encode_gate(cirq.read_json(json_text=json.dumps(gate)))
+            self._encoded_gates[key] = encoded_gate
+        return encoded_gate
+
+    def _decoded_operations(self, operation):
+        # The common operation types are encoded from their JSON, without
+        # building them in cirq
+        cirq_type = operation["cirq_type"]
+        if cirq_type == "GateOperation":
+            gate, qubits = operation["gate"], operation["qubits"]
+        elif cirq_type == "SingleQubitPauliStringGateOperation":
+            gate, qubits = operation["pauli"], [operation["qubit"]]
+        else:
+            operation = cirq.read_json(json_text=json.dumps(self._resolved(operation)))
+            operation = operation.untagged
+            if isinstance(operation, cirq.CircuitOperation):
+                block_operations = self._circuit_operation_block(operation)
+                repetitions = abs(operation.repetitions)
+                self._repeated_block = (len(block_operations), repetitions)
+                for _ in range(repetitions):
+                    yield from block_operations
+            else:
+                yield from self._cirq_operations(operation)
+            return
+        qubits = tuple(
+            self._qubit_index(qubit["cirq_type"], qubit.get("x", qubit.get("name")))
+            for qubit in qubits
+        )
+        if gate["cirq_type"] == "MeasurementGate":
+            key = gate["key"]
+            if isinstance(key, dict):
+                # A MeasurementKey, whose string includes its path
+                key = str(cirq.read_json(json_text=json.dumps(key)))
+            yield self._measurement(qubits, key)
+            return
+        gate_name, params = self._encoded_gate(gate)
+        yield gate_name, qubits, params
+
+    def _circuit_operation_block(self, operation):
+        # The operations of the subcircuit on the qubits they are mapped to (its
+        # inverse for negative repetitions), converted once
+        single = operation.replace(
+            repetitions=1 if operation.repetitions > 0 else -1, repetition_ids=None
+        )
+        return [
+            encoded_operation
+            for sub_operation in single.mapped_circuit(deep=False).all_operations()
+            for encoded_operation in self._cirq_operations(sub_operation)
+        ]
+
+    def _cirq_operations(self, operation):
+        operation = operation.untagged
+        if isinstance(operation, cirq.CircuitOperation):
+            block_operations = self._circuit_operation_block(operation)
+            for _ in range(abs(operation.repetitions)):
+                yield from block_operations
+            return
+        qubits = tuple(
+            self._qubit_index(
+                type(qubit).__name__, getattr(qubit, "x", getattr(qubit, "name", None))
+            )
+            for qubit in operation.qubits
+        )
+        if isinstance(operation.gate, cirq.MeasurementGate):
+            yield self._measurement(qubits, cirq.measurement_key_name(operation))
+            return
+        gate_name, params = self.encode_gate(operation.gate)
+        yield gate_name, qubits, params
+
+
+def read_cirq_json_operations(file_or_path, **reader_kwargs):
+    """Yields the operations of a cirq JSON circuit file as (gate name, qubit
+    indices, params) triples, one moment at a time (see CirqJsonReader).
+    """
+    if isinstance(file_or_path, str):
+        with open_circuit_file(file_or_path) as f:
+            yield from read_cirq_json_operations(f, **reader_kwargs)
+        return
+    yield from CirqJsonReader(file_or_path, **reader_kwargs)
@@ -0,0 +1,96 @@
+"""Transpiling Trotter circuits to the Clifford + T gate set."""
+import warnings
+
+import numpy as np
+from orquestra.quantum.circuits import Circuit, H, I, S, T, X
+
+from .gridsynth import (
+    canonical_angle,
+    gate_sequence_from_gridsynth_output,
+    synthesize_angles,
+)
+from .instrumentation import profiled
+
+GRIDSYNTH_GATES = {"S": S, "H": H, "T": T, "X": X, "I": I}
+
+
+def gate_sequence_to_operations(gate_sequence, qubit_index):
+    new_list = []
+    for char in gate_sequence:
+        try:
+            gate = GRIDSYNTH_GATES[char]
+        except KeyError:
+            raise Exception(f"{char} cannot be converted to a gate operation.")
+        new_list.append(gate(qubit_index))
+    return new_list
+
+
+@profiled
+def parse_gate_sequence_str(gate_sequence_str, gate_operation):
+    gate_sequence = gate_sequence_from_gridsynth_output(gate_sequence_str)
+    return Circuit(
+        gate_sequence_to_operations(gate_sequence, gate_operation.qubit_indices[0])
+    )
+
+
+@profiled
+def transpile_clifford_t(
+    circuit, synthesis_accuracy, cache=None, max_workers=None, workers=None
+):
+    """Replace RZ rotations with gridsynth sequences and RX rotations with X.
+
+    The distinct RZ angles of the whole circuit are collected first and
+    synthesized concurrently (see `synthesize_angles`), and the resulting
+    sequences are spliced back in afterwards. If `cache` (a GridsynthCache) is
+    given, gridsynth is only called for angles which haven't been synthesized
+    with the same accuracy before. Passing `workers` (a GridsynthWorkerPool)
+    reuses long-lived gridsynth processes instead of starting one per angle.
+    """
+    angles = [
+        gate_operation.gate.params[0]
+        for gate_operation in circuit.operations
+        if gate_operation.gate.name == "RZ"
+    ]
+    for angle in angles:
+        if np.abs(angle) < synthesis_accuracy:
+            warnings.warn(
+                "Angle smaller than synthesis accuracy, returning identity",
+                UserWarning,
+            )
+            break
+    gate_sequences = synthesize_angles(
+        angles,
+        synthesis_accuracy,
+        cache=cache,
+        max_workers=max_workers,
+        workers=workers,
+    )
+
+    new_list = []
+    for gate_operation in circuit.operations:
+        if gate_operation.gate.name == "RZ":
+            angle = gate_operation.gate.params[0]
+            new_list += gate_sequence_to_operations(
+                gate_sequences[canonical_angle(angle)],
+                gate_operation.qubit_indices[0],
+            )
+        elif gate_operation.gate.name == "RX":
+            new_list.append(X(gate_operation.qubit_indices[0]))
+        else:
+            new_list.append(gate_operation)
+    return Circuit(new_list)
+
+
+def transpile_repeated_circuit(
+    repeated_circuit, synthesis_accuracy, cache=None, max_workers=None, workers=None
+):
+    """transpile_clifford_t applied once to the block of a RepeatedCircuit."""
+    return repeated_circuit.map_block(
+        lambda block: transpile_clifford_t(
+            block,
+            synthesis_accuracy,
+            cache=cache,
+            max_workers=max_workers,
+            workers=workers,
+        )
+    )
@@ -0,0 +1,737 @@
+"""Compact columnar storage of circuits, readable with memory mapping.
+
+A circuit is stored as three arrays with one row per operation: opcodes
+(uint8, indices into GATE_NAMES), qubits (int32, padded with -1 up to
+MAX_QUBITS_PER_OPERATION) and params (float64, NaN for gates without one;
+complex128 for circuits with complex rotation angles).
+
+On disk the file starts with FILE_MAGIC, the length of a JSON header as a
+little-endian uint64 and the header itself, which lists the dtype, shape and
+offset of each array, the gate names, qubit names, measurement keys and the
+offsets at which Trotter steps start. The arrays follow, 64-byte aligned, so
+they can be memory-mapped with numpy and sliced without reading the file.
+
+Only numpy is needed to read the files; orquestra and cirq are imported when
+converting from or to their circuits.
+"""
+import cmath
+import json
+import struct
+from array import array
+from collections import Counter
+
+import numpy as np
+
+GATE_NAMES = (
+    "I",
+    "X",
+    "Y",
+    "Z",
+    "H",
+    "S",
+    "S_DAG",
+    "T",
+    "T_DAG",
+    "RX",
+    "RY",
+    "RZ",
+    "XPOW",
+    "YPOW",
+    "ZPOW",
+    "CNOT",
+    "CZ",
+    "SWAP",
+    "CRZ",
+    "TOFFOLI",
+    "MEASURE",
+    "RESET",
+)
+OPCODES = {gate_name: opcode for opcode, gate_name in enumerate(GATE_NAMES)}
+MAX_QUBITS_PER_OPERATION = 3
+FILE_MAGIC = b"DARPACOL"
+FORMAT_VERSION = 1
+COLUMNAR_EXTENSION = ".npcircuit"
+_ALIGNMENT = 64
+_ITERATION_CHUNK_SIZE = 65536
+_ARRAYS = ("opcodes", "qubits", "params")
+
+
+class ColumnarCircuit:
+    """A circuit stored as opcode, qubit and param arrays.
+
+    `step_offsets` holds the index of the first operation of each Trotter step
+    (and the total number of operations at the end), if the circuit has steps.
+    NamedQubits are stored by index, with their names in `qubit_names`; if
+    `qubit_names` is None the qubits are LineQubits.
+    """
+
+    def __init__(
+        self,
+        opcodes,
+        qubits,
+        params,
+        n_qubits=None,
+        step_offsets=None,
+        qubit_names=None,
+        measurement_keys=(),
+    ):
+        self.opcodes = opcodes
+        self.qubits = qubits
+        self.params = params
+        if n_qubits is None:
+            n_qubits = int(qubits.max()) + 1 if len(qubits) else 0
+        self.n_qubits = n_qubits
+        self.step_offsets = None if step_offsets is None else np.asarray(step_offsets)
+        self.qubit_names = qubit_names
+        self.measurement_keys = list(measurement_keys)
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    @property
+    def n_steps(self):
+        return 0 if self.step_offsets is None else len(self.step_offsets) - 1
+
+    def _with_arrays(self, start, stop, step_offsets=None):
+        return ColumnarCircuit(
+            self.opcodes[start:stop],
+            self.qubits[start:stop],
+            self.params[start:stop],
+            self.n_qubits,
+            step_offsets,
+            self.qubit_names,
+            self.measurement_keys,
+        )
+
+    def operation_range(self, start, stop):
+        """Operations start to stop; arrays are views, so nothing is copied."""
+        return self._with_arrays(start, stop)
+
+    def steps(self, start, stop=None):
+        """Trotter steps start to stop (just step `start` if stop is None)."""
+        if self.step_offsets is None:
+            raise ValueError("The circuit has no Trotter steps.")
+        if stop is None:
+            stop = start + 1
+        offsets = self.step_offsets[start : stop + 1]
+        return self._with_arrays(offsets[0], offsets[-1], offsets - offsets[0])
+
+    def gate_counts(self):
+        counts = np.bincount(self.opcodes, minlength=len(GATE_NAMES))
+        return Counter(
+            {GATE_NAMES[opcode]: int(count) for opcode, count in enumerate(counts) if count}
+        )
+
+    def iter_operations(self):
+        """Yields (gate name, qubit indices, params) for each operation.
+
+        The arrays are converted in chunks, so memory-mapped circuits are
+        streamed rather than read into memory at once.
+        """
+        for start in range(0, len(self), _ITERATION_CHUNK_SIZE):
+            stop = start + _ITERATION_CHUNK_SIZE
+            opcodes = np.asarray(self.opcodes[start:stop]).tolist()
+            qubits = np.asarray(self.qubits[start:stop]).tolist()
+            params = np.asarray(self.params[start:stop]).tolist()
+            for opcode, operation_qubits, param in zip(opcodes, qubits, params):
+                yield (
+                    GATE_NAMES[opcode],
+                    tuple(qubit for qubit in operation_qubits if qubit >= 0),
+                    () if cmath.isnan(param) else (param,),
+                )
+
+    def repeat(self, repetitions):
+        """This circuit repeated, with each repetition as a Trotter step."""
+        return ColumnarCircuit(
+            np.tile(self.opcodes, repetitions),
+            np.tile(self.qubits, (repetitions, 1)),
+            np.tile(self.params, repetitions),
+            self.n_qubits,
+            np.arange(repetitions + 1) * len(self),
+            self.qubit_names,
+            self.measurement_keys,
+        )
+
+    @staticmethod
+    def concatenate(circuits):
+        """The circuits one after the other, as a circuit without Trotter steps."""
+        return ColumnarCircuit(
+            np.concatenate([circuit.opcodes for circuit in circuits]),
+            np.concatenate([circuit.qubits for circuit in circuits]),
+            np.concatenate([circuit.params for circuit in circuits]),
+            max(circuit.n_qubits for circuit in circuits),
+            None,
+            circuits[0].qubit_names,
+            circuits[0].measurement_keys,
+        )
+
+    @classmethod
+    def from_operations(cls, operations, **kwargs):
+        """Builds the arrays from (gate name, qubit indices, params) triples.
+
+        The operations are collected in typed buffers of the final dtypes, so
+        long streams of operations take no more memory than the arrays. Params
+        are float64 until the first complex one, from which on they are
+        collected as interleaved real and imaginary parts (complex128).
+        """
+        opcodes = array("B")
+        qubits = array("i")
+        params = array("d")
+        is_complex = False
+        padding = (-1,) * MAX_QUBITS_PER_OPERATION
+        for gate_name, operation_qubits, operation_params in operations:
+            if len(operation_qubits) > MAX_QUBITS_PER_OPERATION:
+                raise ValueError(f"{gate_name} acts on too many qubits.")
+            opcodes.append(OPCODES[gate_name])
+            qubits.extend(
+                (tuple(operation_qubits) + padding)[:MAX_QUBITS_PER_OPERATION]
+            )
+            param = operation_params[0] if len(operation_params) else np.nan
+            if isinstance(param, complex):
+                if not is_complex:
+                    params = array("d", [x for real in params for x in (real, 0.0)])
+                    is_complex = True
+                params.extend((param.real, param.imag))
+            elif is_complex:
+                params.extend((param, 0.0))
+            else:
+                params.append(param)
+        return cls(
+            np.frombuffer(opcodes, dtype=np.uint8).copy(),
+            np.frombuffer(qubits, dtype=np.int32)
+            .reshape(-1, MAX_QUBITS_PER_OPERATION)
+            .copy(),
+            np.frombuffer(
+                params, dtype=np.complex128 if is_complex else np.float64
+            ).copy(),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_orquestra(cls, circuit):
+        return cls.from_operations(
+            _orquestra_operations(circuit), n_qubits=circuit.n_qubits
+        )
+
+    @classmethod
+    def from_repeated_circuit(cls, repeated_circuit):
+        """Converts a RepeatedCircuit, with each repetition as a Trotter step.
+
+        Only the block is converted; the arrays of the full circuit are tiled.
+        A circuit with a prefix or suffix (a fused Trotter circuit) is
+        converted without Trotter steps.
+        """
+        block = cls.from_orquestra(repeated_circuit.block)
+        circuit = block.repeat(repeated_circuit.repetitions)
+        prefix, suffix = repeated_circuit.prefix, repeated_circuit.suffix
+        if not (prefix.operations or suffix.operations):
+            return circuit
+        return cls.concatenate(
+            [cls.from_orquestra(prefix), circuit, cls.from_orquestra(suffix)]
+        )
+
+    @classmethod
+    def from_cirq(cls, circuit):
+        """Converts a cirq Circuit, converting each CircuitOperation once.
+
+        A circuit made of a single repeated CircuitOperation (a Trotter step
+        repeated with cirq.CircuitOperation.repeat) has each repetition as a
+        Trotter step, like a RepeatedCircuit without prefix and suffix.
+        """
+        parts = _cirq_columnar_parts(circuit)
+        if len(parts) == 1 and parts[0][1] > 1:
+            part, repetitions = parts[0]
+            return part.repeat(repetitions)
+        return _concatenated_parts(parts)
+
+    def to_orquestra(self):
+        from orquestra.quantum.circuits import Circuit
+
+        gates = _orquestra_gates()
+        operations = []
+        for gate_name, qubits, params in self.iter_operations():
+            try:
+                gate = gates[gate_name]
+            except KeyError:
+                raise ValueError(f"{gate_name} has no orquestra equivalent.")
+            operations.append((gate(*params) if params else gate)(*qubits))
+        return Circuit(operations, n_qubits=self.n_qubits)
+
+    def cirq_qubits(self):
+        import cirq
+
+        if self.qubit_names is None:
+            return cirq.LineQubit.range(self.n_qubits)
+        return [cirq.NamedQubit(name) for name in self.qubit_names]
+
+    def iter_cirq_operations(self):
+        import cirq
+
+        qubits = self.cirq_qubits()
+        gates = _cirq_gates()
+        for gate_name, qubit_indices, params in self.iter_operations():
+            operation_qubits = [qubits[index] for index in qubit_indices]
+            if gate_name == "MEASURE":
+                key = self.measurement_keys[int(params[0])]
+                yield cirq.measure(*operation_qubits, key=key)
+            else:
+                gate = gates[gate_name]
+                yield (gate(*params) if params else gate).on(*operation_qubits)
+
+    def to_cirq(self):
+        import cirq
+
+        return cirq.Circuit(self.iter_cirq_operations())
+
+    def save(self, path):
+        header = {
+            "format_version": FORMAT_VERSION,
+            "gate_names": list(GATE_NAMES),
+            "n_qubits": self.n_qubits,
+            "qubit_names": self.qubit_names,
+            "measurement_keys": self.measurement_keys,
+            "step_offsets": None
+            if self.step_offsets is None
+            else [int(offset) for offset in self.step_offsets],
+            "arrays": {},
+        }
+        arrays = {
+            "opcodes": np.ascontiguousarray(self.opcodes, dtype=np.uint8),
+            "qubits": np.ascontiguousarray(self.qubits, dtype="<i4"),
+            "params": np.ascontiguousarray(
+                self.params, dtype="<c16" if np.iscomplexobj(self.params) else "<f8"
+            ),
+        }
+        # The offsets depend on the header length, which depends on the
+        # offsets, so the header is sized with placeholder offsets at least as
+        # long as the real ones and padded with spaces.
+        for name, array in arrays.items():
+            header["arrays"][name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": 10**18,
+            }
+        header_size = _aligned(len(FILE_MAGIC) + 8 + len(json.dumps(header)))
+        offset = header_size
+        for name, array in arrays.items():
+            header["arrays"][name]["offset"] = offset
+            offset = _aligned(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode()
+        header_bytes += b" " * (header_size - len(FILE_MAGIC) - 8 - len(header_bytes))
+
+        with open(path, "wb") as f:
+            f.write(FILE_MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(max(offset, header_size))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Reads a circuit saved with `save`.
+
+        With `mmap=True` the arrays are memory-mapped, so only the operations
+        which are actually accessed (e.g. through `steps`) are read from disk.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f"{path} is not a columnar circuit file.")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+        if header["format_version"] > FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has format version {header['format_version']}, "
+                f"only versions up to {FORMAT_VERSION} are supported."
+            )
+        arrays = {}
+        for name in _ARRAYS:
+            description = header["arrays"][name]
+            shape = tuple(description["shape"])
+            if not mmap or 0 in shape:
+                with open(path, "rb") as f:
+                    f.seek(description["offset"])
+                    arrays[name] = np.fromfile(
+                        f, dtype=description["dtype"], count=int(np.prod(shape))
+                    ).reshape(shape)
+            else:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=description["dtype"],
+                    mode="r",
+                    offset=description["offset"],
+                    shape=shape,
+                )
+        opcodes = arrays["opcodes"]
+        if header["gate_names"] != list(GATE_NAMES):
+            # Written with a different gate table, translate to the current one
+            translation = np.array(
+                [OPCODES[gate_name] for gate_name in header["gate_names"]],
+                dtype=np.uint8,
+            )
+            opcodes = translation[opcodes]
+        return cls(
+            opcodes,
+            arrays["qubits"],
+            arrays["params"],
+            header["n_qubits"],
+            header["step_offsets"],
+            header["qubit_names"],
+            header["measurement_keys"],
+        )
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def encode_orquestra_gate(gate):
+    """(gate name, params) of an orquestra gate, raising ValueError if unsupported."""
+    # Daggers and controlled gates are recognized by their attributes, so that
+    # gates of zquantum (the former name of orquestra) are encoded too
+    wrapped_gate = getattr(gate, "wrapped_gate", None)
+    n_controls = getattr(gate, "num_control_qubits", None)
+    if wrapped_gate is not None and n_controls is None:
+        if wrapped_gate.name in ("S", "T"):
+            return wrapped_gate.name + "_DAG", ()
+    elif wrapped_gate is not None:
+        if wrapped_gate.name == "RZ" and n_controls == 1:
+            return "CRZ", (_encoded_param(wrapped_gate.params[0]),)
+        if wrapped_gate.name == "X" and n_controls == 2:
+            return "TOFFOLI", ()
+    elif gate.name in OPCODES and gate.name not in ("MEASURE", "RESET"):
+        return gate.name, tuple(_encoded_param(param) for param in gate.params)
+    raise ValueError(f"Gate {gate.name} is not supported.")
+
+
+def _encoded_param(param):
+    # Complex angles (from Hamiltonians with complex coefficients) stay complex
+    param = complex(param)
+    return param if param.imag else param.real
+
+
+def _orquestra_operations(circuit):
+    encoded_gates = {}
+    for operation in circuit.operations:
+        encoded_gate = encoded_gates.get(operation.gate)
+        if encoded_gate is None:
+            encoded_gate = encoded_gates[operation.gate] = encode_orquestra_gate(
+                operation.gate
+            )
+        yield encoded_gate[0], operation.qubit_indices, encoded_gate[1]
+
+
+def _orquestra_gates():
+    from orquestra.quantum.circuits import (
+        CNOT,
+        CZ,
+        RX,
+        RY,
+        RZ,
+        SWAP,
+        H,
+        I,
+        S,
+        T,
+        X,
+        Y,
+        Z,
+    )
+
+    return {
+        "I": I,
+        "X": X,
+        "Y": Y,
+        "Z": Z,
+        "H": H,
+        "S": S,
+        "S_DAG": S.dagger,
+        "T": T,
+        "T_DAG": T.dagger,
+        "RX": RX,
+        "RY": RY,
+        "RZ": RZ,
+        "CNOT": CNOT,
+        "CZ": CZ,
+        "SWAP": SWAP,
+        "CRZ": lambda angle: RZ(angle).controlled(1),
+        "TOFFOLI": X.controlled(2),
+    }
+
+
+def _cirq_gates():
+    import cirq
+
+    return {
+        "I": cirq.I,
+        "X": cirq.X,
+        "Y": cirq.Y,
+        "Z": cirq.Z,
+        "H": cirq.H,
+        "S": cirq.S,
+        "S_DAG": cirq.S**-1,
+        "T": cirq.T,
+        "T_DAG": cirq.T**-1,
+        "RX": cirq.rx,
+        "RY": cirq.ry,
+        "RZ": cirq.rz,
+        "XPOW": lambda exponent: cirq.XPowGate(exponent=exponent),
+        "YPOW": lambda exponent: cirq.YPowGate(exponent=exponent),
+        "ZPOW": lambda exponent: cirq.ZPowGate(exponent=exponent),
+        "CNOT": cirq.CNOT,
+        "CZ": cirq.CZ,
+        "SWAP": cirq.SWAP,
+        "CRZ": lambda angle: cirq.rz(angle).controlled(1),
+        "TOFFOLI": cirq.TOFFOLI,
+        "RESET": cirq.ResetChannel(),
+    }
+
+
+def _cirq_qubit_indices(qubits):
+    import cirq
+
+    if all(isinstance(qubit, cirq.LineQubit) for qubit in qubits):
+        return {qubit: qubit.x for qubit in qubits}, None
+    if all(isinstance(qubit, cirq.NamedQubit) for qubit in qubits):
+        return (
+            {qubit: index for index, qubit in enumerate(qubits)},
+            [qubit.name for qubit in qubits],
+        )
+    raise ValueError("Only circuits on LineQubits or on NamedQubits are supported.")
+
+
+def encode_cirq_gate(gate):
+    """(gate name, params) of a cirq gate, raising ValueError if unsupported."""
+    import cirq
+
+    fixed_gates = {
+        gate: gate_name
+        for gate_name, gate in _cirq_gates().items()
+        if isinstance(gate, cirq.Gate)
+    }
+    if gate in fixed_gates:
+        return fixed_gates[gate], ()
+    for rotation, gate_name in ((cirq.Rx, "RX"), (cirq.Ry, "RY"), (cirq.Rz, "RZ")):
+        if isinstance(gate, rotation):
+            return gate_name, (float(gate.exponent * np.pi),)
+    for power_gate, gate_name in (
+        (cirq.XPowGate, "XPOW"),
+        (cirq.YPowGate, "YPOW"),
+        (cirq.ZPowGate, "ZPOW"),
+    ):
+        if type(gate) == power_gate and gate.global_shift == 0:
+            return gate_name, (float(gate.exponent),)
+    if (
+        isinstance(gate, cirq.ControlledGate)
+        and gate.num_controls() == 1
+        and isinstance(gate.sub_gate, cirq.Rz)
+    ):
+        return "CRZ", (float(gate.sub_gate.exponent * np.pi),)
+    raise ValueError(f"Gate {gate} is not supported.")
+
+
+def _cirq_operations(operations, qubit_indices, measurement_keys):
+    import cirq
+
+    encoded_gates = {}
+    for operation in operations:
+        gate = operation.gate
+        qubits = tuple(qubit_indices[qubit] for qubit in operation.qubits)
+        if isinstance(gate, cirq.MeasurementGate):
+            if len(qubits) != 1:
+                raise ValueError("Only single qubit measurements are supported.")
+            key = cirq.measurement_key_name(operation)
+            key_index = measurement_keys.setdefault(key, len(measurement_keys))
+            yield "MEASURE", qubits, (float(key_index),)
+            continue
+        encoded_gate = encoded_gates.get(gate)
+        if encoded_gate is None:
+            encoded_gate = encoded_gates[gate] = encode_cirq_gate(gate)
+        yield encoded_gate[0], qubits, encoded_gate[1]
+
+
+def _concatenated_parts(parts, **kwargs):
+    # The (ColumnarCircuit, repetitions) pairs as a single ColumnarCircuit
+    circuits = [
+        part if repetitions == 1 else part.repeat(repetitions)
+        for part, repetitions in parts
+    ]
+    if len(circuits) == 1:
+        return circuits[0]
+    if not circuits:
+        return ColumnarCircuit.from_operations([], **kwargs)
+    return ColumnarCircuit.concatenate(circuits)
+
+
+def _cirq_parts(operations, qubit_indices, measurement_keys, **kwargs):
+    # (ColumnarCircuit, repetitions) pairs of cirq operations: the runs of
+    # operations, and the subcircuit of each CircuitOperation (its inverse for
+    # negative repetitions, on the qubits it is mapped to) converted once
+    import cirq
+
+    parts = []
+    run = []
+
+    def end_run():
+        if run:
+            part = ColumnarCircuit.from_operations(
+                _cirq_operations(run, qubit_indices, measurement_keys), **kwargs
+            )
+            parts.append((part, 1))
+            run.clear()
+
+    for operation in operations:
+        if not isinstance(operation.untagged, cirq.CircuitOperation):
+            run.append(operation)
+            continue
+        end_run()
+        circuit_operation = operation.untagged
+        single = circuit_operation.replace(
+            repetitions=1 if circuit_operation.repetitions > 0 else -1,
+            repetition_ids=None,
+        )
+        sub_parts = _cirq_parts(
+            single.mapped_circuit(deep=False).all_operations(),
+            qubit_indices,
+            measurement_keys,
+            **kwargs,
+        )
+        if sub_parts and circuit_operation.repetitions:
+            block = _concatenated_parts(sub_parts, **kwargs)
+            parts.append((block, abs(circuit_operation.repetitions)))
+    end_run()
+    return parts
+
+
+def _cirq_columnar_parts(circuit):
+    # Parts sharing their qubit indices, qubit names and measurement keys
+    qubit_indices, qubit_names = _cirq_qubit_indices(sorted(circuit.all_qubits()))
+    n_qubits = 1 + max(qubit_indices.values(), default=-1)
+    measurement_keys = {}
+    parts = _cirq_parts(
+        circuit.all_operations(),
+        qubit_indices,
+        measurement_keys,
+        n_qubits=n_qubits,
+        qubit_names=qubit_names,
+    )
+    for part, _ in parts:
+        part.measurement_keys = list(measurement_keys)
+    return parts
+
+
+def columnar_parts(circuit):
+    """(ColumnarCircuit, repetitions) pairs making up `circuit`, in order.
+
+    `circuit` is a ColumnarCircuit, a RepeatedCircuit (whose prefix, block and
+    suffix are converted once each), an orquestra Circuit or a cirq Circuit
+    (whose CircuitOperations are converted once each, and the operations
+    between them as parts of their own).
+    """
+    # Checked by attributes, since ColumnarCircuit is a different class when
+    # this module is run with python -m
+    if hasattr(circuit, "opcodes"):
+        return [(circuit, 1)]
+    if hasattr(circuit, "repetitions"):
+        parts = [
+            (circuit.prefix, 1),
+            (circuit.block, circuit.repetitions),
+            (circuit.suffix, 1),
+        ]
+        return [
+            (ColumnarCircuit.from_orquestra(part), repetitions)
+            for part, repetitions in parts
+            if part.operations and repetitions
+        ]
+    if hasattr(circuit, "all_operations"):
+        return _cirq_columnar_parts(circuit)
+    return [(ColumnarCircuit.from_orquestra(circuit), 1)]
+
+
+def load_circuit_artifact(path):
+    """Reads a columnar, cirq JSON (optionally .gz/.zip) or QASM circuit file."""
+    from .cirq_json import CirqJsonReader, open_circuit_file
+    from .qasm import QasmReader
+
+    if path.endswith(COLUMNAR_EXTENSION):
+        return ColumnarCircuit.load(path)
+    with open_circuit_file(path) as f:
+        if path.endswith((".qasm", ".txt")):
+            reader = QasmReader(f)
+            circuit = ColumnarCircuit.from_operations(reader)
+            circuit.n_qubits = reader.n_qubits
+            circuit.measurement_keys = [str(clbit) for clbit in range(reader.n_clbits)]
+            return circuit
+        # Read moment by moment, without building the cirq circuit. NamedQubits
+        # are numbered in the order they appear.
+        reader = CirqJsonReader(f)
+        circuit = ColumnarCircuit.from_operations(reader)
+        circuit.n_qubits = reader.n_qubits
+        circuit.qubit_names = reader.qubit_names
+        circuit.measurement_keys = reader.measurement_keys
+        if reader.step_offsets is not None:
+            circuit.step_offsets = np.asarray(reader.step_offsets)
+        return circuit
+
+
+def _repeated_step(circuit):
+    # The first Trotter step, if every step repeats it, otherwise None
+    if circuit.n_steps < 2:
+        return None
+    length = int(circuit.step_offsets[1])
+    if length == 0 or not np.array_equal(
+        circuit.step_offsets, np.arange(circuit.n_steps + 1) * length
+    ):
+        return None
+    for name in _ARRAYS:
+        values = np.asarray(getattr(circuit, name))
+        steps = values.reshape((circuit.n_steps, length) + values.shape[1:])
+        first_steps = np.broadcast_to(values[:length], steps.shape)
+        if not np.array_equal(steps, first_steps, equal_nan=True):
+            return None
+    return circuit.steps(0)
+
+
+def save_circuit_artifact(circuit, path):
+    """Writes a ColumnarCircuit in the format given by the extension of `path`.
+
+    A circuit whose Trotter steps all repeat the first one is written to cirq
+    JSON as that step in a repeated CircuitOperation, which
+    load_circuit_artifact reads back with its steps.
+    """
+    import cirq
+
+    from .cirq_json import iter_moments, open_circuit_file, write_cirq_json
+    from .qasm import write_qasm_circuit
+
+    if path.endswith(COLUMNAR_EXTENSION):
+        circuit.save(path)
+    elif path.endswith((".qasm", ".txt")):
+        write_qasm_circuit(circuit, path)
+    else:
+        step = _repeated_step(circuit)
+        if step is None:
+            moments = iter_moments(circuit.iter_cirq_operations(), circuit.cirq_qubits())
+        else:
+            subcircuit = cirq.FrozenCircuit(step.iter_cirq_operations())
+            repeated_step = cirq.CircuitOperation(subcircuit).repeat(circuit.n_steps)
+            moments = [cirq.Moment([repeated_step])]
+        with open_circuit_file(path, "w") as f:
+            write_cirq_json(moments, f)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert circuits between columnar, cirq JSON and QASM files."
+    )
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    args = parser.parse_args()
+    save_circuit_artifact(load_circuit_artifact(args.input_path), args.output_path)
+
+
+if __name__ == "__main__":
+    main()
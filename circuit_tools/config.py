@@ -0,0 +1,13 @@
+import os
+
+CACHE_DIR_ENV_VARIABLE = "DARPA_CIRCUITS_CACHE_DIR"
+
+
+def default_cache_dir():
+    # All persistent caches live in one place so that they are shared between
+    # runs of different generating scripts and parameter sweeps.
+    cache_dir = os.environ.get(CACHE_DIR_ENV_VARIABLE)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "darpa-circuits")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -0,0 +1,246 @@
+"""Jordan-Wigner transformed Fermi-Hubbard Hamiltonians built from the lattice.
+
+`of.jordan_wigner(of.fermi_hubbard(...))` multiplies out symbolic operators
+whose Jordan-Wigner strings run over the whole lattice, which takes minutes
+beyond 10x10 lattices. The terms of the model only come in a few shapes
+(hopping, number and interaction terms), so each shape and coefficient is
+transformed once, by openfermion, on a template of four qubits: qubit 1 and 3
+stand for the lower and higher mode of the term, qubit 2 for the Z string
+between them and qubit 0 for the modes below. The resulting Pauli terms are
+accumulated under compact keys with the same arithmetic and in the same order
+as openfermion, so the terms, their order and their coefficients are exactly
+those of the openfermion path, and the Z strings are only filled in at the end,
+as arrays of a PauliTable.
+"""
+import numpy as np
+import openfermion as of
+
+from .pauli import EQ_TOLERANCE, PauliTable
+
+# Template qubits of the lower and higher mode, and of the Z string between
+_LOWER_QUBIT = 1
+_STRING_QUBIT = 2
+_HIGHER_QUBIT = 3
+_PAULI_CODES = {"X": 1, "Y": 2, "Z": 3}
+
+
+def _right_neighbor(site, x_dimension, y_dimension, periodic):
+    if x_dimension == 1:
+        return None
+    if (site + 1) % x_dimension == 0:
+        return site + 1 - x_dimension if periodic else None
+    return site + 1
+
+
+def _bottom_neighbor(site, x_dimension, y_dimension, periodic):
+    if y_dimension == 1:
+        return None
+    if site + x_dimension + 1 > x_dimension * y_dimension:
+        return site + x_dimension - x_dimension * y_dimension if periodic else None
+    return site + x_dimension
+
+
+def _add_term(terms, term, coefficient):
+    # SymbolicOperator.__iadd__ for a single term: terms which become small are
+    # removed, and are added at the end if they come back
+    coefficient = terms.get(term, 0) + coefficient
+    if abs(coefficient) < EQ_TOLERANCE:
+        terms.pop(term, None)
+    else:
+        terms[term] = coefficient
+
+
+def _add_hopping_terms(terms, i, j, coefficient):
+    _add_term(terms, ((i, 1), (j, 0)), coefficient)
+    _add_term(terms, ((j, 1), (i, 0)), coefficient.conjugate())
+
+
+def _add_interaction_terms(terms, i, j, coefficient, particle_hole_symmetry):
+    # The product coefficient * n_i * n_j (shifted by 1/2 each with particle
+    # hole symmetry) as openfermion multiplies it out
+    if particle_hole_symmetry:
+        left = [(((i, 1), (i, 0)), 1.0 * coefficient), ((), -0.5 * coefficient)]
+        right = [(((j, 1), (j, 0)), 1.0), ((), -0.5)]
+    else:
+        left = [(((i, 1), (i, 0)), 1.0 * coefficient)]
+        right = [(((j, 1), (j, 0)), 1.0)]
+    for left_term, left_coefficient in left:
+        for right_term, right_coefficient in right:
+            coefficient_product = left_coefficient * right_coefficient
+            _add_term(terms, left_term + right_term, coefficient_product)
+
+
+def fermi_hubbard_fermion_terms(
+    x_dimension,
+    y_dimension,
+    tunneling,
+    coulomb,
+    chemical_potential=0.0,
+    magnetic_field=0.0,
+    periodic=True,
+    spinless=False,
+    particle_hole_symmetry=False,
+):
+    """The terms of `of.fermi_hubbard` with the same arguments, as a dict.
+
+    Keys and coefficients are the same as in the `terms` of the FermionOperator,
+    in the same order.
+    """
+    n_sites = x_dimension * y_dimension
+    terms = {}
+    for site in range(n_sites):
+        right_neighbor = _right_neighbor(site, x_dimension, y_dimension, periodic)
+        bottom_neighbor = _bottom_neighbor(site, x_dimension, y_dimension, periodic)
+        # Avoid double-counting edges when one of the dimensions is 2 and the
+        # system is periodic
+        if x_dimension == 2 and periodic and site % 2 == 1:
+            right_neighbor = None
+        if y_dimension == 2 and periodic and site >= x_dimension:
+            bottom_neighbor = None
+
+        if spinless:
+            for neighbor in [right_neighbor, bottom_neighbor]:
+                if neighbor is not None:
+                    _add_hopping_terms(terms, site, neighbor, -tunneling)
+                    _add_interaction_terms(
+                        terms, site, neighbor, coulomb, particle_hole_symmetry
+                    )
+            _add_term(terms, ((site, 1), (site, 0)), -chemical_potential)
+        else:
+            up, down = 2 * site, 2 * site + 1
+            for neighbor in [right_neighbor, bottom_neighbor]:
+                if neighbor is not None:
+                    _add_hopping_terms(terms, up, 2 * neighbor, -tunneling)
+                    _add_hopping_terms(terms, down, 2 * neighbor + 1, -tunneling)
+            _add_interaction_terms(terms, up, down, coulomb, particle_hole_symmetry)
+            _add_term(
+                terms, ((up, 1), (up, 0)), -chemical_potential - magnetic_field
+            )
+            _add_term(
+                terms, ((down, 1), (down, 0)), -chemical_potential + magnetic_field
+            )
+    return terms
+
+
+def _template_ladder_operator(ladder_operator):
+    # The Jordan-Wigner transform of a ladder operator, as openfermion does it
+    mode, action = ladder_operator
+    z_factors = tuple((index, "Z") for index in range(mode))
+    x_component = of.QubitOperator(z_factors + ((mode, "X"),), 0.5)
+    y_component = of.QubitOperator(
+        z_factors + ((mode, "Y"),), -0.5j if action else 0.5j
+    )
+    return x_component + y_component
+
+
+class _TemplateTransform:
+    """Jordan-Wigner transforms of fermionic terms, computed once per shape."""
+
+    def __init__(self):
+        self._ladder_operators = {}
+        self._transforms = {}
+
+    def transform(self, template_term, coefficient):
+        """Pauli terms of the transformed term, with their coefficients.
+
+        Terms are given on the template qubits, in the order of openfermion.
+        """
+        key = (template_term, coefficient)
+        transform = self._transforms.get(key)
+        if transform is None:
+            transformed_term = of.QubitOperator((), coefficient)
+            for ladder_operator in template_term:
+                if ladder_operator not in self._ladder_operators:
+                    self._ladder_operators[ladder_operator] = (
+                        _template_ladder_operator(ladder_operator)
+                    )
+                transformed_term *= self._ladder_operators[ladder_operator]
+            transform = self._transforms[key] = list(transformed_term.terms.items())
+        return transform
+
+
+def fermi_hubbard_pauli_table(
+    x_dimension,
+    y_dimension,
+    tunneling,
+    coulomb,
+    chemical_potential=0.0,
+    magnetic_field=0.0,
+    periodic=True,
+    spinless=False,
+    particle_hole_symmetry=False,
+):
+    """PauliTable of `of.jordan_wigner(of.fermi_hubbard(...))`, same arguments.
+
+    Equal to PauliTable.from_qubit_operator of the openfermion result: the same
+    terms in the same order, with the same coefficients.
+    """
+    transforms = _TemplateTransform()
+    # Keys are (factors on the modes of the term, whether there is a Z string
+    # between them), where the factors are (mode, letter) pairs
+    pauli_terms = {}
+    fermion_terms = fermi_hubbard_fermion_terms(
+        x_dimension,
+        y_dimension,
+        tunneling,
+        coulomb,
+        chemical_potential,
+        magnetic_field,
+        periodic,
+        spinless,
+        particle_hole_symmetry,
+    )
+    for term, coefficient in fermion_terms.items():
+        modes = sorted({mode for mode, _ in term})
+        template_qubits = dict(zip(modes, [_LOWER_QUBIT, _HIGHER_QUBIT]))
+        modes_of_qubits = {qubit: mode for mode, qubit in template_qubits.items()}
+        # Adjacent modes have no Z string between them
+        has_string = len(modes) == 2 and modes[1] - modes[0] > 1
+        template_term = tuple((template_qubits[mode], action) for mode, action in term)
+        for template_pauli_term, pauli_coefficient in transforms.transform(
+            template_term, coefficient
+        ):
+            factors = tuple(
+                (modes_of_qubits[qubit], letter)
+                for qubit, letter in template_pauli_term
+                if qubit != _STRING_QUBIT
+            )
+            string = has_string and any(
+                qubit == _STRING_QUBIT for qubit, _ in template_pauli_term
+            )
+            _add_term(pauli_terms, (factors, string), pauli_coefficient)
+    return _pauli_table(pauli_terms)
+
+
+def _pauli_table(pauli_terms):
+    rows, qubits, codes = [], [], []
+    string_rows, string_starts, string_stops = [], [], []
+    for row, (factors, string) in enumerate(pauli_terms):
+        for qubit, letter in factors:
+            rows.append(row)
+            qubits.append(qubit)
+            codes.append(_PAULI_CODES[letter])
+        if string:
+            string_rows.append(row)
+            string_starts.append(factors[0][0] + 1)
+            string_stops.append(factors[-1][0])
+    n_qubits = 1 + max(qubits, default=-1)
+    # The Z strings are ranges of columns, marked at their ends and summed
+    string_marks = np.zeros((len(pauli_terms), n_qubits + 1), dtype=np.int8)
+    string_marks[string_rows, string_starts] += 1
+    string_marks[string_rows, string_stops] -= 1
+    term_codes = np.where(
+        np.cumsum(string_marks[:, :n_qubits], axis=1, dtype=np.int8) > 0, 3, 0
+    ).astype(np.int8)
+    term_codes[rows, qubits] = codes
+    coefficients = list(pauli_terms.values())
+    real = [
+        isinstance(coefficient, (float, int, np.floating, np.integer))
+        for coefficient in coefficients
+    ]
+    return PauliTable.from_codes(term_codes, coefficients, real)
+
+
+def fermi_hubbard_jw_operator(*args, **kwargs):
+    """QubitOperator of `of.jordan_wigner(of.fermi_hubbard(...))`, same arguments."""
+    return fermi_hubbard_pauli_table(*args, **kwargs).to_qubit_operator()
@@ -0,0 +1,400 @@
+"""Running gridsynth and caching its results between runs."""
+import os
+import re
+import sqlite3
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+
+from . import instrumentation
+from .config import default_cache_dir
+from .synthesis import NativeSynthesisPool, exact_rz_sequence
+
+GRIDSYNTH_PATH = "./gridsynth"
+# Built from gridsynth_server.hs, see the instructions there
+GRIDSYNTH_SERVER_PATH = "./gridsynth_server"
+DEFAULT_CACHE_FILE_NAME = "gridsynth_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+def canonical_angle(angle):
+    # gridsynth gets the angle as str(angle), which for floats is the shortest
+    # repr that round-trips, so repr is also what we key the cache on.
+    if isinstance(angle, complex):
+        # Complex angles come from Hamiltonians with non-real coefficients,
+        # which aren't Hermitian, so there is no rotation to synthesize
+        if angle.imag != 0:
+            raise ValueError(
+                f"Can't synthesize RZ({angle}), the angle must be real. Are all "
+                "the coefficients of the Hamiltonian real?"
+            )
+        angle = angle.real
+    angle = float(angle)
+    if angle == 0.0:
+        # Avoid separate entries for 0.0 and -0.0
+        angle = 0.0
+    return repr(angle)
+
+
+def gate_sequence_from_gridsynth_output(gate_sequence_str):
+    # Remove phase gates from gate sequence
+    phase_free_gate_sequence_str = re.sub("W", "", gate_sequence_str.strip())
+
+    # Reverse gate order (note from gridsynth docs: "Operators are shown in matrix
+    # order, not circuit order. This means they are meant to be applied from
+    # right to left."
+    return phase_free_gate_sequence_str[::-1]
+
+
+def run_gridsynth(angle, synthesis_accuracy, gridsynth_path=GRIDSYNTH_PATH):
+    """Synthesize RZ(angle) with gridsynth.
+
+    Returns the gate sequence in circuit order, with global phase gates removed.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [gridsynth_path, str(angle), "-e", str(synthesis_accuracy)],
+        capture_output=True,
+        text=True,
+    )
+    instrumentation.count("gridsynth.calls")
+    instrumentation.record_latency("gridsynth", time.perf_counter() - start)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"gridsynth failed for angle {angle} with error: {result.stderr}"
+        )
+    return gate_sequence_from_gridsynth_output(result.stdout)
+
+
+class GridsynthCache:
+    """Persistent cache of gridsynth results keyed by (angle, synthesis accuracy).
+
+    Results are stored in an SQLite file as gate sequences in circuit order, so
+    they can be reused across runs and parameter sweeps. When the cache grows
+    beyond `max_entries`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), DEFAULT_CACHE_FILE_NAME)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._used_keys = set()
+        self._pending = {}
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS gridsynth ("
+            "angle TEXT NOT NULL, "
+            "accuracy TEXT NOT NULL, "
+            "gate_sequence TEXT NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (angle, accuracy))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS gridsynth_last_used ON gridsynth (last_used)"
+        )
+        self._connection.commit()
+
+    def _key(self, angle, synthesis_accuracy):
+        return canonical_angle(angle), repr(float(synthesis_accuracy))
+
+    def get(self, angle, synthesis_accuracy):
+        key = self._key(angle, synthesis_accuracy)
+        gate_sequence = self._memory.get(key)
+        if gate_sequence is None:
+            row = self._connection.execute(
+                "SELECT gate_sequence FROM gridsynth WHERE angle = ? AND accuracy = ?",
+                key,
+            ).fetchone()
+            if row is not None:
+                gate_sequence = row[0]
+                self._memory[key] = gate_sequence
+        if gate_sequence is None:
+            self.misses += 1
+            instrumentation.count("gridsynth_cache.misses")
+        else:
+            self.hits += 1
+            instrumentation.count("gridsynth_cache.hits")
+            self._used_keys.add(key)
+        return gate_sequence
+
+    def put(self, angle, synthesis_accuracy, gate_sequence):
+        key = self._key(angle, synthesis_accuracy)
+        self._memory[key] = gate_sequence
+        self._pending[key] = gate_sequence
+
+    def flush(self):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO gridsynth VALUES (?, ?, ?, ?)",
+                [
+                    (angle, accuracy, gate_sequence, now)
+                    for (angle, accuracy), gate_sequence in self._pending.items()
+                ],
+            )
+            self._connection.executemany(
+                "UPDATE gridsynth SET last_used = ? WHERE angle = ? AND accuracy = ?",
+                [(now, angle, accuracy) for angle, accuracy in self._used_keys],
+            )
+            self._evict()
+        self._pending = {}
+        self._used_keys = set()
+
+    def _evict(self):
+        n_entries = len(self)
+        if n_entries > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM gridsynth WHERE rowid IN "
+                "(SELECT rowid FROM gridsynth ORDER BY last_used LIMIT ?)",
+                (n_entries - self.max_entries,),
+            )
+            self._memory = {}
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM gridsynth").fetchone()[0]
+
+    def stats(self):
+        return combine_cache_stats([{"hits": self.hits, "misses": self.misses}])
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def synthesize_rz(angle, synthesis_accuracy, cache=None, gridsynth_path=GRIDSYNTH_PATH):
+    """Gate sequence for RZ(angle), calling gridsynth only on cache misses.
+
+    Multiples of pi / 4 are looked up in a table of exact sequences instead.
+    """
+    gate_sequence = exact_rz_sequence(angle)
+    if gate_sequence is not None:
+        return gate_sequence
+    if cache is not None:
+        gate_sequence = cache.get(angle, synthesis_accuracy)
+        if gate_sequence is not None:
+            return gate_sequence
+    gate_sequence = run_gridsynth(angle, synthesis_accuracy, gridsynth_path)
+    if cache is not None:
+        cache.put(angle, synthesis_accuracy, gate_sequence)
+    return gate_sequence
+
+
+class GridsynthWorker:
+    """A long-lived gridsynth process which synthesizes batches of angles.
+
+    Requests are written to the stdin of gridsynth_server one per line, and the
+    gate sequences are read back from its stdout, so the cost of starting
+    gridsynth is paid once per worker instead of once per rotation.
+    """
+
+    def __init__(self, server_path=GRIDSYNTH_SERVER_PATH, batch_size=256):
+        # Batches are small enough for the requests to fit into the pipe buffer,
+        # so writing a batch never blocks while the worker waits for us to read.
+        self.batch_size = batch_size
+        self._process = subprocess.Popen(
+            [server_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+
+    def synthesize(self, angles, synthesis_accuracy):
+        """Yields (angle, gate sequence in circuit order) for each of `angles`."""
+        angles = list(angles)
+        for start in range(0, len(angles), self.batch_size):
+            batch = angles[start : start + self.batch_size]
+            self._process.stdin.write(
+                "".join(f"{angle} {synthesis_accuracy}\n" for angle in batch)
+            )
+            self._process.stdin.flush()
+            last_time = time.perf_counter()
+            for angle in batch:
+                line = self._process.stdout.readline()
+                if not line or line.startswith("error"):
+                    raise RuntimeError(
+                        f"gridsynth worker failed for angle {angle}: {line.strip()}"
+                    )
+                # The worker answers in order, so the latency of an angle is
+                # the time since the previous answer
+                end = time.perf_counter()
+                instrumentation.count("gridsynth.calls")
+                instrumentation.record_latency("gridsynth", end - last_time)
+                last_time = end
+                yield angle, gate_sequence_from_gridsynth_output(line)
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+
+class GridsynthWorkerPool:
+    """A pool of GridsynthWorkers, one per core by default.
+
+    If the gridsynth_server binary is not available, the pool falls back to
+    running the gridsynth binary once per angle on the same number of threads,
+    and if neither binary is available (or `native` is true), to synthesizing
+    the angles in-process with a NativeSynthesisPool.
+    """
+
+    def __init__(
+        self,
+        n_workers=None,
+        server_path=GRIDSYNTH_SERVER_PATH,
+        gridsynth_path=GRIDSYNTH_PATH,
+        native=None,
+    ):
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        self.n_workers = n_workers
+        self.gridsynth_path = gridsynth_path
+        self.workers = []
+        self.native_pool = None
+        if not native and server_path is not None and os.path.exists(server_path):
+            self.workers = [GridsynthWorker(server_path) for _ in range(n_workers)]
+        if native is None:
+            native = not self.workers and not os.path.exists(gridsynth_path)
+        if native:
+            self.native_pool = NativeSynthesisPool(n_workers)
+
+    def synthesize(self, angles, synthesis_accuracy):
+        """List of (angle, gate sequence in circuit order) for each of `angles`."""
+        angles = list(angles)
+        if not angles:
+            return []
+        if self.native_pool is not None:
+            # The angles are synthesized in other processes, so only their mean
+            # latency is known here
+            start = time.perf_counter()
+            results = self.native_pool.synthesize(angles, synthesis_accuracy)
+            n_processes = min(self.native_pool.n_workers, len(angles))
+            latency = (time.perf_counter() - start) * n_processes / len(angles)
+            instrumentation.count("native_synthesis.calls", len(angles))
+            instrumentation.record_latency("native_synthesis", latency, len(angles))
+            return results
+        n_threads = min(self.n_workers, len(angles))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            if not self.workers:
+                return list(
+                    executor.map(
+                        lambda angle: (
+                            angle,
+                            run_gridsynth(
+                                angle, synthesis_accuracy, self.gridsynth_path
+                            ),
+                        ),
+                        angles,
+                    )
+                )
+            # Each worker gets an interleaved share of the angles and is driven
+            # by its own thread.
+            results = executor.map(
+                lambda worker_id: list(
+                    self.workers[worker_id].synthesize(
+                        angles[worker_id::n_threads], synthesis_accuracy
+                    )
+                ),
+                range(n_threads),
+            )
+            return list(chain.from_iterable(results))
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        if self.native_pool is not None:
+            self.native_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def synthesize_angles(
+    angles,
+    synthesis_accuracy,
+    cache=None,
+    max_workers=None,
+    gridsynth_path=GRIDSYNTH_PATH,
+    workers=None,
+):
+    """Gate sequences for a collection of RZ angles, keyed by canonical angle.
+
+    Multiples of pi / 4 get exact sequences from a table (see
+    synthesis.exact_rz_sequence). Every other distinct angle is synthesized
+    only once, and the angles missing from the cache are synthesized
+    concurrently: by `workers` (a GridsynthWorkerPool) if given, otherwise by
+    one-off gridsynth calls on `max_workers` threads (by default one per core).
+    Threads are enough here, since the work happens in the gridsynth
+    subprocesses. Without the gridsynth binary, the angles are
+    synthesized in-process instead (see circuit_tools.synthesis).
+    """
+    gate_sequences = {}
+    missing_angles = {}
+    for angle in angles:
+        key = canonical_angle(angle)
+        if key in gate_sequences or key in missing_angles:
+            continue
+        angle = float(key)
+        # Multiples of pi / 4 have exact sequences, which need neither the
+        # cache nor gridsynth
+        gate_sequence = exact_rz_sequence(angle)
+        if gate_sequence is None and cache is not None:
+            gate_sequence = cache.get(angle, synthesis_accuracy)
+        if gate_sequence is None:
+            missing_angles[key] = angle
+        else:
+            gate_sequences[key] = gate_sequence
+
+    if missing_angles:
+        if workers is None:
+            with GridsynthWorkerPool(
+                max_workers, server_path=None, gridsynth_path=gridsynth_path
+            ) as pool:
+                results = pool.synthesize(missing_angles.values(), synthesis_accuracy)
+        else:
+            results = workers.synthesize(missing_angles.values(), synthesis_accuracy)
+        for angle, gate_sequence in results:
+            gate_sequences[canonical_angle(angle)] = gate_sequence
+            if cache is not None:
+                cache.put(angle, synthesis_accuracy, gate_sequence)
+
+    return gate_sequences
+
+
+def combine_cache_stats(stats):
+    """Hits, misses and hit rate of the GridsynthCache.stats() in `stats`.
+
+    The caches opened in each worker process of a sweep keep their own
+    counts, which `Sweep.run` collects in `resource_stats["cache"]`.
+    """
+    hits = sum(entry["hits"] for entry in stats)
+    misses = sum(entry["misses"] for entry in stats)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else 0.0,
+    }
+
+
+def gridsynth_resources(n_workers=None):
+    """GridsynthCache and GridsynthWorkerPool factories, as `Sweep.run` resources.
+
+    Stages which take `cache` and `workers` arguments, like
+    transpile_clifford_t, get a cache and a pool of `n_workers` workers.
+    """
+    return {"cache": GridsynthCache, "workers": partial(GridsynthWorkerPool, n_workers)}
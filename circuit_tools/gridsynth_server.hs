@@ -0,0 +1,36 @@
+-- Long-lived gridsynth worker used by circuit_tools.gridsynth.GridsynthWorker.
+--
+-- Reads one request per line from stdin, in the form "<angle> <epsilon>", and
+-- writes the gate sequence for each request on its own line of stdout. Gate
+-- sequences are printed in matrix order, exactly as the gridsynth binary does,
+-- so that the same parsing (W removal and reversal) applies to both.
+--
+-- Build it next to the gridsynth binary with:
+--   cabal install --lib newsynth random
+--   ghc -O2 gridsynth_server.hs -o gridsynth_server
+
+import System.IO
+import System.Random (newStdGen)
+
+import Quantum.Synthesis.GridSynth (gridsynth_gates)
+import Quantum.Synthesis.SymReal (parse_SymReal)
+
+-- Same default effort as the gridsynth command line tool.
+effort :: Int
+effort = 25
+
+main :: IO ()
+main = do
+  hSetBuffering stdout LineBuffering
+  input <- getContents
+  mapM_ handleRequest (lines input)
+
+handleRequest :: String -> IO ()
+handleRequest request = case words request of
+  [angle, epsilon] -> case parse_SymReal angle of
+    Just theta -> do
+      g <- newStdGen
+      let precision = -logBase 2 (read epsilon :: Double)
+      putStrLn (concatMap show (gridsynth_gates g precision theta effort))
+    Nothing -> putStrLn ("error: cannot parse angle " ++ angle)
+  _ -> putStrLn ("error: malformed request " ++ request)
@@ -0,0 +1,161 @@
+"""Molecular Hamiltonians, cached on disk between runs.
+
+Running pyscf and the Jordan-Wigner transform dominates the time of the
+molecular generating scripts for small circuits, and the result only depends
+on the molecule, so it is stored in an HDF5 file keyed by geometry, basis,
+multiplicity and charge.
+"""
+import hashlib
+import json
+import os
+
+import h5py
+import numpy as np
+import openfermion as of
+
+from . import instrumentation
+from .config import default_cache_dir
+
+DEFAULT_CACHE_FILE_NAME = "hamiltonians.h5"
+# Bump when the stored layout changes, so that old entries are not reused
+CACHE_FORMAT_VERSION = 1
+PAULI_CODES = {"X": 1, "Y": 2, "Z": 3}
+PAULI_LETTERS = {code: letter for letter, code in PAULI_CODES.items()}
+
+
+def molecule_key(geometry, basis, multiplicity, charge):
+    description = {
+        "version": CACHE_FORMAT_VERSION,
+        "geometry": [[atom, [float(x) for x in position]] for atom, position in geometry],
+        "basis": basis,
+        "multiplicity": multiplicity,
+        "charge": charge,
+    }
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+
+def encode_qubit_operator(qubit_operator, n_qubits):
+    """Pauli codes (n_terms x n_qubits, 0 is identity) and coefficients of each term.
+
+    Terms are kept in the order of `qubit_operator.terms`, since it determines
+    the order of the gates in Trotter circuits.
+    """
+    paulis = np.zeros((len(qubit_operator.terms), n_qubits), dtype=np.int8)
+    coefficients = np.zeros(len(qubit_operator.terms), dtype=np.complex128)
+    for index, (term, coefficient) in enumerate(qubit_operator.terms.items()):
+        for qubit, letter in term:
+            paulis[index, qubit] = PAULI_CODES[letter]
+        coefficients[index] = coefficient
+    return paulis, coefficients
+
+
+def decode_qubit_operator(paulis, coefficients, real_coefficients=False):
+    qubit_operator = of.QubitOperator()
+    for row, coefficient in zip(paulis, coefficients):
+        term = tuple(
+            (int(qubit), PAULI_LETTERS[int(row[qubit])]) for qubit in np.flatnonzero(row)
+        )
+        qubit_operator.terms[term] = (
+            float(coefficient.real) if real_coefficients else coefficient
+        )
+    return qubit_operator
+
+
+class HamiltonianCache:
+    """HDF5 cache of InteractionOperators and their Jordan-Wigner QubitOperators.
+
+    Each molecule is a group named after `molecule_key`, holding the tensors of
+    the InteractionOperator and the encoded QubitOperator (see
+    `encode_qubit_operator`). Entries read during a run are also kept in memory.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), DEFAULT_CACHE_FILE_NAME)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+
+    def get(self, geometry, basis, multiplicity, charge):
+        key = molecule_key(geometry, basis, multiplicity, charge)
+        entry = self._memory.get(key)
+        if entry is None and os.path.exists(self.path):
+            with h5py.File(self.path, "r") as f:
+                if key in f:
+                    entry = self._memory[key] = self._read_entry(f[key])
+        if entry is None:
+            self.misses += 1
+            instrumentation.count("hamiltonian_cache.misses")
+        else:
+            self.hits += 1
+            instrumentation.count("hamiltonian_cache.hits")
+        return entry
+
+    def put(self, geometry, basis, multiplicity, charge, interaction_operator, qubit_operator):
+        key = molecule_key(geometry, basis, multiplicity, charge)
+        with h5py.File(self.path, "a") as f:
+            if key in f:
+                del f[key]
+            group = f.create_group(key)
+            group.attrs["geometry"] = json.dumps(geometry)
+            group.attrs["basis"] = basis
+            group.attrs["multiplicity"] = multiplicity
+            group.attrs["charge"] = charge
+            group.attrs["constant"] = interaction_operator.constant
+            group.create_dataset("one_body_tensor", data=interaction_operator.one_body_tensor)
+            group.create_dataset("two_body_tensor", data=interaction_operator.two_body_tensor)
+            paulis, coefficients = encode_qubit_operator(
+                qubit_operator, interaction_operator.n_qubits
+            )
+            group.create_dataset("paulis", data=paulis)
+            group.create_dataset("coefficients", data=coefficients)
+            group.attrs["real_coefficients"] = all(
+                isinstance(coefficient, (float, int))
+                for coefficient in qubit_operator.terms.values()
+            )
+        self._memory[key] = (interaction_operator, qubit_operator)
+
+    def _read_entry(self, group):
+        interaction_operator = of.InteractionOperator(
+            float(group.attrs["constant"]),
+            group["one_body_tensor"][()],
+            group["two_body_tensor"][()],
+        )
+        qubit_operator = decode_qubit_operator(
+            group["paulis"][()],
+            group["coefficients"][()],
+            bool(group.attrs["real_coefficients"]),
+        )
+        return interaction_operator, qubit_operator
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def fingerprint(self):
+        # Cached Hamiltonians are the same as computed ones, so stages using
+        # any cache (see circuit_tools.artifacts) have the same inputs
+        return "HamiltonianCache"
+
+
+@instrumentation.profiled
+def molecular_hamiltonians(geometry, basis, multiplicity, charge, cache=None):
+    """InteractionOperator and Jordan-Wigner QubitOperator of a molecule.
+
+    The electronic structure calculation only runs if the molecule is not in
+    `cache` (a HamiltonianCache) yet.
+    """
+    if cache is not None:
+        entry = cache.get(geometry, basis, multiplicity, charge)
+        if entry is not None:
+            return entry
+    # Imported here, so that pyscf is only needed when the cache misses
+    from openfermionpyscf import generate_molecular_hamiltonian
+
+    interaction_operator = generate_molecular_hamiltonian(
+        geometry, basis, multiplicity, charge
+    )
+    qubit_operator = of.jordan_wigner(of.get_fermion_operator(interaction_operator))
+    if cache is not None:
+        cache.put(geometry, basis, multiplicity, charge, interaction_operator, qubit_operator)
+    return interaction_operator, qubit_operator
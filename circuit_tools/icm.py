@@ -0,0 +1,387 @@
+"""ICM (initialization, CNOT, measurement) form of Clifford + T circuits.
+
+The ICM circuits used to be compiled with `icm_circuit` from the icm package,
+on the whole circuit in cirq. `write_icm_circuit` does the conversion on the
+operation arrays of circuit_tools.columnar, a chunk at a time, and streams
+the result into a cirq JSON file:
+
+- Every operation whose gate is in `teleported_gates` (by default T and
+  T_DAG) is teleported onto a new ancilla, which starts in the state G|+> for
+  the gate G. A CNOT from the ancilla to the wire carrying the qubit and a
+  measurement of the wire leave G applied to the qubit on the ancilla (for
+  measurement outcome 0; outcome 1 leaves X G^-1 applied, which the Clifford
+  correction G^2 X fixes), and the qubit continues on the ancilla. Only
+  diagonal gates can be teleported this way, so `teleported_gates` can hold
+  the gates of ANCILLA_STATES.
+- CNOTs are native to ICM and stay CNOTs between the wires carrying their
+  qubits, and so do the other gates (H, S, X, ...), which icm_circuit kept
+  too.
+
+Ancillas are NamedQubits anc_0, anc_1, ... numbered in the order of the
+teleportations, the other qubits are named by their indices and start in |0>,
+and measurements have the name of the measured wire as key, like with
+icm_circuit. The summary returned by write_icm_circuit records the state each
+ancilla starts in.
+
+The circuits differ from those icm_circuit wrote for the committed files of
+2022_07_11_Zapata_H2_trotter_icm:
+
+- Those files hold the 2900 teleportations of the T gates of the 100 H2
+  Trotter steps (29 per step), with a CNOT from the wire to the ancilla, and
+  neither the X gates nor the CNOTs of the Trotter circuit. Here the CNOTs and
+  X gates of the Trotter circuit are kept, and the teleportation CNOT goes
+  from the ancilla to the wire.
+- icm_circuit put every qubit in a SplitQubit, whose JSON only keeps the
+  name, so after a teleportation the later operations on a qubit are still
+  written on the original qubit. Here they act on the NamedQubit of the
+  ancilla carrying it.
+
+Wires, ancillas and moments are computed with array operations over each
+chunk, in a single pass. The moments are those cirq.Circuit would give the
+operations. A moment is written as soon as every qubit is past it, and until
+then its operations are kept as a few numbers each rather than as text, so
+memory stays a small fraction of the size of the file.
+"""
+import re
+from collections import Counter
+from itertools import chain, islice
+
+import numpy as np
+
+from .cirq_json import CirqJsonWriter, open_circuit_file, operation_text
+from .columnar import (
+    GATE_NAMES,
+    MAX_QUBITS_PER_OPERATION,
+    OPCODES,
+    ColumnarCircuit,
+    columnar_parts,
+)
+from .instrumentation import profiled
+
+ICM_TELEPORTED_GATES = ("T", "T_DAG")
+# The gates which can be teleported, and the character standing for the
+# initial state G|+> of their ancillas in the `ancilla_states` of the summary
+ANCILLA_STATES = {"T": "T", "T_DAG": "t", "S": "S", "S_DAG": "s", "Z": "Z"}
+ANCILLA_PREFIX = "anc_"
+_CHUNK_SIZE = 1 << 16
+_PLACEHOLDER = "__icm_wire_{}__"
+_PLACEHOLDER_PATTERN = re.compile('"__icm_wire_([0-9])__"')
+
+
+def _check_teleported_gates(teleported_gates):
+    if not {"T", "T_DAG"} <= set(teleported_gates):
+        raise ValueError("T gates can only be compiled to ICM by teleportation.")
+    unsupported_gates = sorted(set(teleported_gates) - set(ANCILLA_STATES))
+    if unsupported_gates:
+        raise ValueError(
+            f"Only {', '.join(ANCILLA_STATES)} can be teleported, "
+            f"not {', '.join(unsupported_gates)}."
+        )
+    return np.array([OPCODES[gate_name] for gate_name in teleported_gates])
+
+
+def _segment_ranks(group_starts):
+    # Position of each element within its group, for sorted groups
+    indices = np.arange(len(group_starts))
+    return indices - np.maximum.accumulate(np.where(group_starts, indices, 0))
+
+
+class IcmConverter:
+    """Converts consecutive chunks of columnar operation arrays to ICM form.
+
+    Keeps the wire carrying each qubit, and the first moment in which each
+    qubit is free, from one chunk to the next. Wires are numbered like
+    qubits, with the ancillas following the `n_qubits` qubits in the order of
+    the teleportations. `ancilla_opcodes` holds an array per chunk with the
+    opcode of the gate teleported onto each ancilla.
+    """
+
+    def __init__(self, n_qubits, teleported_gates=ICM_TELEPORTED_GATES):
+        self.n_qubits = n_qubits
+        self.teleported_opcodes = _check_teleported_gates(teleported_gates)
+        self.wires = np.arange(n_qubits)
+        self.frontier = np.zeros(n_qubits, dtype=np.int64)
+        self.n_ancillas = 0
+        self.ancilla_opcodes = []
+
+    def convert(self, opcodes, qubits, params):
+        """Opcode, wire, param and moment arrays of the ICM operations.
+
+        Measurements have the measured wire as param, and unused wire slots
+        are -1 like unused qubit slots.
+        """
+        teleported = np.isin(opcodes, self.teleported_opcodes)
+        slots = qubits >= 0
+        arities = slots.sum(axis=1)
+        n_rows = np.where(teleported, 2, 1)
+        offsets = np.cumsum(n_rows) - n_rows
+
+        # Occurrences of qubits in the operations, in order
+        occurrences = np.flatnonzero(slots.ravel())
+        occurrence_qubits = qubits.ravel()[occurrences].astype(np.int64)
+        rows, positions = np.divmod(occurrences, qubits.shape[1])
+        is_teleportation = teleported[rows]
+        ancillas = np.where(
+            is_teleportation,
+            self.n_qubits + self.n_ancillas + np.cumsum(is_teleportation) - 1,
+            -1,
+        )
+        self.n_ancillas += int(is_teleportation.sum())
+        self.ancilla_opcodes.append(opcodes[teleported])
+
+        # The wire carrying each occurrence is the ancilla of the last
+        # teleportation of its qubit before it (ancillas only increase, so it
+        # is a running maximum over the occurrences sorted by qubit), or the
+        # wire carrying the qubit at the start of the chunk
+        order = np.argsort(occurrence_qubits, kind="stable")
+        sorted_qubits = occurrence_qubits[order]
+        group_starts = np.ones(len(order), dtype=bool)
+        group_starts[1:] = sorted_qubits[1:] != sorted_qubits[:-1]
+        previous = np.empty_like(ancillas)
+        previous[1:] = ancillas[order][:-1]
+        previous[group_starts] = -1
+        group_offsets = np.cumsum(group_starts) * (self.n_qubits + self.n_ancillas + 1)
+        last = np.maximum.accumulate(group_offsets + previous + 1) - group_offsets - 1
+        occurrence_wires = np.empty_like(occurrence_qubits)
+        occurrence_wires[order] = np.where(last >= 0, last, self.wires[sorted_qubits])
+        np.maximum.at(
+            self.wires, occurrence_qubits[is_teleportation], ancillas[is_teleportation]
+        )
+
+        # A teleportation puts the CNOT in the first moment the qubit is free
+        # (the ancilla is new) and the measurement in the next one, and the
+        # qubit continues on the ancilla from there, so each occurrence takes
+        # up one moment of its qubit. Only operations kept on several qubits
+        # wait for each other.
+        occurrence_moments = np.empty_like(occurrence_qubits)
+        if np.any(~teleported & (arities > 1)):
+            occurrence_moments[:] = self._coupled_moments(
+                rows.tolist(), occurrence_qubits.tolist(), teleported.tolist()
+            )
+        else:
+            occurrence_moments[order] = self.frontier[sorted_qubits] + _segment_ranks(
+                group_starts
+            )
+            self.frontier += np.bincount(occurrence_qubits, minlength=self.n_qubits)
+
+        n_operations = int(n_rows.sum())
+        icm_opcodes = np.empty(n_operations, dtype=np.uint8)
+        icm_wires = np.full(
+            (n_operations, MAX_QUBITS_PER_OPERATION), -1, dtype=np.int64
+        )
+        icm_params = np.full(n_operations, np.nan)
+        icm_moments = np.empty(n_operations, dtype=np.int64)
+        kept = ~teleported
+        icm_opcodes[offsets[kept]] = opcodes[kept]
+        icm_params[offsets[kept]] = params[kept]
+        kept_occurrences = ~is_teleportation
+        kept_rows = offsets[rows[kept_occurrences]]
+        icm_wires[kept_rows, positions[kept_occurrences]] = occurrence_wires[
+            kept_occurrences
+        ]
+        icm_moments[kept_rows] = occurrence_moments[kept_occurrences]
+        cnots = offsets[rows[is_teleportation]]
+        teleported_wires = occurrence_wires[is_teleportation]
+        icm_opcodes[cnots] = OPCODES["CNOT"]
+        icm_wires[cnots, 0] = ancillas[is_teleportation]
+        icm_wires[cnots, 1] = teleported_wires
+        icm_moments[cnots] = occurrence_moments[is_teleportation]
+        icm_opcodes[cnots + 1] = OPCODES["MEASURE"]
+        icm_wires[cnots + 1, 0] = teleported_wires
+        icm_params[cnots + 1] = teleported_wires
+        icm_moments[cnots + 1] = occurrence_moments[is_teleportation] + 1
+        return icm_opcodes, icm_wires, icm_params, icm_moments
+
+    def _coupled_moments(self, rows, qubits, teleported):
+        # Moments of the occurrences one operation at a time, for chunks with
+        # kept operations on several qubits
+        frontier = self.frontier.tolist()
+        moments = []
+        start = 0
+        while start < len(rows):
+            stop = start + 1
+            while stop < len(rows) and rows[stop] == rows[start]:
+                stop += 1
+            operation_qubits = qubits[start:stop]
+            if teleported[rows[start]]:
+                for qubit in operation_qubits:
+                    moments.append(frontier[qubit])
+                    frontier[qubit] += 1
+            else:
+                moment = max(frontier[qubit] for qubit in operation_qubits)
+                for qubit in operation_qubits:
+                    moments.append(moment)
+                    frontier[qubit] = moment + 1
+            start = stop
+        self.frontier[:] = frontier
+        return moments
+
+
+def _text_template(gate_name, arity, param):
+    # The text of the operation on placeholder qubits, split around the
+    # placeholders: (texts, indices of the qubits between them)
+    names = [_PLACEHOLDER.format(position) for position in range(arity)]
+    operation = (gate_name, tuple(range(arity)), () if param is None else (param,))
+    if gate_name == "MEASURE":
+        operation = (gate_name, (0,), (0.0,))
+    circuit = ColumnarCircuit.from_operations(
+        [operation], n_qubits=arity, qubit_names=names, measurement_keys=names[:1]
+    )
+    (cirq_operation,) = circuit.iter_cirq_operations()
+    pieces = _PLACEHOLDER_PATTERN.split(operation_text(cirq_operation))
+    return pieces[::2], [int(index) for index in pieces[1::2]]
+
+
+class _IcmTextRenderer:
+    # Renders ICM operations as operation texts, by filling the quoted names
+    # of their wires into one template per gate, arity and param
+
+    def __init__(self, qubit_names):
+        # None for the -1 of unused wire slots
+        self.quoted_qubit_names = np.array(
+            [f'"{name}"' for name in qubit_names] + [None], dtype=object
+        )
+        self.templates = {}
+
+    def _quoted_names(self, wires):
+        n_qubits = len(self.quoted_qubit_names) - 1
+        names = self.quoted_qubit_names[np.minimum(wires, n_qubits)]
+        ancillas = wires >= n_qubits
+        ancilla_indices, inverse = np.unique(
+            wires[ancillas] - n_qubits, return_inverse=True
+        )
+        ancilla_names = np.array(
+            [f'"{ANCILLA_PREFIX}{index}"' for index in ancilla_indices.tolist()]
+            + [None],
+            dtype=object,
+        )
+        names[ancillas] = ancilla_names[inverse]
+        return names
+
+    def render(self, opcodes, wires, params):
+        arities = (wires >= 0).sum(axis=1)
+        has_param = ~np.isnan(params) & (opcodes != OPCODES["MEASURE"])
+        keys = np.stack(
+            [
+                (opcodes.astype(np.int64) * 4 + arities) * 2 + has_param,
+                np.where(has_param, params, 0.0),
+            ],
+            axis=1,
+        )
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        names = self._quoted_names(wires)
+        texts = np.empty(len(opcodes), dtype=object)
+        for index, (code, param) in enumerate(unique_keys.tolist()):
+            code = int(code)
+            template = self.templates.get((code, param))
+            if template is None:
+                template = self.templates[code, param] = _text_template(
+                    GATE_NAMES[code // 8], code // 2 % 4, param if code % 2 else None
+                )
+            template_texts, indices = template
+            selected = inverse == index
+            group_texts = np.full(selected.sum(), template_texts[0], dtype=object)
+            for position, text in zip(indices, template_texts[1:]):
+                group_texts = group_texts + names[selected, position] + text
+            texts[selected] = group_texts
+        return texts
+
+
+@profiled
+def write_icm_circuit(circuit, file_or_path, teleported_gates=ICM_TELEPORTED_GATES):
+    """Compiles a Clifford + T circuit to ICM and writes it as cirq JSON.
+
+    `circuit` is anything columnar.columnar_parts takes; the block of a
+    RepeatedCircuit is converted once per repetition, without unrolling it.
+    Paths ending with .gz or .zip are compressed. Returns the summary of
+    resources.count_resources for the written circuit, except that it has no
+    T gates: instead of its T-count and T-depth, `magic_state_count` is the
+    number of ancillas of teleported T and T_DAG gates, which are initialized
+    in magic states. `ancilla_states` has a character per ancilla, in order,
+    standing for its initial state (see ANCILLA_STATES: "T" for T|+>, "t" for
+    T_DAG|+>); the other qubits start in |0>.
+    """
+    if isinstance(file_or_path, str):
+        with open_circuit_file(file_or_path, "w") as f:
+            return write_icm_circuit(circuit, f, teleported_gates)
+    parts = columnar_parts(circuit)
+    n_qubits = max([part.n_qubits for part, _ in parts], default=0)
+    qubit_names = [str(qubit) for qubit in range(n_qubits)]
+    used = np.zeros(n_qubits, dtype=bool)
+    for part, _ in parts:
+        if part.qubit_names is not None:
+            qubit_names[: len(part.qubit_names)] = part.qubit_names
+        for start in range(0, len(part), _CHUNK_SIZE):
+            qubits = np.asarray(part.qubits[start : start + _CHUNK_SIZE])
+            used[qubits[qubits >= 0]] = True
+
+    converter = IcmConverter(n_qubits, teleported_gates)
+    renderer = _IcmTextRenderer(qubit_names)
+    writer = CirqJsonWriter(file_or_path)
+    gate_counts = Counter()
+    # Opcodes, wires, params and moments of the operations in moments which
+    # are not written yet, in circuit order. They are kept as arrays and only
+    # rendered when written, since a qubit used rarely holds back the moments.
+    pending = [
+        np.empty(0, dtype=np.uint8),
+        np.empty((0, MAX_QUBITS_PER_OPERATION), dtype=np.int64),
+        np.empty(0),
+        np.empty(0, dtype=np.int64),
+    ]
+
+    def write_moments(stop):
+        # Writes the moments before `stop`
+        order = np.argsort(pending[3], kind="stable")
+        pending[:] = [array[order] for array in pending]
+        moments = pending[3]
+        bounds = np.searchsorted(moments, np.arange(writer.n_moments, stop + 1))
+        n_ready = int(bounds[-1])
+        # Rendered a chunk at a time, as the moments are written
+        texts = chain.from_iterable(
+            renderer.render(
+                *[array[start : start + _CHUNK_SIZE] for array in pending[:3]]
+            ).tolist()
+            for start in range(0, n_ready, _CHUNK_SIZE)
+        )
+        for count in np.diff(bounds).tolist():
+            writer.write_operation_texts(list(islice(texts, count)))
+        pending[:] = [array[n_ready:] for array in pending]
+
+    for part, repetitions in parts:
+        for _ in range(repetitions):
+            for start in range(0, len(part), _CHUNK_SIZE):
+                chunk = part.operation_range(start, start + _CHUNK_SIZE)
+                operations = converter.convert(
+                    np.asarray(chunk.opcodes),
+                    np.asarray(chunk.qubits),
+                    np.asarray(chunk.params),
+                )
+                counts = np.bincount(operations[0], minlength=len(GATE_NAMES))
+                for opcode in np.flatnonzero(counts).tolist():
+                    gate_counts[GATE_NAMES[opcode]] += int(counts[opcode])
+                pending[:] = [
+                    np.concatenate([array, new_array])
+                    for array, new_array in zip(pending, operations)
+                ]
+                # Later operations all come after the frontier of their qubits
+                write_moments(int(converter.frontier[used].min()))
+    if len(pending[3]):
+        write_moments(int(pending[3].max()) + 1)
+    writer.close()
+    ancilla_opcodes = np.concatenate(
+        converter.ancilla_opcodes + [np.empty(0, dtype=np.uint8)]
+    )
+    state_characters = np.zeros(len(GATE_NAMES), dtype="S1")
+    for gate_name, character in ANCILLA_STATES.items():
+        state_characters[OPCODES[gate_name]] = character
+    magic_state_opcodes = [OPCODES["T"], OPCODES["T_DAG"]]
+    return {
+        "n_qubits": int(used.sum()) + converter.n_ancillas,
+        "n_operations": sum(gate_counts.values()),
+        "magic_state_count": int(np.isin(ancilla_opcodes, magic_state_opcodes).sum()),
+        "ancilla_states": state_characters[ancilla_opcodes].tobytes().decode(),
+        "cnot_count": gate_counts["CNOT"],
+        "depth": writer.n_moments,
+        "gate_counts": dict(sorted(gate_counts.items())),
+    }
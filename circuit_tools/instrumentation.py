@@ -0,0 +1,203 @@
+"""Optional instrumentation of the pipeline functions, reported per circuit.
+
+Set DARPA_CIRCUITS_PROFILE=1 to turn it on. Functions decorated with
+`profiled` then record their calls, wall time, the peak RSS of the process
+after them and the number of operations (or Hamiltonian terms) they get and
+return, and the gridsynth and cache code counts calls, hits and misses and
+keeps a histogram of synthesis latencies. Sweep collects the records of each
+stage it runs, and next to every circuit file written by a sweep it saves the
+records of the stages leading to it as `<name>.perf.json`.
+
+The variable is read once, at import. When it is not set `profiled` returns
+the functions unchanged and `count` and `record_latency` return immediately,
+so the hooks cost nothing on hot paths.
+"""
+import functools
+import json
+import math
+import os
+import resource
+import time
+from collections import Counter
+
+PROFILE_ENV_VARIABLE = "DARPA_CIRCUITS_PROFILE"
+ENABLED = os.environ.get(PROFILE_ENV_VARIABLE, "") not in ("", "0")
+REPORT_SUFFIX = ".perf.json"
+
+_functions = {}
+_counters = Counter()
+_histograms = {}
+# Names of the profiled functions being called
+_active = set()
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def n_operations(value):
+    """Number of operations of a circuit or terms of a Hamiltonian, if it is one."""
+    if hasattr(value, "opcodes"):
+        return len(value.opcodes)
+    if hasattr(value, "repetitions"):
+        return sum(value.gate_counts().values())
+    if hasattr(value, "operations"):
+        return len(value.operations)
+    if hasattr(value, "all_operations"):
+        return sum(len(moment) for moment in value)
+    if hasattr(value, "n_terms"):
+        return value.n_terms
+    if hasattr(value, "terms"):
+        return len(value.terms)
+    return None
+
+
+def _function_name(function):
+    return f"{function.__module__}.{function.__qualname__}"
+
+
+def _call_record(function, args, kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    record = {
+        "calls": 1,
+        "seconds": time.perf_counter() - start,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "operations_in": (n_operations(args[0]) if args else None) or 0,
+        "operations_out": n_operations(result) or 0,
+    }
+    return result, record
+
+
+def _add_record(records, name, record):
+    merged = records.setdefault(name, dict.fromkeys(record, 0))
+    for key, value in record.items():
+        if key == "peak_rss_bytes":
+            merged[key] = max(merged[key], value)
+        else:
+            merged[key] += value
+
+
+def profiled(function):
+    """Records the calls of `function` while instrumentation is enabled.
+
+    The operations counted in are those of the first argument. Recursive
+    calls, e.g. of writers opening a path and calling themselves with the
+    file, are part of the outermost call.
+    """
+    if not ENABLED:
+        return function
+    name = _function_name(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if name in _active:
+            return function(*args, **kwargs)
+        _active.add(name)
+        try:
+            result, record = _call_record(function, args, kwargs)
+        finally:
+            _active.discard(name)
+        _add_record(_functions, name, record)
+        return result
+
+    return wrapper
+
+
+def profile_call(function, args, kwargs):
+    """Calls a pipeline stage, returning its result and its profile.
+
+    The profile is the record of the call itself (like those of `profiled`,
+    under "stage"), with the records made during the call.
+    """
+    take_records()
+    result, record = _call_record(function, args, kwargs)
+    return result, {"stage": _function_name(function), **record, **take_records()}
+
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    _counters[name] += n
+
+
+def record_latency(name, seconds, n=1):
+    """Adds `n` latencies of `seconds` to a histogram with power of 2 buckets."""
+    if not ENABLED:
+        return
+    # Bucket b holds latencies up to 2**b milliseconds
+    bucket = max(0, math.ceil(math.log2(max(seconds * 1000, 1e-9))))
+    _histograms.setdefault(name, Counter())[bucket] += n
+
+
+def take_records():
+    """The records since the last call, which are then cleared."""
+    records = {
+        "functions": {name: dict(record) for name, record in _functions.items()},
+        "counters": dict(_counters),
+        "histograms": {
+            name: dict(histogram) for name, histogram in _histograms.items()
+        },
+    }
+    _functions.clear()
+    _counters.clear()
+    _histograms.clear()
+    return records
+
+
+def report(profiles):
+    """Report of a circuit from the profiles of the stages leading to it.
+
+    Records of the same function are summed over the stages. Histogram
+    buckets are labelled by their upper bound in milliseconds, and the hit
+    rate of each cache is computed from its `<cache>.hits` and
+    `<cache>.misses` counters.
+    """
+    functions = {}
+    counters = Counter()
+    histograms = {}
+    for profile in profiles:
+        for name, record in profile["functions"].items():
+            _add_record(functions, name, record)
+        counters.update(profile["counters"])
+        for name, histogram in profile["histograms"].items():
+            histograms.setdefault(name, Counter()).update(histogram)
+    cache_hit_rates = {}
+    for name, hits in counters.items():
+        if name.endswith(".hits"):
+            cache = name[: -len(".hits")]
+            lookups = hits + counters[f"{cache}.misses"]
+            cache_hit_rates[cache] = hits / lookups if lookups else 0.0
+    return {
+        "stages": [
+            {
+                key: value
+                for key, value in profile.items()
+                if key not in ("calls", "functions", "counters", "histograms")
+            }
+            for profile in profiles
+        ],
+        "functions": functions,
+        "counters": dict(counters),
+        "cache_hit_rates": cache_hit_rates,
+        "latency_histograms_ms": {
+            name: {f"<={2**bucket}": n for bucket, n in sorted(histogram.items())}
+            for name, histogram in histograms.items()
+        },
+    }
+
+
+def report_path(circuit_path):
+    from .resources import RESOURCES_SUFFIX, resource_summary_path
+
+    return resource_summary_path(circuit_path)[: -len(RESOURCES_SUFFIX)] + REPORT_SUFFIX
+
+
+def write_report(circuit_report, circuit_path):
+    """Saves a report next to the circuit file it describes and returns its path."""
+    path = report_path(circuit_path)
+    with open(path, "w") as f:
+        json.dump(circuit_report, f, indent=2)
+        f.write("\n")
+    return path
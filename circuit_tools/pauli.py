@@ -0,0 +1,239 @@
+"""Pauli sums stored as symplectic bit matrices.
+
+A PauliTable holds one row per term: X and Z bits (X is x=1, Z is z=1, Y is
+both) and a complex coefficient. Operations act on whole arrays at once, so
+Hamiltonians with 10^5-10^6 terms can be manipulated at NumPy speed, and the
+results match the equivalent openfermion QubitOperator operations exactly,
+including the order of the terms.
+"""
+import numpy as np
+import openfermion as of
+
+from .instrumentation import profiled
+
+# Same as openfermion's EQ_TOLERANCE, used by QubitOperator addition and compress
+EQ_TOLERANCE = 1e-8
+PAULI_LETTERS = "IXYZ"
+_LETTER_CODES = {letter: code for code, letter in enumerate(PAULI_LETTERS)}
+
+
+def _codes_from_bits(x, z):
+    # I -> 0, X -> 1, Y -> 2, Z -> 3
+    x = x.astype(np.int8)
+    z = z.astype(np.int8)
+    return x + 3 * z - 2 * x * z
+
+
+class PauliTable:
+    """A sum of Pauli terms as X bits, Z bits and coefficients.
+
+    `real` marks the coefficients which openfermion would hold as real numbers
+    (after `compress`), so that `to_qubit_operator` returns the same types.
+    """
+
+    def __init__(self, x, z, coefficients, real=None):
+        self.x = np.asarray(x, dtype=bool)
+        self.z = np.asarray(z, dtype=bool)
+        self.coefficients = np.asarray(coefficients, dtype=np.complex128)
+        if real is None:
+            real = np.zeros(len(self.coefficients), dtype=bool)
+        self.real = np.asarray(real, dtype=bool)
+
+    @property
+    def n_terms(self):
+        return len(self.coefficients)
+
+    @property
+    def n_qubits(self):
+        return self.x.shape[1]
+
+    def __len__(self):
+        return self.n_terms
+
+    def codes(self):
+        """Pauli of each term on each qubit as 0 (I), 1 (X), 2 (Y) or 3 (Z)."""
+        return _codes_from_bits(self.x, self.z)
+
+    @classmethod
+    def from_codes(cls, codes, coefficients, real=None):
+        codes = np.asarray(codes)
+        return cls((codes == 1) | (codes == 2), (codes == 2) | (codes == 3), coefficients, real)
+
+    @classmethod
+    def from_qubit_operator(cls, qubit_operator, n_qubits=None):
+        terms = qubit_operator.terms
+        if isinstance(terms, list):
+            # orquestra's PauliSum, as returned by from_openfermion, holds
+            # PauliTerms instead of a dict
+            terms = [(sorted(term.operations), term.coefficient) for term in terms]
+        else:
+            terms = list(terms.items())
+        if n_qubits is None:
+            # Like of.count_qubits, but also works for orquestra's operators
+            n_qubits = 1 + max(
+                (qubit for term, _ in terms for qubit, _ in term), default=-1
+            )
+        rows = []
+        qubits = []
+        codes = []
+        for row, (term, _) in enumerate(terms):
+            for qubit, letter in term:
+                rows.append(row)
+                qubits.append(qubit)
+                codes.append(_LETTER_CODES[letter])
+        term_codes = np.zeros((len(terms), n_qubits), dtype=np.int8)
+        term_codes[rows, qubits] = codes
+        coefficients = [coefficient for _, coefficient in terms]
+        real = [
+            isinstance(coefficient, (float, int, np.floating, np.integer))
+            for coefficient in coefficients
+        ]
+        return cls.from_codes(term_codes, coefficients, real)
+
+    def to_qubit_operator(self):
+        codes = self.codes()
+        rows, qubits = np.nonzero(codes)
+        letters = np.array(list(PAULI_LETTERS))[codes[rows, qubits]]
+        # Terms are sorted by qubit, like openfermion keeps them
+        bounds = np.searchsorted(rows, np.arange(self.n_terms + 1))
+        qubits = qubits.tolist()
+        letters = letters.tolist()
+        coefficients = self.coefficients.tolist()
+        real = self.real.tolist()
+        qubit_operator = of.QubitOperator()
+        for row in range(self.n_terms):
+            start, stop = bounds[row], bounds[row + 1]
+            term = tuple(zip(qubits[start:stop], letters[start:stop]))
+            coefficient = coefficients[row]
+            qubit_operator.terms[term] = coefficient.real if real[row] else coefficient
+        return qubit_operator
+
+    @classmethod
+    def single(cls, qubit, letter, n_qubits, coefficient=1.0):
+        codes = np.zeros((1, n_qubits), dtype=np.int8)
+        codes[0, qubit] = _LETTER_CODES[letter]
+        return cls.from_codes(codes, [coefficient], [isinstance(coefficient, float)])
+
+    def with_n_qubits(self, n_qubits):
+        """The same terms on at least `n_qubits` qubits."""
+        if n_qubits <= self.n_qubits:
+            return self
+        padding = np.zeros((self.n_terms, n_qubits - self.n_qubits), dtype=bool)
+        return PauliTable(
+            np.hstack([self.x, padding]),
+            np.hstack([self.z, padding]),
+            self.coefficients,
+            self.real,
+        )
+
+    def take(self, rows):
+        """The terms `rows`, in that order."""
+        return PauliTable(
+            self.x[rows], self.z[rows], self.coefficients[rows], self.real[rows]
+        )
+
+    def scale(self, factor):
+        real = self.real & isinstance(factor, (float, int))
+        return PauliTable(self.x, self.z, self.coefficients * factor, real)
+
+    def multiply_by_pauli(self, qubit, letter):
+        """Every term multiplied on the right by a single Pauli operator."""
+        table = self.with_n_qubits(qubit + 1)
+        left = table.codes()[:, qubit]
+        right = _LETTER_CODES[letter]
+        x = table.x.copy()
+        z = table.z.copy()
+        x[:, qubit] ^= right in (1, 2)
+        z[:, qubit] ^= right in (2, 3)
+        # XY = iZ, YZ = iX, ZX = iY and the reverse products get -i; products
+        # with identity or of equal Paulis leave the coefficient alone
+        anticommuting = (left != 0) & (right != 0) & (left != right)
+        phases = np.where((right - left) % 3 == 1, 1j, -1j)
+        coefficients = table.coefficients.copy()
+        coefficients[anticommuting] *= phases[anticommuting]
+        real = table.real & ~anticommuting
+        return PauliTable(x, z, coefficients, real)
+
+    @staticmethod
+    def concatenate(tables):
+        n_qubits = max(table.n_qubits for table in tables)
+        tables = [table.with_n_qubits(n_qubits) for table in tables]
+        return PauliTable(
+            np.vstack([table.x for table in tables]),
+            np.vstack([table.z for table in tables]),
+            np.concatenate([table.coefficients for table in tables]),
+            np.concatenate([table.real for table in tables]),
+        )
+
+    def combine_like_terms(self, tolerance=EQ_TOLERANCE):
+        """Sums the coefficients of equal terms, like adding QubitOperators.
+
+        Each term stays at its first occurrence, coefficients are summed in
+        order, and terms whose sum is below `tolerance` are dropped.
+        """
+        if self.n_terms == 0:
+            return self
+        keys = np.packbits(np.hstack([self.x, self.z]), axis=1)
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.shape[1])))
+        _, first_indices, inverse = np.unique(
+            keys.ravel(), return_index=True, return_inverse=True
+        )
+        order = np.argsort(first_indices)
+        group_of_unique = np.empty_like(order)
+        group_of_unique[order] = np.arange(len(order))
+        groups = group_of_unique[inverse.ravel()]
+        # ufunc.at adds duplicates one by one in index order, like repeated +=
+        sums = np.zeros(len(order), dtype=np.complex128)
+        np.add.at(sums, groups, self.coefficients)
+        all_real = np.ones(len(order), dtype=bool)
+        np.logical_and.at(all_real, groups, self.real)
+
+        keep = np.abs(sums) >= tolerance
+        rows = first_indices[order][keep]
+        return PauliTable(self.x[rows], self.z[rows], sums[keep], all_real[keep])
+
+    def compress(self, abs_tol=EQ_TOLERANCE):
+        """Drops small real/imaginary parts and small terms, like QubitOperator.compress."""
+        coefficients = self.coefficients.copy()
+        small_imag = np.abs(coefficients.imag) <= abs_tol
+        coefficients[small_imag] = coefficients[small_imag].real
+        small_real = np.abs(coefficients.real) <= abs_tol
+        coefficients[small_real] = 1j * coefficients[small_real].imag
+        real = small_imag & ~small_real
+        keep = np.abs(coefficients) > abs_tol
+        return PauliTable(self.x[keep], self.z[keep], coefficients[keep], real[keep])
+
+
+def add_control_qubit(table, control_qubit):
+    """Hamiltonian whose evolution is the evolution under `table`, controlled.
+
+    Returns 1/2 Z_c + 1/2 H + 1/2 H Z_c with real coefficients, where c is
+    `control_qubit`, with the terms in the same order as the openfermion
+    expression `0.5 Z_c + 0.5 H + H * (0.5 Z_c)` followed by compress().
+    Raises a ValueError if `table` acts on the control qubit, since the
+    result then isn't Hermitian.
+    """
+    if control_qubit < table.n_qubits and (
+        table.x[:, control_qubit] | table.z[:, control_qubit]
+    ).any():
+        raise ValueError(f"The Hamiltonian acts on the control qubit {control_qubit}.")
+    ancilla_z = PauliTable.single(control_qubit, "Z", control_qubit + 1, 0.5)
+    system = table.scale(0.5)
+    coupling = system.multiply_by_pauli(control_qubit, "Z")
+    return (
+        PauliTable.concatenate([ancilla_z, system, coupling])
+        .combine_like_terms()
+        .compress()
+    )
+
+
+@profiled
+def controlled_qubit_hamiltonian(qubit_hamiltonian, control_qubit):
+    """QubitOperator version of `add_control_qubit`.
+
+    `qubit_hamiltonian` is a QubitOperator or already a PauliTable.
+    """
+    table = qubit_hamiltonian
+    if not isinstance(table, PauliTable):
+        table = PauliTable.from_qubit_operator(qubit_hamiltonian)
+    return add_control_qubit(table, control_qubit).to_qubit_operator()
@@ -0,0 +1,213 @@
+"""Single pass peephole optimization of Clifford + T circuits.
+
+Splicing gridsynth sequences into a circuit leaves redundant gates behind: H H
+and X X pairs, runs of phase gates (T T is S, S S is Z) and CNOT pairs that
+cancel. The optimizer goes through the operations once, keeping for every
+qubit a stack of the gates still in the output that touch it, and compares
+each new gate with the top of the stacks of its qubits:
+
+- H H and X X cancel, and X P X is the phase P with the opposite angle.
+- T, S, Z and their inverses are merged into a single phase (a multiple of
+  pi/4), written out with at most one T gate. Phases on the control of a CNOT
+  commute with it, so they are merged across CNOTs too.
+- A CNOT cancels an earlier CNOT on the same qubits if only gates commuting
+  with it are in between: phases on the control, X on the target and CNOTs
+  sharing the control or the target.
+
+Looking below the top of a stack is limited to a few gates, so the pass takes
+time linear in the number of operations. Any other gate blocks its qubits.
+"""
+from orquestra.quantum.circuits import S, T, Z
+
+from .columnar import encode_orquestra_gate
+from .resources import count_resources
+
+# Exponents of the phase gates as powers of T, and the gates writing them out
+_PHASE_EXPONENTS = {"T": 1, "S": 2, "Z": 4, "S_DAG": 6, "T_DAG": 7}
+_PHASE_GATES = (
+    (),
+    ("T",),
+    ("S",),
+    ("S", "T"),
+    ("Z",),
+    ("Z", "T"),
+    ("Z", "S"),
+    ("Z", "S", "T"),
+)
+# Largest number of commuting gates looked through on a stack
+_SCAN_LIMIT = 16
+_PHASE = "PHASE"
+_OTHER = "OTHER"
+_PHASE_GATE_CLASSES = {"S": S, "T": T, "Z": Z}
+
+
+def _scan(stack, names, qubits, skip, match):
+    # Position in `stack` of the nearest gate for which `match` holds, if only
+    # gates for which `skip` holds are above it
+    lowest = max(-1, len(stack) - 1 - _SCAN_LIMIT)
+    for position in range(len(stack) - 1, lowest, -1):
+        index = stack[position]
+        if match(names[index], qubits[index]):
+            return position
+        if not skip(names[index], qubits[index]):
+            return None
+    return None
+
+
+def optimize_clifford_t(circuit):
+    """`circuit` with redundant Clifford + T gates cancelled or merged.
+
+    The result implements the same unitary up to a global phase.
+    """
+    names = []
+    qubits = []
+    operations = []
+    exponents = {}
+    stacks = {}
+    encoded_gates = {}
+
+    def push(name, operation, exponent=None):
+        index = len(names)
+        names.append(name)
+        qubits.append(operation.qubit_indices)
+        operations.append(operation)
+        if exponent is not None:
+            exponents[index] = exponent
+        for qubit in operation.qubit_indices:
+            stacks.setdefault(qubit, []).append(index)
+
+    def remove(index, *positions):
+        # Drops the gate at `index`, which is at `positions` of its qubits' stacks
+        names[index] = None
+        for qubit, position in zip(qubits[index], positions):
+            del stacks[qubit][position]
+
+    def set_phase(index, position, exponent):
+        if exponent % 8:
+            exponents[index] = exponent % 8
+        else:
+            remove(index, position)
+
+    for operation in circuit.operations:
+        encoded_gate = encoded_gates.get(operation.gate)
+        if encoded_gate is None:
+            try:
+                encoded_gate = encode_orquestra_gate(operation.gate)
+            except ValueError:
+                encoded_gate = (_OTHER, ())
+            encoded_gates[operation.gate] = encoded_gate
+        name = encoded_gate[0]
+        if name == "I":
+            continue
+        if name in _PHASE_EXPONENTS:
+            (qubit,) = operation.qubit_indices
+            stack = stacks.get(qubit, [])
+            position = _scan(
+                stack,
+                names,
+                qubits,
+                lambda other, other_qubits: other == "CNOT"
+                and other_qubits[0] == qubit,
+                lambda other, _: other == _PHASE,
+            )
+            exponent = _PHASE_EXPONENTS[name]
+            if position is None:
+                push(_PHASE, operation, exponent)
+            else:
+                index = stack[position]
+                set_phase(index, position, exponents[index] + exponent)
+        elif name == "H":
+            (qubit,) = operation.qubit_indices
+            stack = stacks.get(qubit, [])
+            if stack and names[stack[-1]] == "H":
+                remove(stack[-1], -1)
+            else:
+                push(name, operation)
+        elif name == "X":
+            (qubit,) = operation.qubit_indices
+            stack = stacks.get(qubit, [])
+            position = _scan(
+                stack,
+                names,
+                qubits,
+                lambda other, other_qubits: other == "CNOT"
+                and other_qubits[1] == qubit,
+                lambda other, _: other == "X",
+            )
+            if position is not None:
+                remove(stack[position], position)
+            elif (
+                len(stack) >= 2
+                and names[stack[-1]] == _PHASE
+                and names[stack[-2]] == "X"
+            ):
+                # X P X is P with the opposite angle, up to a global phase
+                phase_index = stack[-1]
+                remove(stack[-2], -2)
+                exponents[phase_index] = -exponents[phase_index] % 8
+            else:
+                push(name, operation)
+        elif name == "CNOT":
+            control, target = operation.qubit_indices
+            control_stack = stacks.get(control, [])
+            target_stack = stacks.get(target, [])
+            control_position = _scan(
+                control_stack,
+                names,
+                qubits,
+                lambda other, other_qubits: other == _PHASE
+                or (other == "CNOT" and other_qubits[0] == control),
+                lambda other, other_qubits: other == "CNOT"
+                and other_qubits == (control, target),
+            )
+            target_position = _scan(
+                target_stack,
+                names,
+                qubits,
+                lambda other, other_qubits: other == "X"
+                or (other == "CNOT" and other_qubits[1] == target),
+                lambda other, other_qubits: other == "CNOT"
+                and other_qubits == (control, target),
+            )
+            if (
+                control_position is not None
+                and target_position is not None
+                and control_stack[control_position] == target_stack[target_position]
+            ):
+                index = control_stack[control_position]
+                remove(index, control_position, target_position)
+            else:
+                push(name, operation)
+        else:
+            push(name, operation)
+
+    new_operations = []
+    for index, name in enumerate(names):
+        if name == _PHASE:
+            (qubit,) = qubits[index]
+            new_operations += [
+                _PHASE_GATE_CLASSES[gate_name](qubit)
+                for gate_name in _PHASE_GATES[exponents[index]]
+            ]
+        elif name is not None:
+            new_operations.append(operations[index])
+    return type(circuit)(new_operations, n_qubits=circuit.n_qubits)
+
+
+def optimize_repeated_circuit(repeated_circuit):
+    """optimize_clifford_t applied to each part of a RepeatedCircuit."""
+    return repeated_circuit.map_block(optimize_clifford_t)
+
+
+def optimization_savings(circuit, optimized_circuit):
+    """T-count and number of operations before and after optimizing `circuit`."""
+    before = count_resources(circuit)
+    after = count_resources(optimized_circuit)
+    return {
+        key: {
+            "before": before[key],
+            "after": after[key],
+            "saved": before[key] - after[key],
+        }
+        for key in ("t_count", "n_operations")
+    }
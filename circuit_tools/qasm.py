@@ -0,0 +1,286 @@
+"""Reading and writing OpenQASM 2.0 without going through qiskit.
+
+Operations are handled as (gate name, qubit indices, params) triples, with the
+gate names of `circuit_tools.columnar.GATE_NAMES`. Circuits can also be written
+as OpenQASM 3.0, with the gates of its stdgates.inc.
+"""
+import ast
+import operator
+import re
+
+import numpy as np
+
+from .columnar import GATE_NAMES, columnar_parts
+from .instrumentation import profiled
+
+QASM_HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\n'
+QASM3_HEADER = 'OPENQASM 3.0;\ninclude "stdgates.inc";\n'
+
+QASM_GATE_NAMES = {
+    "I": "id",
+    "X": "x",
+    "Y": "y",
+    "Z": "z",
+    "H": "h",
+    "S": "s",
+    "S_DAG": "sdg",
+    "T": "t",
+    "T_DAG": "tdg",
+    "RX": "rx",
+    "RY": "ry",
+    "RZ": "rz",
+    "CNOT": "cx",
+    "CZ": "cz",
+    "SWAP": "swap",
+    "CRZ": "crz",
+    "TOFFOLI": "ccx",
+    "MEASURE": "measure",
+    "RESET": "reset",
+}
+GATE_NAMES_FROM_QASM = {
+    qasm_name: gate_name for gate_name, qasm_name in QASM_GATE_NAMES.items()
+}
+
+# Same constants as qiskit's pi_check, which produced the QASM files in this repo
+_MAX_FRAC = 16
+_N, _D = np.meshgrid(np.arange(1, _MAX_FRAC + 1), np.arange(1, _MAX_FRAC + 1))
+_FRAC_MESH = _N / _D * np.pi
+_RECIP_MESH = _N / _D / np.pi
+_POW_LIST = np.pi ** np.arange(2, 5)
+
+# Line templates kept by QasmWriter, e.g. for circuits with many distinct angles
+_MAX_LINE_FORMATS = 1 << 16
+_OPERATION_PATTERN = re.compile(r"^(\w+)\s*(?:\((.*)\))?\s+(.*);$")
+_QUBIT_PATTERN = re.compile(r"^(\w+)\[(\d+)\]$")
+_REGISTER_PATTERN = re.compile(r"^([qc])reg\s+(\w+)\[(\d+)\];$")
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+
+
+def format_qasm_param(value, eps=1e-6, ndigits=8):
+    """Formats a gate parameter the way qiskit's QuantumCircuit.qasm() does."""
+    value = float(value)
+    if abs(value) < 1e-14:
+        return "0"
+    sign = "-" if value < 0 else ""
+
+    # Whole multiples of pi
+    multiple = value / np.pi
+    if abs(multiple) >= 1 - eps and abs(abs(multiple) - abs(round(multiple))) < eps:
+        multiple = int(abs(round(multiple)))
+        return f"{sign}pi" if multiple == 1 else f"{sign}{multiple}*pi"
+
+    # Powers of pi and values too large to be a fraction are printed as numbers
+    if abs(value) > np.pi and np.any(abs(abs(value) - _POW_LIST) < eps):
+        return "{:.{}g}".format(value, ndigits)
+    if abs(value) >= _MAX_FRAC * np.pi:
+        return "{:.{}g}".format(value, ndigits)
+
+    # pi / n
+    denominator = np.pi / value
+    if abs(abs(denominator) - abs(round(denominator))) < eps:
+        return f"{sign}pi/{int(abs(round(denominator)))}"
+
+    # n * pi / m
+    fraction = np.where(np.abs(abs(value) - _FRAC_MESH) < eps)
+    if fraction[0].shape[0]:
+        return f"{sign}{int(fraction[1][0]) + 1}*pi/{int(fraction[0][0]) + 1}"
+
+    # n / (m * pi)
+    fraction = np.where(np.abs(abs(value) - _RECIP_MESH) < eps)
+    if fraction[0].shape[0]:
+        return f"{sign}{int(fraction[1][0]) + 1}/({int(fraction[0][0]) + 1}*pi)"
+
+    return "{:.{}g}".format(value, ndigits)
+
+
+class QasmWriter:
+    """Writes operations to an OpenQASM 2.0 or 3.0 file as they come.
+
+    Lines are formatted from templates holding everything but the qubits, one
+    per gate and params (Trotter circuits repeat the same few angles, so each
+    is formatted only once), and written a chunk at a time. Measurements
+    write to the classical bit given by their single param.
+    """
+
+    def __init__(self, file, n_qubits, n_clbits=0, version=2):
+        if version not in (2, 3):
+            raise ValueError(f"OpenQASM version {version} is not supported.")
+        self.file = file
+        self.version = version
+        self._line_formats = {}
+        if version == 2:
+            file.write(QASM_HEADER)
+            file.write(f"qreg q[{n_qubits}];\n")
+            if n_clbits:
+                file.write(f"creg c[{n_clbits}];\n")
+        else:
+            file.write(QASM3_HEADER)
+            file.write(f"qubit[{n_qubits}] q;\n")
+            if n_clbits:
+                file.write(f"bit[{n_clbits}] c;\n")
+
+    def _line_format(self, gate_name, n_qubits, params):
+        key = (gate_name, n_qubits, params)
+        line_format = self._line_formats.get(key)
+        if line_format is not None:
+            return line_format
+        try:
+            qasm_name = QASM_GATE_NAMES[gate_name]
+        except KeyError:
+            raise ValueError(f"Gate {gate_name} is not supported in QASM.")
+        qubits = ",".join(["q[{}]"] * n_qubits)
+        if gate_name == "MEASURE":
+            clbit = int(params[0])
+            if self.version == 2:
+                line = f"measure {qubits} -> c[{clbit}];\n"
+            else:
+                line = f"c[{clbit}] = measure {qubits};\n"
+        else:
+            if params:
+                params = ",".join(format_qasm_param(param) for param in params)
+                qasm_name += f"({params})"
+            line = f"{qasm_name} {qubits};\n"
+        if len(self._line_formats) >= _MAX_LINE_FORMATS:
+            self._line_formats.clear()
+        line_format = self._line_formats[key] = line.format
+        return line_format
+
+    def write_operations(self, operations):
+        """Writes (gate name, qubit indices, params) triples."""
+        for gate_name, qubits, params in operations:
+            line_format = self._line_format(gate_name, len(qubits), tuple(params))
+            self.file.write(line_format(*qubits))
+
+    def write_columnar(self, circuit, chunk_size=1 << 16):
+        """Writes the operations of a ColumnarCircuit a chunk at a time."""
+        for start in range(0, len(circuit), chunk_size):
+            stop = start + chunk_size
+            opcodes = np.asarray(circuit.opcodes[start:stop]).tolist()
+            qubits = np.asarray(circuit.qubits[start:stop]).tolist()
+            params = np.asarray(circuit.params[start:stop]).tolist()
+            lines = []
+            for opcode, operation_qubits, param in zip(opcodes, qubits, params):
+                if operation_qubits[-1] < 0:
+                    operation_qubits = operation_qubits[: operation_qubits.index(-1)]
+                line_format = self._line_format(
+                    GATE_NAMES[opcode],
+                    len(operation_qubits),
+                    () if param != param else (param,),
+                )
+                lines.append(line_format(*operation_qubits))
+            self.file.write("".join(lines))
+
+
+def write_qasm(operations, n_qubits, file, n_clbits=0, version=2):
+    """Writes (gate name, qubit indices, params) triples as OpenQASM.
+
+    Measurements write to the classical bit given by their single param.
+    """
+    QasmWriter(file, n_qubits, n_clbits, version).write_operations(operations)
+
+
+@profiled
+def write_qasm_circuit(circuit, file_or_path, version=2):
+    """Writes a circuit as OpenQASM, the same way as qiskit's QuantumCircuit.qasm().
+
+    `circuit` is anything columnar.columnar_parts takes: a ColumnarCircuit, a
+    RepeatedCircuit (whose block is written once per repetition, without
+    unrolling it), an orquestra Circuit or a cirq Circuit. Paths ending with
+    .gz or .zip are compressed.
+    """
+    if isinstance(file_or_path, str):
+        from .cirq_json import open_circuit_file
+
+        with open_circuit_file(file_or_path, "w") as f:
+            return write_qasm_circuit(circuit, f, version)
+    parts = columnar_parts(circuit)
+    writer = QasmWriter(
+        file_or_path,
+        max([part.n_qubits for part, _ in parts], default=0),
+        max([len(part.measurement_keys) for part, _ in parts], default=0),
+        version,
+    )
+    for part, repetitions in parts:
+        for _ in range(repetitions):
+            writer.write_columnar(part)
+
+
+def _evaluate_param(expression):
+    def evaluate(node):
+        if isinstance(node, ast.Expression):
+            return evaluate(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name) and node.id == "pi":
+            return np.pi
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = evaluate(node.operand)
+            return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            return _BINARY_OPERATORS[type(node.op)](
+                evaluate(node.left), evaluate(node.right)
+            )
+        raise ValueError(f"Cannot evaluate QASM parameter {expression}.")
+
+    return float(evaluate(ast.parse(expression.replace("^", "**"), mode="eval")))
+
+
+class QasmReader:
+    """Iterates over the operations of an OpenQASM 2.0 file line by line.
+
+    Qubit registers are numbered consecutively in the order they're declared,
+    and `n_qubits` / `n_clbits` are updated as declarations are read.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.n_qubits = 0
+        self.n_clbits = 0
+        self._register_offsets = {}
+
+    def _index(self, argument):
+        match = _QUBIT_PATTERN.match(argument.strip())
+        if match is None:
+            raise ValueError(f"Cannot parse QASM argument {argument}.")
+        return self._register_offsets[match.group(1)] + int(match.group(2))
+
+    def __iter__(self):
+        for line in self.lines:
+            line = line.split("//")[0].strip()
+            if not line or line.startswith(("OPENQASM", "include", "barrier")):
+                continue
+            register = _REGISTER_PATTERN.match(line)
+            if register is not None:
+                kind, name, size = register.groups()
+                if kind == "q":
+                    self._register_offsets[name] = self.n_qubits
+                    self.n_qubits += int(size)
+                else:
+                    self._register_offsets[name] = self.n_clbits
+                    self.n_clbits += int(size)
+                continue
+            operation = _OPERATION_PATTERN.match(line)
+            if operation is None:
+                raise ValueError(f"Cannot parse QASM line {line}.")
+            qasm_name, params, arguments = operation.groups()
+            try:
+                gate_name = GATE_NAMES_FROM_QASM[qasm_name]
+            except KeyError:
+                raise ValueError(f"QASM gate {qasm_name} is not supported.")
+            if gate_name == "MEASURE":
+                qubit, clbit = arguments.split("->")
+                yield gate_name, (self._index(qubit),), (float(self._index(clbit)),)
+                continue
+            yield (
+                gate_name,
+                tuple(self._index(argument) for argument in arguments.split(",")),
+                tuple(_evaluate_param(param) for param in params.split(","))
+                if params
+                else (),
+            )
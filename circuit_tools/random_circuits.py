@@ -0,0 +1,244 @@
+"""Seeded random Clifford + Toffoli circuits of any size.
+
+The test circuits of 2022_10_3_Zapata_Toffoli_test_circuits used to be drawn
+one gate at a time with `random.sample` and built as a cirq Circuit. Here the
+gates and their qubits are drawn in bulk with a NumPy generator, a chunk of
+operations at a time, into columnar arrays, so circuits with millions of
+gates are generated in seconds and written without ever being held in memory
+as cirq objects. The same seed always gives the same circuit.
+
+Every operation is a Toffoli with probability `toffoli_fraction`, and
+otherwise one of `clifford_gates`, drawn uniformly. Its qubits are distinct
+and drawn uniformly from all qubits or, with `locality`, from a window of that
+many consecutive qubits placed uniformly on the line. A one qubit gate acts
+on what would have been the first qubit of the Toffoli, like in the original
+script.
+"""
+import re
+
+import numpy as np
+
+from .cirq_json import CirqJsonWriter, open_circuit_file, operation_text
+from .columnar import MAX_QUBITS_PER_OPERATION, OPCODES, ColumnarCircuit
+from .instrumentation import profiled
+
+DEFAULT_TOFFOLI_FRACTION = 0.5
+DEFAULT_CLIFFORD_GATES = ("H",)
+CLIFFORD_GATE_ARITIES = {
+    "X": 1,
+    "Y": 1,
+    "Z": 1,
+    "H": 1,
+    "S": 1,
+    "S_DAG": 1,
+    "CNOT": 2,
+    "CZ": 2,
+    "SWAP": 2,
+}
+_GATE_ARITIES = {**CLIFFORD_GATE_ARITIES, "T": 1, "T_DAG": 1, "TOFFOLI": 3}
+# Operations drawn at once. Fixed, since the circuit of a seed depends on it.
+_CHUNK_SIZE = 1 << 16
+
+
+def _check_arguments(n_qubits, toffoli_fraction, clifford_gates, locality):
+    unknown_gates = set(clifford_gates) - set(CLIFFORD_GATE_ARITIES)
+    if unknown_gates:
+        raise ValueError(f"Unsupported Clifford gates {sorted(unknown_gates)}.")
+    if not clifford_gates and toffoli_fraction < 1:
+        raise ValueError("Clifford gates are needed for a Toffoli fraction below 1.")
+    if not 0 <= toffoli_fraction <= 1:
+        raise ValueError("The Toffoli fraction must be between 0 and 1.")
+    window = n_qubits if locality is None else min(locality, n_qubits)
+    arity = max(
+        [CLIFFORD_GATE_ARITIES[gate_name] for gate_name in clifford_gates]
+        + [3 if toffoli_fraction > 0 else 1]
+    )
+    if window < arity:
+        raise ValueError(
+            f"Gates on {arity} qubits need a window of at least {arity} qubits."
+        )
+    return window, arity
+
+
+def _distinct_qubits(rng, n_operations, n_qubits, window, arity):
+    # Each qubit of an operation is drawn from the qubits of its window which
+    # are left, and shifted past those drawn before it in increasing order
+    drawn = np.empty((n_operations, 0), dtype=np.int64)
+    for position in range(arity):
+        qubit = rng.integers(window - position, size=n_operations)
+        for previous in np.sort(drawn, axis=1).T:
+            qubit += qubit >= previous
+        drawn = np.column_stack([drawn, qubit])
+    starts = rng.integers(n_qubits - window + 1, size=n_operations)
+    qubits = np.full((n_operations, MAX_QUBITS_PER_OPERATION), -1, dtype=np.int32)
+    qubits[:, :arity] = drawn + starts[:, None]
+    return qubits
+
+
+def random_circuit_chunks(
+    n_qubits,
+    n_gates,
+    toffoli_fraction=DEFAULT_TOFFOLI_FRACTION,
+    clifford_gates=DEFAULT_CLIFFORD_GATES,
+    locality=None,
+    seed=None,
+):
+    """Yields the random circuit as consecutive ColumnarCircuits.
+
+    With `seed=None` the circuit is different every time; pass an integer
+    (e.g. one from `np.random.SeedSequence().entropy`) to reproduce it.
+    """
+    window, arity = _check_arguments(
+        n_qubits, toffoli_fraction, clifford_gates, locality
+    )
+    rng = np.random.default_rng(seed)
+    clifford_opcodes = np.array(
+        [OPCODES[gate_name] for gate_name in clifford_gates], dtype=np.uint8
+    )
+    clifford_arities = np.array(
+        [CLIFFORD_GATE_ARITIES[gate_name] for gate_name in clifford_gates]
+    )
+    for start in range(0, n_gates, _CHUNK_SIZE):
+        n_operations = min(_CHUNK_SIZE, n_gates - start)
+        is_toffoli = rng.random(n_operations) < toffoli_fraction
+        opcodes = np.full(n_operations, OPCODES["TOFFOLI"], dtype=np.uint8)
+        arities = np.full(n_operations, 3)
+        if len(clifford_gates):
+            clifford = rng.integers(len(clifford_gates), size=n_operations)
+            opcodes[~is_toffoli] = clifford_opcodes[clifford[~is_toffoli]]
+            arities[~is_toffoli] = clifford_arities[clifford[~is_toffoli]]
+        qubits = _distinct_qubits(rng, n_operations, n_qubits, window, arity)
+        qubits[np.arange(MAX_QUBITS_PER_OPERATION) >= arities[:, None]] = -1
+        yield ColumnarCircuit(
+            opcodes, qubits, np.full(n_operations, np.nan), n_qubits=n_qubits
+        )
+
+
+def random_circuit(
+    n_qubits,
+    n_gates,
+    toffoli_fraction=DEFAULT_TOFFOLI_FRACTION,
+    clifford_gates=DEFAULT_CLIFFORD_GATES,
+    locality=None,
+    seed=None,
+):
+    """The circuit of `random_circuit_chunks` as a single ColumnarCircuit."""
+    chunks = list(
+        random_circuit_chunks(
+            n_qubits, n_gates, toffoli_fraction, clifford_gates, locality, seed
+        )
+    )
+    if not chunks:
+        return ColumnarCircuit.from_operations([], n_qubits=n_qubits)
+    return ColumnarCircuit.concatenate(chunks)
+
+
+def _operation_formats():
+    # The text of each gate on LineQubits 0, 1 and 2, as a format string with
+    # the indices of its qubits as fields
+    formats = {}
+    for gate_name, arity in _GATE_ARITIES.items():
+        circuit = ColumnarCircuit.from_operations(
+            [(gate_name, tuple(range(arity)), ())], n_qubits=arity
+        )
+        (operation,) = circuit.iter_cirq_operations()
+        text = operation_text(operation).replace("{", "{{").replace("}", "}}")
+        formats[OPCODES[gate_name]] = re.sub(r'"x": ([0-2])\b', r'"x": {\1}', text)
+    return formats
+
+
+def _write_cirq_json_moments(chunks, used, file):
+    # Writes the operations of the chunks in the moments of cirq.Circuit, which
+    # are only over the used qubits, each moment as soon as they are all past it
+    formats = {
+        opcode: operation_format.format
+        for opcode, operation_format in _operation_formats().items()
+    }
+    writer = CirqJsonWriter(file)
+    used = np.flatnonzero(used).tolist()
+    frontier = [0] * (1 + max(used, default=-1))
+    pending = {}
+    for chunk in chunks:
+        opcodes = chunk.opcodes.tolist()
+        for opcode, qubits in zip(opcodes, chunk.qubits.tolist()):
+            if qubits[-1] < 0:
+                qubits = qubits[: qubits.index(-1)]
+            moment = max([frontier[qubit] for qubit in qubits])
+            for qubit in qubits:
+                frontier[qubit] = moment + 1
+            texts = pending.get(moment)
+            if texts is None:
+                texts = pending[moment] = []
+            texts.append(formats[opcode](*qubits))
+        for moment in range(writer.n_moments, min(frontier[qubit] for qubit in used)):
+            writer.write_operation_texts(pending.pop(moment))
+    for moment in sorted(pending):
+        writer.write_operation_texts(pending[moment])
+    writer.close()
+
+
+@profiled
+def write_random_circuit(
+    path,
+    n_qubits,
+    n_gates,
+    toffoli_fraction=DEFAULT_TOFFOLI_FRACTION,
+    clifford_gates=DEFAULT_CLIFFORD_GATES,
+    locality=None,
+    seed=None,
+    decomposition=None,
+    n_ancilla_sets=1,
+):
+    """Generates a random circuit into a file, a chunk at a time.
+
+    Paths ending with `.npcircuit` are columnar files, with `.qasm` or `.txt`
+    QASM and otherwise cirq JSON (compressed if they end with .gz or .zip),
+    with the same text as cirq would write. With a `decomposition` of
+    toffoli.DECOMPOSITIONS the Toffolis are decomposed into Clifford + T as
+    they are written (see toffoli.ToffoliDecomposer for `n_ancilla_sets`).
+    Returns the same summary as resources.count_resources for the written
+    circuit.
+    """
+    from .columnar import COLUMNAR_EXTENSION
+    from .qasm import QasmWriter
+    from .resources import ResourceCounter
+    from .toffoli import ToffoliDecomposer
+
+    if seed is None:
+        # Drawn here, since the circuit may be generated twice
+        seed = np.random.SeedSequence().entropy
+    arguments = (n_qubits, n_gates, toffoli_fraction, clifford_gates, locality, seed)
+    counter = ResourceCounter()
+
+    def output_chunks():
+        if decomposition is None:
+            yield from random_circuit_chunks(*arguments)
+            return
+        decomposer = ToffoliDecomposer(n_qubits, decomposition, n_ancilla_sets)
+        for chunk in random_circuit_chunks(*arguments):
+            yield decomposer.decompose_chunk(chunk)
+
+    def counted_chunks():
+        for chunk in output_chunks():
+            counter.add_columnar(chunk)
+            yield chunk
+
+    if path.endswith(COLUMNAR_EXTENSION):
+        ColumnarCircuit.concatenate(list(counted_chunks())).save(path)
+        return counter.summary()
+    n_written_qubits = n_qubits
+    if decomposition is not None:
+        decomposer = ToffoliDecomposer(n_qubits, decomposition, n_ancilla_sets)
+        n_written_qubits += decomposer.n_ancillas
+    with open_circuit_file(path, "w") as f:
+        if path.endswith((".qasm", ".txt")):
+            writer = QasmWriter(f, n_written_qubits)
+            for chunk in counted_chunks():
+                writer.write_columnar(chunk)
+        else:
+            # The used qubits are found by generating the circuit beforehand
+            used = np.zeros(n_written_qubits, dtype=bool)
+            for chunk in output_chunks():
+                used[chunk.qubits[chunk.qubits >= 0]] = True
+            _write_cirq_json_moments(counted_chunks(), used, f)
+    return counter.summary()
@@ -0,0 +1,259 @@
+"""Single pass resource counting over streams of operations.
+
+The counter keeps, for every qubit, the depth and T-depth of the last layer
+touching it, so memory is constant per qubit and the circuit never has to be
+built. Operations can come from orquestra circuits, RepeatedCircuits, cirq
+circuits, columnar circuits or circuit files.
+"""
+import json
+import os
+from collections import Counter
+
+T_GATE_NAMES = ("T", "T_DAG")
+RESOURCES_SUFFIX = ".resources.json"
+_CIRCUIT_EXTENSIONS = (".json.gz", ".json.zip", ".json", ".qasm", ".txt", ".npcircuit")
+_CHUNK_SIZE = 1 << 16
+
+
+class ResourceCounter:
+    """Gate histogram, T-count, CNOT count, depth and T-depth of a circuit.
+
+    Depth is the number of layers the circuit needs when every gate is placed
+    as early as possible (the number of moments of the cirq circuit), and
+    T-depth is the largest number of T gates on any path through the circuit.
+    """
+
+    def __init__(self):
+        self.gate_counts = Counter()
+        self.depth = 0
+        self.t_depth = 0
+        self._depth_frontier = {}
+        self._t_depth_frontier = {}
+
+    def add(self, gate_name, qubits):
+        depth_frontier = self._depth_frontier
+        t_depth_frontier = self._t_depth_frontier
+        depth = 1 + max((depth_frontier.get(qubit, 0) for qubit in qubits), default=0)
+        t_depth = max((t_depth_frontier.get(qubit, 0) for qubit in qubits), default=0)
+        if gate_name in T_GATE_NAMES:
+            t_depth += 1
+        for qubit in qubits:
+            depth_frontier[qubit] = depth
+            t_depth_frontier[qubit] = t_depth
+        self.depth = max(self.depth, depth)
+        self.t_depth = max(self.t_depth, t_depth)
+        self.gate_counts[gate_name] += 1
+
+    def add_operations(self, operations):
+        """Adds (gate name, qubits, ...) tuples; anything after qubits is ignored."""
+        for operation in operations:
+            self.add(operation[0], operation[1])
+        return self
+
+    def add_columnar(self, circuit):
+        """Adds the operations of a ColumnarCircuit, a chunk at a time.
+
+        Same as `add_operations(circuit.iter_operations())`, several times
+        faster: the gates are counted on the opcode array, and the depths are
+        updated from plain lists of qubits.
+        """
+        import numpy as np
+
+        from .columnar import OPCODES
+
+        t_opcodes = [OPCODES[gate_name] for gate_name in T_GATE_NAMES]
+        depth_frontier = self._depth_frontier
+        t_depth_frontier = self._t_depth_frontier
+        max_depth = self.depth
+        max_t_depth = self.t_depth
+        for start in range(0, len(circuit), _CHUNK_SIZE):
+            stop = start + _CHUNK_SIZE
+            qubits = np.asarray(circuit.qubits[start:stop]).tolist()
+            is_t = np.isin(circuit.opcodes[start:stop], t_opcodes).tolist()
+            for operation_qubits, is_t_gate in zip(qubits, is_t):
+                if operation_qubits[-1] < 0:
+                    operation_qubits = operation_qubits[: operation_qubits.index(-1)]
+                depth = 1 + max(
+                    [depth_frontier.get(qubit, 0) for qubit in operation_qubits],
+                    default=0,
+                )
+                t_depth = is_t_gate + max(
+                    [t_depth_frontier.get(qubit, 0) for qubit in operation_qubits],
+                    default=0,
+                )
+                for qubit in operation_qubits:
+                    depth_frontier[qubit] = depth
+                    t_depth_frontier[qubit] = t_depth
+                if depth > max_depth:
+                    max_depth = depth
+                if t_depth > max_t_depth:
+                    max_t_depth = t_depth
+        self.depth = max_depth
+        self.t_depth = max_t_depth
+        self.gate_counts.update(circuit.gate_counts())
+        return self
+
+    def summary(self):
+        return {
+            "n_qubits": len(self._depth_frontier),
+            "n_operations": sum(self.gate_counts.values()),
+            "t_count": sum(self.gate_counts[name] for name in T_GATE_NAMES),
+            "cnot_count": self.gate_counts["CNOT"],
+            "depth": self.depth,
+            "t_depth": self.t_depth,
+            "gate_counts": dict(sorted(self.gate_counts.items())),
+        }
+
+
+def _orquestra_gate_name(gate):
+    from .columnar import encode_orquestra_gate
+
+    try:
+        return encode_orquestra_gate(gate)[0]
+    except ValueError:
+        return gate.name
+
+
+def _iter_orquestra_operations(operations):
+    gate_names = {}
+    for operation in operations:
+        gate_name = gate_names.get(operation.gate)
+        if gate_name is None:
+            gate_name = gate_names[operation.gate] = _orquestra_gate_name(operation.gate)
+        yield gate_name, operation.qubit_indices
+
+
+def _cirq_gate_name(gate):
+    import cirq
+
+    from .columnar import encode_cirq_gate
+
+    if isinstance(gate, cirq.MeasurementGate):
+        return "MEASURE"
+    try:
+        return encode_cirq_gate(gate)[0]
+    except ValueError:
+        return str(gate)
+
+
+def _iter_cirq_operations(operations, gate_names=None):
+    import cirq
+
+    if gate_names is None:
+        gate_names = {}
+    for operation in operations:
+        if isinstance(operation.untagged, cirq.CircuitOperation):
+            yield from _iter_circuit_operation(operation.untagged, gate_names)
+            continue
+        gate_name = gate_names.get(operation.gate)
+        if gate_name is None:
+            gate_name = gate_names[operation.gate] = _cirq_gate_name(operation.gate)
+        yield gate_name, operation.qubits
+
+
+def _iter_circuit_operation(operation, gate_names):
+    # The operations of the subcircuit on the qubits they are mapped to (its
+    # inverse for negative repetitions), expanded once and repeated like the
+    # block of a RepeatedCircuit
+    single = operation.replace(
+        repetitions=1 if operation.repetitions > 0 else -1, repetition_ids=None
+    )
+    block_operations = list(
+        _iter_cirq_operations(
+            single.mapped_circuit(deep=False).all_operations(), gate_names
+        )
+    )
+    for _ in range(abs(operation.repetitions)):
+        yield from block_operations
+
+
+def iter_operations(source):
+    """Yields (gate name, qubits) for the operations of any supported source.
+
+    `source` can be an orquestra Circuit, a RepeatedCircuit (whose block is
+    repeated on the fly, between its prefix and suffix), a cirq Circuit (with
+    its CircuitOperations expanded), a ColumnarCircuit or the path of a circuit
+    file. QASM, cirq JSON and columnar files are read incrementally.
+    """
+    from .columnar import COLUMNAR_EXTENSION, ColumnarCircuit
+
+    if isinstance(source, str):
+        if source.endswith(COLUMNAR_EXTENSION):
+            yield from ColumnarCircuit.load(source).iter_operations()
+            return
+        from .cirq_json import open_circuit_file
+
+        with open_circuit_file(source) as f:
+            if source.endswith((".qasm", ".txt")):
+                from .qasm import QasmReader
+
+                yield from QasmReader(f)
+            else:
+                from .cirq_json import CirqJsonReader
+
+                reader = CirqJsonReader(
+                    f, encode_gate=lambda gate: (_cirq_gate_name(gate), ())
+                )
+                for gate_name, qubits, _ in reader:
+                    yield gate_name, qubits
+    elif isinstance(source, ColumnarCircuit):
+        yield from source.iter_operations()
+    elif hasattr(source, "all_operations"):
+        yield from _iter_cirq_operations(source.all_operations())
+    elif hasattr(source, "repetitions"):
+        yield from _iter_orquestra_operations(source.prefix.operations)
+        block_operations = list(_iter_orquestra_operations(source.block.operations))
+        for _ in range(source.repetitions):
+            yield from block_operations
+        yield from _iter_orquestra_operations(source.suffix.operations)
+    else:
+        yield from _iter_orquestra_operations(source.operations)
+
+
+def count_resources(source):
+    """Resource summary (see ResourceCounter) of any source `iter_operations` takes."""
+    from .columnar import COLUMNAR_EXTENSION, ColumnarCircuit
+
+    if isinstance(source, str) and source.endswith(COLUMNAR_EXTENSION):
+        source = ColumnarCircuit.load(source)
+    # Checked by attributes, like in columnar.columnar_parts
+    if hasattr(source, "opcodes"):
+        return ResourceCounter().add_columnar(source).summary()
+    return ResourceCounter().add_operations(iter_operations(source)).summary()
+
+
+def resource_summary_path(circuit_path):
+    for extension in _CIRCUIT_EXTENSIONS:
+        if circuit_path.endswith(extension):
+            return circuit_path[: -len(extension)] + RESOURCES_SUFFIX
+    return circuit_path + RESOURCES_SUFFIX
+
+
+def write_resource_summary(summary, circuit_path):
+    """Saves a summary next to the circuit file it describes and returns its path."""
+    path = resource_summary_path(circuit_path)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+        f.write("\n")
+    return path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Count gates, T-count, depth and T-depth of circuit files and save the "
+            f"summaries next to them as <name>{RESOURCES_SUFFIX}."
+        )
+    )
+    parser.add_argument("circuit_paths", nargs="+")
+    args = parser.parse_args()
+    for circuit_path in args.circuit_paths:
+        summary = count_resources(circuit_path)
+        print(f"{os.path.basename(circuit_path)}: {summary}")
+        write_resource_summary(summary, circuit_path)
+
+
+if __name__ == "__main__":
+    main()
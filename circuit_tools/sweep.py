@@ -0,0 +1,326 @@
+"""Parameter sweeps run as a DAG of stages, in parallel and incrementally.
+
+A generating script adds a stage for each step of its pipeline (Hamiltonian,
+controlled Hamiltonian, Trotter circuit, transpiled circuit, ..., saved file),
+passing the stages it depends on as arguments. Stages are identified by the
+digest of their code and inputs (see `circuit_tools.artifacts`), so equal
+stages are only added once: the Hamiltonians for every point of a (size,
+time, precision, ...) grid are computed once per model. With an ArtifactStore,
+results are also kept between runs and only stale stages are recomputed.
+
+Stages without dependencies and stages shared by several leaves run in the
+main process, where they can use the on-disk caches; the others are spread
+over a process pool as soon as their inputs are ready.
+"""
+import argparse
+import inspect
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack, nullcontext
+
+from . import instrumentation
+from .artifacts import stage_digest
+
+
+class Stage:
+    """A call of `function`; Stage arguments are replaced by their results."""
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.dependencies = [
+            argument
+            for argument in list(args) + list(kwargs.values())
+            if isinstance(argument, Stage)
+        ]
+        self.key = stage_digest(function, args, kwargs)
+
+    def fingerprint(self):
+        return ["Stage", self.key]
+
+    def __repr__(self):
+        return f"Stage({self.function.__qualname__}, {self.key[:12]})"
+
+
+def _resolve(argument, results):
+    return results[argument.key] if isinstance(argument, Stage) else argument
+
+
+def _resource_names(stage, resources):
+    # Arguments given explicitly, e.g. a HamiltonianCache as `cache`, take
+    # precedence over resources of the same name
+    try:
+        parameters = inspect.signature(stage.function).parameters
+    except (TypeError, ValueError):
+        return []
+    return [
+        name for name in parameters if name in resources and name not in stage.kwargs
+    ]
+
+
+def _call(function, args, kwargs):
+    # With instrumentation enabled, the profile of the call (see
+    # instrumentation.profile_call) is returned along with its result
+    if not instrumentation.ENABLED:
+        return function(*args, **kwargs), None
+    return instrumentation.profile_call(function, args, kwargs)
+
+
+def _resource_stats(opened_resources):
+    # Statistics of the resources which keep some, such as GridsynthCache
+    return {
+        name: value.stats()
+        for name, value in opened_resources.items()
+        if callable(getattr(value, "stats", None))
+    }
+
+
+def _run_stage(function, args, kwargs, resources):
+    # Resources are opened for this call only, since worker processes never
+    # get the chance to close them at exit. Their statistics are returned
+    # along with the result, for the main process to report.
+    with ExitStack() as exit_stack:
+        opened_resources = {
+            name: exit_stack.enter_context(resource())
+            for name, resource in resources.items()
+        }
+        kwargs.update(opened_resources)
+        result, profile = _call(function, args, kwargs)
+    return result, profile, _resource_stats(opened_resources)
+
+
+def _ancestors(stage):
+    # The stage and all the stages it depends on, directly or not
+    ancestors = {}
+    stack = [stage]
+    while stack:
+        stage = stack.pop()
+        if stage.key not in ancestors:
+            ancestors[stage.key] = stage
+            stack.extend(stage.dependencies)
+    return ancestors
+
+
+class Sweep:
+    def __init__(self):
+        self.stages = {}
+        # Statistics of the resources used by the last run, by resource name
+        self.resource_stats = {}
+
+    def stage(self, function, *args, **kwargs):
+        """Adds `function(*args, **kwargs)`, or returns the equal stage already added."""
+        stage = Stage(function, args, kwargs)
+        return self.stages.setdefault(stage.key, stage)
+
+    def leaves(self):
+        dependencies = {
+            dependency.key
+            for stage in self.stages.values()
+            for dependency in stage.dependencies
+        }
+        return [stage for key, stage in self.stages.items() if key not in dependencies]
+
+    def _main_process_stages(self, leaves):
+        n_leaves = {}
+        for leaf in leaves:
+            for key in _ancestors(leaf):
+                n_leaves[key] = n_leaves.get(key, 0) + 1
+        return {
+            key
+            for key, stage in self.stages.items()
+            if not stage.dependencies or n_leaves.get(key, 0) > 1
+        }
+
+    def run(self, jobs=1, resources=None, store=None, rebuild=False):
+        """Runs the stages which are needed and returns the results of the leaves.
+
+        `resources` maps keyword argument names to functions returning context
+        managers, such as GridsynthCache; a stage whose function takes an
+        argument of that name gets the value of the context manager. Stage
+        results are looked up in and saved to `store` (an ArtifactStore), so
+        only the stages missing from it, and the ones depending on them, are
+        run; with `rebuild` every stage runs. With `jobs` > 1 stages run in a
+        pool of that many processes, each opening its own resources per stage,
+        so stage functions, their arguments and `resources` must be picklable.
+
+        Resources with a `stats()` method leave the statistics of every
+        instance opened in `resource_stats`, e.g. `resource_stats["cache"]` is
+        the list of the GridsynthCache.stats() of the main process and of the
+        worker stages (see gridsynth.combine_cache_stats).
+
+        With instrumentation enabled (see circuit_tools.instrumentation), the
+        report of every leaf which wrote files, covering the stages run for
+        it, is saved next to the first of them.
+        """
+        resources = resources or {}
+        leaves = self.leaves()
+        results = {}
+        scheduled = set()
+        # Stages to run, after the stages they depend on
+        remaining = []
+
+        def require(stage):
+            if stage.key in results or stage.key in scheduled:
+                return
+            if store is not None and not rebuild:
+                found, result = store.get(stage.key)
+                if found:
+                    results[stage.key] = result
+                    return
+            for dependency in stage.dependencies:
+                require(dependency)
+            scheduled.add(stage.key)
+            remaining.append(stage)
+
+        for leaf in leaves:
+            require(leaf)
+
+        # Profiles of the stages run, in order
+        profiles = {}
+        self.resource_stats = {}
+
+        def add_resource_stats(stats):
+            for name, resource_stats in stats.items():
+                self.resource_stats.setdefault(name, []).append(resource_stats)
+
+        def finish(stage, result, profile=None, stats=None):
+            results[stage.key] = result
+            if store is not None:
+                store.put(stage.key, result)
+            if profile is not None:
+                profiles[stage.key] = profile
+            if stats:
+                add_resource_stats(stats)
+
+        main_process_stages = self._main_process_stages(leaves)
+        pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else nullcontext()
+        with ExitStack() as exit_stack, pool as executor:
+            opened_resources = {}
+            running = {}
+            while remaining or running:
+                ran_stage = False
+                for stage in list(remaining):
+                    if any(
+                        dependency.key not in results
+                        for dependency in stage.dependencies
+                    ):
+                        continue
+                    remaining.remove(stage)
+                    args = [_resolve(argument, results) for argument in stage.args]
+                    kwargs = {
+                        name: _resolve(value, results)
+                        for name, value in stage.kwargs.items()
+                    }
+                    names = _resource_names(stage, resources)
+                    if executor is None or stage.key in main_process_stages:
+                        for name in names:
+                            if name not in opened_resources:
+                                opened_resources[name] = exit_stack.enter_context(
+                                    resources[name]()
+                                )
+                            kwargs[name] = opened_resources[name]
+                        finish(stage, *_call(stage.function, args, kwargs))
+                        ran_stage = True
+                    else:
+                        future = executor.submit(
+                            _run_stage,
+                            stage.function,
+                            args,
+                            kwargs,
+                            {name: resources[name] for name in names},
+                        )
+                        running[future] = stage
+                if not ran_stage and running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(running.pop(future), *future.result())
+            add_resource_stats(_resource_stats(opened_resources))
+        if instrumentation.ENABLED:
+            self._write_reports(leaves, results, profiles)
+        return [results[leaf.key] for leaf in leaves]
+
+    def _write_reports(self, leaves, results, profiles):
+        for leaf in leaves:
+            paths = getattr(results[leaf.key], "paths", None)
+            if not paths:
+                continue
+            ancestors = _ancestors(leaf)
+            stage_profiles = [
+                profile for key, profile in profiles.items() if key in ancestors
+            ]
+            if stage_profiles:
+                instrumentation.write_report(
+                    instrumentation.report(stage_profiles), paths[0]
+                )
+
+
+def _number(text):
+    # Keeps integers as ints, since the values end up in the file names
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def lattice_size(text):
+    """Parses a lattice size given as e.g. 4x4 into (4, 4)."""
+    return tuple(int(dimension) for dimension in text.lower().split("x"))
+
+
+def parse_sweep_arguments(
+    description,
+    times,
+    precisions,
+    sizes=None,
+    synthesis_accuracies=None,
+    size_type=int,
+    term_order=None,
+):
+    """Command line options of a generating script's sweep.
+
+    Every option takes one or more values, and defaults to the values given
+    here, so that running the script without options generates the circuits
+    in its directory. Options for sizes, synthesis accuracies and the term
+    order of Trotter steps only exist if defaults are given for them.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--time", nargs="+", type=_number, default=times)
+    parser.add_argument("--precision", nargs="+", type=_number, default=precisions)
+    if sizes is not None:
+        parser.add_argument("--size", nargs="+", type=size_type, default=sizes)
+    if synthesis_accuracies is not None:
+        parser.add_argument(
+            "--synthesis-accuracy",
+            nargs="+",
+            type=_number,
+            default=synthesis_accuracies,
+        )
+    if term_order is not None:
+        parser.add_argument(
+            "--term-order",
+            choices=["ladder", "hamiltonian"],
+            default=term_order,
+            help="order of the terms in Trotter steps: sorted so that CNOT ladders "
+            "cancel and rotations merge across steps, or as in the Hamiltonian",
+        )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help=f"number of circuits generated in parallel (up to {os.cpu_count()})",
+    )
+    parser.add_argument(
+        "--trotter-steps",
+        choices=["time", "commutator"],
+        default="time",
+        help="number of Trotter steps as time**2 / error regardless of the "
+        "Hamiltonian (default, as for the committed circuits), or from the "
+        "commutator bound of the Hamiltonian",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="recompute every stage instead of reusing stored artifacts",
+    )
+    return parser.parse_args()
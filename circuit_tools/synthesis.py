@@ -0,0 +1,838 @@
+"""Clifford + T approximations of Z rotations without the gridsynth binary.
+
+The algorithm is the one of Ross and Selinger (arXiv:1403.2975), which
+gridsynth implements. RZ(angle) is approximated by a unitary
+
+    U = 1 / sqrt(2)^k [[v, -w^dagger], [w, v^dagger]]
+
+with v and w in Z[omega], omega = exp(i pi / 4), which Clifford + T circuits
+with k T gates at most implement exactly. For k = 0, 1, 2, ...
+
+1. The candidates for v are the points of Z[omega] in the region around
+   sqrt(2)^k exp(-i angle / 2) where the error is below the accuracy, whose
+   conjugates (sqrt(2) -> -sqrt(2)) lie in the disk of radius sqrt(2)^k. They
+   are lattice points of Z^4 in a thin convex body, found by enumerating the
+   points of an LLL-reduced lattice in a ball around it (instead of the grid
+   operators of the paper), pruned by the disks bounding the body.
+2. w solves the norm equation w^dagger w = 2^k - v^dagger v. Solving it needs
+   the factors of an integer, and candidates whose factors aren't found
+   quickly are skipped.
+3. U is split into H and T gates by lowering the denominator exponent of its
+   entries one gate at a time (Kliuchnikov, Maslov and Mosca, arXiv:1206.5236).
+
+The T-counts are close to those of gridsynth, about 3 log2(1 / accuracy);
+`python -m circuit_tools.synthesis` compares T-counts and latency with the
+binary. mpmath, which cirq's sympy dependency brings in, provides the precision
+needed for small accuracies.
+"""
+import math
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import mpmath
+import numpy as np
+
+from .columnar import OPCODES
+
+# Elements of Z[sqrt(2)] are pairs (m, n) for m + n sqrt(2), and elements of
+# Z[omega] are tuples (a, b, c, d) for a + b omega + c omega^2 + d omega^3
+_ONE = (1, 0, 0, 0)
+_ZERO = (0, 0, 0, 0)
+_ROOT_TWO = (0, 1, 0, -1)
+# 1 + omega, whose norm is sqrt(2) times a unit
+_DELTA = (1, 1, 0, 0)
+# 1 + sqrt(2), the fundamental unit of Z[sqrt(2)]
+_LAMBDA = (1, 1)
+_LAMBDA_INVERSE = (-1, 1)
+
+
+def _primes_below(n):
+    sieve = np.ones(n, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, math.isqrt(n) + 1):
+        if sieve[p]:
+            sieve[p * p :: p] = False
+    return np.flatnonzero(sieve).tolist()
+
+
+_SMALL_PRIMES = _primes_below(1 << 12)
+_POLLARD_RHO_ITERATIONS = 1 << 14
+# Denominator exponents tried beyond the expected one before giving up
+_EXTRA_DENOMINATOR_EXPONENTS = 40
+# Stretch of the ellipse containing the circular segment along its height
+_ELLIPSE_STRETCH = math.sqrt(2)
+# Relative difference up to which angles count as multiples of pi / 4
+_EXACT_ANGLE_TOLERANCE = 1e-12
+
+
+def _root_two_mul(x, y):
+    return (x[0] * y[0] + 2 * x[1] * y[1], x[0] * y[1] + x[1] * y[0])
+
+
+def _root_two_sub(x, y):
+    return (x[0] - y[0], x[1] - y[1])
+
+
+def _root_two_bullet(x):
+    return (x[0], -x[1])
+
+
+def _root_two_norm(x):
+    return x[0] * x[0] - 2 * x[1] * x[1]
+
+
+def _rounded_division(a, b):
+    if b < 0:
+        a, b = -a, -b
+    return (2 * a + b) // (2 * b)
+
+
+def _root_two_divmod(x, y):
+    norm = _root_two_norm(y)
+    numerator = _root_two_mul(x, _root_two_bullet(y))
+    quotient = tuple(_rounded_division(part, norm) for part in numerator)
+    return quotient, _root_two_sub(x, _root_two_mul(quotient, y))
+
+
+def _root_two_gcd(x, y):
+    while y != (0, 0):
+        x, y = y, _root_two_divmod(x, y)[1]
+    return x
+
+
+def _omega_mul(x, y):
+    a, b, c, d = x
+    e, f, g, h = y
+    return (
+        a * e - b * h - c * g - d * f,
+        a * f + b * e - c * h - d * g,
+        a * g + b * f + c * e - d * h,
+        a * h + b * g + c * f + d * e,
+    )
+
+
+def _omega_add(x, y):
+    return tuple(p + q for p, q in zip(x, y))
+
+
+def _omega_sub(x, y):
+    return tuple(p - q for p, q in zip(x, y))
+
+
+def _adjoint(x):
+    # omega^dagger = omega^7 = -omega^3
+    return (x[0], -x[3], -x[2], -x[1])
+
+
+def _omega_bullet(x):
+    # sqrt(2) -> -sqrt(2) maps omega to -omega
+    return (x[0], -x[1], x[2], -x[3])
+
+
+def _omega_power(x, exponent):
+    result = _ONE
+    for _ in range(exponent):
+        result = _omega_mul(result, x)
+    return result
+
+
+def _from_root_two(x):
+    # sqrt(2) = omega - omega^3
+    return (x[0], x[1], 0, -x[1])
+
+
+def _to_root_two(x):
+    # Inverse of _from_root_two, for real elements of Z[omega]
+    return (x[0], x[1])
+
+
+def _norm_squared(x):
+    """x^dagger x as an element of Z[sqrt(2)]."""
+    return _to_root_two(_omega_mul(_adjoint(x), x))
+
+
+def _omega_divmod(x, y):
+    # Divides by the integer norm |y|^2 |y.|^2 after multiplying by its cofactor
+    cofactor = _omega_mul(
+        _adjoint(y), _from_root_two(_root_two_bullet(_norm_squared(y)))
+    )
+    norm = _root_two_norm(_norm_squared(y))
+    numerator = _omega_mul(x, cofactor)
+    quotient = tuple(_rounded_division(part, norm) for part in numerator)
+    return quotient, _omega_sub(x, _omega_mul(quotient, y))
+
+
+def _omega_gcd(x, y):
+    while y != _ZERO:
+        x, y = y, _omega_divmod(x, y)[1]
+    return x
+
+
+def _divide_by_root_two(x):
+    # x / sqrt(2) = x sqrt(2) / 2, or None if x isn't divisible by sqrt(2)
+    product = _omega_mul(x, _ROOT_TWO)
+    if any(part % 2 for part in product):
+        return None
+    return tuple(part // 2 for part in product)
+
+
+def _is_probable_prime(n):
+    if n < 2:
+        return False
+    for p in _SMALL_PRIMES[:12]:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    # Deterministic for n < 3.3 * 10^24, and extremely reliable beyond that
+    for a in _SMALL_PRIMES[:13]:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _pollard_rho(n, seed):
+    # A nontrivial factor of the composite n, or None if none is found quickly
+    rng = random.Random(seed)
+    c = rng.randrange(1, n)
+    x = y = rng.randrange(2, n)
+    factor = 1
+    for _ in range(_POLLARD_RHO_ITERATIONS):
+        x = (x * x + c) % n
+        y = (y * y + c) % n
+        y = (y * y + c) % n
+        factor = math.gcd(abs(x - y), n)
+        if factor != 1:
+            break
+    if factor in (1, n):
+        return None
+    return factor
+
+
+def _factorize(n):
+    """Prime factors of n with their multiplicities, or None if too hard to find."""
+    factors = {}
+    for p in _SMALL_PRIMES:
+        if p * p > n:
+            break
+        while n % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            n //= p
+    composites = [n] if n > 1 else []
+    while composites:
+        n = composites.pop()
+        if _is_probable_prime(n):
+            factors[n] = factors.get(n, 0) + 1
+            continue
+        root = math.isqrt(n)
+        factor = root if root * root == n else _pollard_rho(n, n)
+        if factor is None:
+            return None
+        composites += [factor, n // factor]
+    return factors
+
+
+def _sqrt_mod(a, p):
+    """A square root of the quadratic residue a modulo the odd prime p."""
+    a %= p
+    q, s = p - 1, 0
+    while q % 2 == 0:
+        q, s = q // 2, s + 1
+    z = 2
+    while pow(z, (p - 1) // 2, p) != p - 1:
+        z += 1
+    m, c, t, r = s, pow(z, q, p), pow(a, q, p), pow(a, (q + 1) // 2, p)
+    while t != 1:
+        i, t_power = 0, t
+        while t_power != 1:
+            t_power = t_power * t_power % p
+            i += 1
+        b = pow(c, 1 << (m - i - 1), p)
+        m, c, t, r = i, b * b % p, t * b * b % p, r * b % p
+    return r
+
+
+def _prime_multiplicity(x, prime):
+    # Number of times `prime` divides x in Z[sqrt(2)]
+    multiplicity = 0
+    while x != (0, 0):
+        quotient, remainder = _root_two_divmod(x, prime)
+        if remainder != (0, 0):
+            break
+        x = quotient
+        multiplicity += 1
+    return multiplicity
+
+
+def solve_norm_equation(xi):
+    """t in Z[omega] with t^dagger t = xi, or None if there's none (or it's too hard).
+
+    xi is an element (m, n) of Z[sqrt(2)] with xi >= 0 and xi. >= 0. The
+    equation is solved prime by prime, following the factors of the integer
+    norm xi xi. (Ross and Selinger, appendix C).
+    """
+    if xi == (0, 0):
+        return _ZERO
+    factors = _factorize(_root_two_norm(xi))
+    if factors is None:
+        return None
+    t = _ONE
+    for p, multiplicity in factors.items():
+        if p == 2:
+            factor = _omega_power(_DELTA, multiplicity)
+        elif p % 8 in (3, 5):
+            # p is prime in Z[sqrt(2)] and splits into conjugate primes in Z[omega]
+            if multiplicity % 2:
+                return None
+            if p % 8 == 3:
+                root = _sqrt_mod(-2, p)
+                gcd = _omega_gcd(
+                    (p, 0, 0, 0), _omega_add((root, 0, 0, 0), (0, 1, 0, 1))
+                )
+            else:
+                root = _sqrt_mod(-1, p)
+                gcd = _omega_gcd((p, 0, 0, 0), (root, 0, 1, 0))
+            factor = _omega_power(gcd, multiplicity // 2)
+        else:
+            # p = eta eta. splits in Z[sqrt(2)], and eta only splits further in
+            # Z[omega] if p = 1 (mod 8)
+            eta = _root_two_gcd((p, 0), (_sqrt_mod(2, p), 1))
+            eta_multiplicity = _prime_multiplicity(xi, eta)
+            multiplicities = (eta_multiplicity, multiplicity - eta_multiplicity)
+            if p % 8 == 7:
+                if multiplicities[0] % 2 or multiplicities[1] % 2:
+                    return None
+                root_factors = [
+                    _from_root_two(eta),
+                    _from_root_two(_root_two_bullet(eta)),
+                ]
+                multiplicities = [multiplicity // 2 for multiplicity in multiplicities]
+            else:
+                gcd = _omega_gcd(_from_root_two(eta), (_sqrt_mod(-1, p), 0, 1, 0))
+                root_factors = [gcd, _omega_bullet(gcd)]
+            factor = _omega_mul(
+                _omega_power(root_factors[0], multiplicities[0]),
+                _omega_power(root_factors[1], multiplicities[1]),
+            )
+        t = _omega_mul(t, factor)
+    # t^dagger t is xi times a unit which is positive with a positive
+    # conjugate, so an even power lambda^(2j) of the fundamental unit
+    unit, remainder = _root_two_divmod(xi, _norm_squared(t))
+    if remainder != (0, 0) or _root_two_norm(unit) != 1:
+        return None
+    if unit[1] > 0:
+        root, square = _LAMBDA, _root_two_mul(_LAMBDA_INVERSE, _LAMBDA_INVERSE)
+    else:
+        root, square = _LAMBDA_INVERSE, _root_two_mul(_LAMBDA, _LAMBDA)
+    sign = unit[1] > 0
+    while unit[1] != 0 and (unit[1] > 0) == sign:
+        unit = _root_two_mul(unit, square)
+        t = _omega_mul(t, _from_root_two(root))
+    if unit != (1, 0):
+        return None
+    return t
+
+
+def _root_two_sign(x):
+    # Sign of m + n sqrt(2), computed exactly
+    m, n = x
+    if m >= 0 and n >= 0:
+        return int(m > 0 or n > 0)
+    if m <= 0 and n <= 0:
+        return -1
+    if m > 0:
+        return 1 if m * m > 2 * n * n else -1
+    return 1 if 2 * n * n > m * m else -1
+
+
+def _root_two_valuation(x):
+    # Number of times sqrt(2) divides the nonzero x
+    valuation = 0
+    while x[0] % 2 == 0:
+        x = (x[1], x[0] // 2)
+        valuation += 1
+    return valuation
+
+
+def _orthogonalize(rows, center=None):
+    """Gram-Schmidt orthogonalization of `rows`, which may be linearly dependent.
+
+    Returns the squared norms of the orthogonalized rows (zero for rows in
+    the span of the previous ones), the coefficients mu[i][j] of row i along
+    orthogonalized row j, and the coefficients of `center` along them.
+    """
+    n = len(rows)
+    # Rows in the span of the previous ones are only zero up to rounding
+    tolerance = max(mpmath.fdot(row, row) for row in rows) * mpmath.eps ** 0.5
+    orthogonal = []
+    norms = []
+    mu = [[mpmath.mpf(0)] * n for _ in range(n)]
+    for i in range(n):
+        vector = rows[i]
+        for j in range(i):
+            if norms[j]:
+                mu[i][j] = mpmath.fdot(rows[i], orthogonal[j]) / norms[j]
+                vector = [a - mu[i][j] * b for a, b in zip(vector, orthogonal[j])]
+        norm = mpmath.fdot(vector, vector)
+        orthogonal.append(vector)
+        norms.append(norm if norm > tolerance else 0)
+    if center is None:
+        return norms, mu
+    center = [
+        mpmath.fdot(center, vector) / norm if norm else 0
+        for vector, norm in zip(orthogonal, norms)
+    ]
+    return norms, mu, center
+
+
+def _lll_reduce(rows, delta=mpmath.mpf(3) / 4):
+    """LLL-reduced basis of the lattice spanned by the independent `rows`.
+
+    Returns the reduced rows and the integer matrix taking the original rows
+    to them.
+    """
+    n = len(rows)
+    rows = [list(row) for row in rows]
+    transform = [[int(i == j) for j in range(n)] for i in range(n)]
+    norms, mu = _orthogonalize(rows)
+    k = 1
+    while k < n:
+        for j in range(k - 1, -1, -1):
+            q = int(mpmath.nint(mu[k][j]))
+            if q:
+                rows[k] = [a - q * b for a, b in zip(rows[k], rows[j])]
+                transform[k] = [a - q * b for a, b in zip(transform[k], transform[j])]
+                # Size reduction leaves the orthogonalized rows unchanged
+                for l in range(j):
+                    mu[k][l] -= q * mu[j][l]
+                mu[k][j] -= q
+        if norms[k] >= (delta - mu[k][k - 1] ** 2) * norms[k - 1]:
+            k += 1
+        else:
+            # Swaps rows k - 1 and k, updating the orthogonalization in place
+            # (Cohen, algorithm 2.6.3)
+            rows[k - 1], rows[k] = rows[k], rows[k - 1]
+            transform[k - 1], transform[k] = transform[k], transform[k - 1]
+            m = mu[k][k - 1]
+            norm = norms[k] + m**2 * norms[k - 1]
+            mu[k][k - 1] = m * norms[k - 1] / norm
+            norms[k] = norms[k - 1] * norms[k] / norm
+            norms[k - 1] = norm
+            for j in range(k - 1):
+                mu[k - 1][j], mu[k][j] = mu[k][j], mu[k - 1][j]
+            for i in range(k + 1, n):
+                t = mu[i][k]
+                mu[i][k] = mu[i][k - 1] - m * t
+                mu[i][k - 1] = t + mu[k][k - 1] * mu[i][k]
+            k = max(k - 1, 1)
+    return rows, transform
+
+
+def _lattice_points(constraints):
+    # Integer x with |sum_i x_i b_i - c|^2 <= r^2 for each of the constraints
+    # (norms, mu, center, r^2), where the b_i have the Gram-Schmidt squared
+    # norms `norms` and coefficients `mu`, and `center` holds the coefficients
+    # of c along the orthogonalized b_i (Fincke-Pohst enumeration). Each
+    # constraint bounds x_j when its orthogonalized b_j isn't zero, and the
+    # first one must bound all of them
+    n = len(constraints[0][0])
+    x = [0] * n
+
+    def search(j, remaining):
+        low, high = -mpmath.inf, mpmath.inf
+        offsets = []
+        for (norms, mu, center, _), left in zip(constraints, remaining):
+            offset = None
+            if norms[j]:
+                offset = center[j] - mpmath.fsum(
+                    mu[i][j] * x[i] for i in range(j + 1, n)
+                )
+                spread = mpmath.sqrt(left / norms[j])
+                low, high = max(low, offset - spread), min(high, offset + spread)
+            offsets.append(offset)
+        for value in range(int(mpmath.ceil(low)), int(mpmath.floor(high)) + 1):
+            left = [
+                left if offset is None else left - (value - offset) ** 2 * norms[j]
+                for (norms, _, _, _), left, offset in zip(
+                    constraints, remaining, offsets
+                )
+            ]
+            if min(left) < 0:
+                continue
+            x[j] = value
+            if j == 0:
+                yield list(x)
+            else:
+                yield from search(j - 1, left)
+
+    yield from search(n - 1, [radius_squared for *_, radius_squared in constraints])
+
+
+class _CandidateSearch:
+    """Candidates v in Z[omega] for the approximation of RZ(angle), by exponent k.
+
+    Those with |v|^2 <= 2^k, |v.|^2 <= 2^k and Re(v z^*) >= sqrt(2)^k (1 -
+    accuracy^2 / 2), for z = exp(-i angle / 2), so that U is unitary and
+    within `synthesis_accuracy` of RZ(angle) in operator norm.
+    """
+
+    def __init__(self, angle, synthesis_accuracy):
+        self.phi = -mpmath.mpf(angle) / 2
+        epsilon = mpmath.mpf(synthesis_accuracy)
+        self.rho = 1 - epsilon**2 / 2
+        # For sqrt(2)^k = 1, the region is a circular segment in the rectangle
+        # between rho and 1 along z with half-width half_width across. The
+        # ellipse through the corners of the rectangle with its axes stretched
+        # by _ELLIPSE_STRETCH along z contains it, and the map below takes that
+        # ellipse and the disk for v. to unit disks, and Z[omega] (as (Re v,
+        # Im v, Re v., Im v.)) to a lattice in R^4. The candidates for exponent
+        # k are in both disks for the lattice scaled down by sqrt(2)^k, so also
+        # in the ball of radius sqrt(2) around their centers
+        half_height = (1 - self.rho) / 2
+        half_width = mpmath.sqrt(1 - self.rho**2)
+        stretch = mpmath.mpf(_ELLIPSE_STRETCH)
+        height = half_height * stretch
+        width = half_width * stretch / mpmath.sqrt(stretch**2 - 1)
+        cos, sin = mpmath.cos(self.phi), mpmath.sin(self.phi)
+        r = 1 / mpmath.sqrt(2)
+        # Coordinates along and across z, and of v.
+        rows = [
+            [x * cos + y * sin, y * cos - x * sin, x_bullet, y_bullet]
+            for x, y, x_bullet, y_bullet in (
+                (1, 0, 1, 0),
+                (r, r, -r, -r),
+                (0, 1, 0, 1),
+                (-r, r, r, -r),
+            )
+        ]
+        ellipse_rows = [[a / height, b / width, c, d] for a, b, c, d in rows]
+        ellipse_rows, self.transform = _lll_reduce(ellipse_rows)
+        rows = [
+            [sum(x * row[l] for x, row in zip(x_row, rows)) for l in range(4)]
+            for x_row in self.transform
+        ]
+        center = [(1 + self.rho) / (2 * height), 0, 0, 0]
+        # The ball bounds all coordinates, and the disks (whose rows are
+        # dependent) cut out the points of the ball outside any of them. The
+        # lattice points lie on planes across z which are dense for small
+        # accuracies, so the disk for v is needed to skip the planes in the
+        # ellipse but outside the unit circle quickly
+        self.constraints = [
+            (*_orthogonalize(ellipse_rows, center), 2),
+            (*_orthogonalize([row[:2] for row in ellipse_rows], center[:2]), 1),
+            (*_orthogonalize([row[:2] for row in rows], [0, 0]), 1),
+            (*_orthogonalize([row[2:] for row in rows], [0, 0]), 1),
+        ]
+
+    def candidates(self, k):
+        """Yields (v, 2^k - v^dagger v) for the candidates with exponent k.
+
+        The candidates are generated lazily: for angles close to multiples of
+        pi / 4, whole rows of lattice points fall into the region at once.
+        """
+        scale = mpmath.sqrt(2) ** k
+        cos, sin = mpmath.cos(self.phi), mpmath.sin(self.phi)
+        r = 1 / mpmath.sqrt(2)
+        for x in _lattice_points(
+            [
+                (
+                    [norm / 2**k for norm in norms],
+                    mu,
+                    [c * scale for c in center],
+                    radius_squared,
+                )
+                for norms, mu, center, radius_squared in self.constraints
+            ]
+        ):
+            v = tuple(
+                sum(x_i * row[l] for x_i, row in zip(x, self.transform))
+                for l in range(4)
+            )
+            # Multiples of sqrt(2) were candidates for k - 1 already
+            if k > 0 and _divide_by_root_two(v) is not None:
+                continue
+            a, b, c, d = v
+            overlap = (a + (b - d) * r) * cos + (c + (b + d) * r) * sin
+            xi = _root_two_sub((2**k, 0), _norm_squared(v))
+            if (
+                overlap >= scale * self.rho
+                and _root_two_sign(xi) >= 0
+                and _root_two_sign(_root_two_bullet(xi)) >= 0
+            ):
+                yield v, xi
+
+
+def _t_power_gates(exponent):
+    # T^exponent as S and T gates, which commute
+    exponent %= 8
+    return "S" * (exponent // 2) + "T" * (exponent % 2)
+
+
+# RZ(j pi / 4) for j = 0, ..., 7
+_EXACT_RZ_SEQUENCES = tuple(_t_power_gates(j) for j in range(8))
+
+
+def _omega_exponent(x):
+    # j with x = omega^j, for a unit x = +-omega^i
+    (i,) = [i for i, part in enumerate(x) if part]
+    return i if x[i] == 1 else i + 4
+
+
+def _apply_ht(matrix, k, j):
+    # H T^j times the matrix 1/sqrt(2)^k [[m00, m01], [m10, m11]], with the
+    # common factors of sqrt(2) cancelled
+    m00, m01, m10, m11 = matrix
+    omega_j = _omega_power((0, 1, 0, 0), j)
+    m10, m11 = _omega_mul(omega_j, m10), _omega_mul(omega_j, m11)
+    matrix = [_omega_add(m00, m10), _omega_add(m01, m11)]
+    matrix += [_omega_sub(m00, m10), _omega_sub(m01, m11)]
+    k += 1
+    while k > 0:
+        divided = [_divide_by_root_two(entry) for entry in matrix]
+        if None in divided:
+            break
+        matrix, k = divided, k - 1
+    return matrix, k
+
+
+def _denominator_exponent(matrix, k):
+    # Smallest denominator exponent of |m00|^2, which H T^j lowers by one
+    if matrix[0] == _ZERO:
+        return 0
+    return 2 * k - _root_two_valuation(_norm_squared(matrix[0]))
+
+
+def _reduction(matrix, k, depth):
+    # Shortest list of j (at most `depth`) such that the H T^j lower the
+    # denominator exponent, with the resulting matrix and its exponent
+    exponent = _denominator_exponent(matrix, k)
+    for j in (0, 2, 1, 3):
+        reduced, reduced_k = _apply_ht(matrix, k, j)
+        if _denominator_exponent(reduced, reduced_k) < exponent:
+            return [j], reduced, reduced_k
+    if depth > 1:
+        for j in (0, 2, 1, 3):
+            reduced, reduced_k = _apply_ht(matrix, k, j)
+            result = _reduction(reduced, reduced_k, depth - 1)
+            if result is not None and (
+                _denominator_exponent(result[1], result[2]) < exponent
+            ):
+                return [j] + result[0], result[1], result[2]
+    return None
+
+
+def exact_synthesis(v, w, k):
+    """Gates of 1/sqrt(2)^k [[v, -w^dagger], [w, v^dagger]] in circuit order.
+
+    The unitary is written as a product of H T^(-j) until the denominators are
+    gone and a diagonal or antidiagonal matrix of powers of omega is left. The
+    sequence is exact up to a global phase.
+    """
+    matrix = [v, tuple(-part for part in _adjoint(w)), w, _adjoint(v)]
+    # Gates in matrix order, i.e. the reverse of the circuit order
+    gates = []
+    while _denominator_exponent(matrix, k) > 0:
+        # A single H T^j always works for exponents of 4 or more (KMM, lemma 3),
+        # and a few suffice for the last ones
+        j_values, matrix, k = _reduction(matrix, k, depth=4)
+        for j in j_values:
+            gates.append(_t_power_gates(-j) + "H")
+    while k > 0:
+        matrix = [_divide_by_root_two(entry) for entry in matrix]
+        k -= 1
+    if matrix[0] == _ZERO:
+        # [[0, omega^b], [omega^a, 0]] = X diag(omega^a, omega^b)
+        a, b = _omega_exponent(matrix[2]), _omega_exponent(matrix[1])
+        gates.append("X" + _t_power_gates(b - a))
+    else:
+        a, b = _omega_exponent(matrix[0]), _omega_exponent(matrix[3])
+        gates.append(_t_power_gates(b - a))
+    return "".join(gates)[::-1]
+
+
+def _working_precision(synthesis_accuracy):
+    # Bits needed to place the lattice points relative to a region whose
+    # width is accuracy^2 at scales of up to accuracy^-3
+    return 128 + 12 * max(1, math.ceil(-math.log2(synthesis_accuracy)))
+
+
+def _merge_phases(gate_sequence):
+    # Merges runs of S and T gates, and the H H pairs this leaves
+    merged = None
+    while merged != gate_sequence:
+        merged = gate_sequence
+        gate_sequence = re.sub(
+            "[ST]+",
+            lambda run: _t_power_gates(run[0].count("T") + 2 * run[0].count("S")),
+            merged,
+        ).replace("HH", "")
+    return gate_sequence
+
+
+def exact_rz_sequence(angle):
+    """Exact gate sequence for RZ(angle) if angle is a multiple of pi / 4, or None.
+
+    RZ(j pi / 4) is T^j up to a global phase. Those are the only Z rotations
+    with exact Clifford + T circuits (the entries of RZ(pi / 8) aren't in
+    Z[1 / sqrt(2), i]), so finer dyadic angles k pi / 2^m still need to be
+    approximated. Angles are compared up to floating point rounding.
+    """
+    angle = float(angle)
+    j = round(angle / (np.pi / 4))
+    if abs(angle - j * np.pi / 4) > _EXACT_ANGLE_TOLERANCE * max(1.0, abs(angle)):
+        return None
+    return _EXACT_RZ_SEQUENCES[j % 8]
+
+
+def synthesize_rz_natively(angle, synthesis_accuracy):
+    """Synthesize RZ(angle) in-process, like run_gridsynth.
+
+    Returns the gate sequence in circuit order, as a string of H, S, T and X
+    gates implementing a unitary within `synthesis_accuracy` of RZ(angle) in
+    operator norm, up to a global phase.
+    """
+    angle = float(angle)
+    synthesis_accuracy = float(synthesis_accuracy)
+    if not 0 < synthesis_accuracy < 1:
+        raise ValueError(
+            f"The synthesis accuracy must be between 0 and 1, not {synthesis_accuracy}."
+        )
+    # RZ(j pi / 4) is T^j up to a global phase, and the distance between
+    # rotations up to a phase is 2 |sin(angle difference / 4)|
+    j = round(angle / (np.pi / 4))
+    if 2 * abs(math.sin((angle - j * np.pi / 4) / 4)) <= synthesis_accuracy:
+        return _t_power_gates(j)
+    # The number of candidates grows as 4^k accuracy^3
+    expected_k = math.ceil(-1.5 * math.log2(synthesis_accuracy))
+    with mpmath.workprec(_working_precision(synthesis_accuracy)):
+        # RZ(angle) is also T RZ(angle - pi / 4) up to a global phase, which
+        # doubles the candidates for each k
+        searches = [
+            (_CandidateSearch(angle, synthesis_accuracy), ""),
+            (_CandidateSearch(angle - np.pi / 4, synthesis_accuracy), "T"),
+        ]
+        for k in range(expected_k + _EXTRA_DENOMINATOR_EXPONENTS):
+            for search, last_gates in searches:
+                for v, xi in search.candidates(k):
+                    w = solve_norm_equation(xi)
+                    if w is not None:
+                        return _merge_phases(exact_synthesis(v, w, k) + last_gates)
+    raise RuntimeError(
+        f"Native synthesis failed for angle {angle} with accuracy {synthesis_accuracy}."
+    )
+
+
+def rz_gate_array(angle, synthesis_accuracy):
+    """synthesize_rz_natively as an array of opcodes (see columnar.GATE_NAMES)."""
+    gate_sequence = synthesize_rz_natively(angle, synthesis_accuracy)
+    return np.array([OPCODES[gate] for gate in gate_sequence], dtype=np.uint8)
+
+
+class NativeSynthesisPool:
+    """Synthesizes batches of angles in-process, on `n_workers` processes.
+
+    Has the same interface as GridsynthWorkerPool, which falls back to it when
+    neither gridsynth binary is available.
+    """
+
+    def __init__(self, n_workers=None):
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        self.n_workers = n_workers
+        self._executor = None
+
+    def synthesize(self, angles, synthesis_accuracy):
+        """List of (angle, gate sequence in circuit order) for each of `angles`."""
+        angles = list(angles)
+        if self.n_workers == 1 or len(angles) <= 1:
+            return [
+                (angle, synthesize_rz_natively(angle, synthesis_accuracy))
+                for angle in angles
+            ]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.n_workers)
+        gate_sequences = self._executor.map(
+            partial(synthesize_rz_natively, synthesis_accuracy=synthesis_accuracy),
+            angles,
+            chunksize=max(1, len(angles) // (4 * self.n_workers)),
+        )
+        return list(zip(angles, gate_sequences))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _benchmark(synthesize, angles, synthesis_accuracy):
+    # Mean T-count and mean latency of `synthesize` over `angles`
+    t_count = 0
+    start = time.perf_counter()
+    for angle in angles:
+        t_count += synthesize(angle, synthesis_accuracy).count("T")
+    latency = (time.perf_counter() - start) / len(angles)
+    return t_count / len(angles), latency
+
+
+def main():
+    import argparse
+
+    # gridsynth imports this module for the fallback to native synthesis
+    from .gridsynth import GRIDSYNTH_PATH, run_gridsynth
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the T-counts and latency of native synthesis of Z rotations "
+            "with those of the gridsynth binary, on random angles."
+        )
+    )
+    parser.add_argument(
+        "--accuracy", type=float, nargs="+", default=[1e-2, 1e-4, 1e-6, 1e-10]
+    )
+    parser.add_argument("--n-angles", type=int, default=20)
+    parser.add_argument("--gridsynth-path", default=GRIDSYNTH_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    angles = [rng.uniform(-np.pi, np.pi) for _ in range(args.n_angles)]
+    has_gridsynth = os.path.exists(args.gridsynth_path)
+    if not has_gridsynth:
+        print(f"{args.gridsynth_path} not found, only timing native synthesis.")
+    for synthesis_accuracy in args.accuracy:
+        t_count, latency = _benchmark(
+            synthesize_rz_natively, angles, synthesis_accuracy
+        )
+        line = (
+            f"accuracy {synthesis_accuracy:g}: native T-count {t_count:.1f}, "
+            f"{1000 * latency:.1f} ms"
+        )
+        if has_gridsynth:
+            t_count, latency = _benchmark(
+                partial(run_gridsynth, gridsynth_path=args.gridsynth_path),
+                angles,
+                synthesis_accuracy,
+            )
+            line += f"; gridsynth T-count {t_count:.1f}, {1000 * latency:.1f} ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Decomposition of Toffoli gates into Clifford + T, on columnar circuits.
+
+Every Toffoli of a circuit is replaced by a fixed network of Clifford and T
+gates, its template, with the qubits of the template mapped to those of the
+Toffoli. This is done with array operations over the opcode, qubit and param
+arrays of circuit_tools.columnar a chunk at a time, instead of decomposing
+each operation in cirq, so the other writers and resource counters take the
+result like any other columnar circuit.
+
+Two templates are available (DECOMPOSITIONS):
+
+- "7t": the standard network with 7 T gates, 6 CNOTs and T-depth 4
+  (Nielsen and Chuang, figure 4.9), on the qubits of the Toffoli only.
+- "t_depth_1": T-depth 1 with 4 ancillas (Selinger, arXiv:1210.0974). The
+  ancillas hold the parities a^b, a^c, b^c and a^b^c of the qubits, so that
+  all 7 T gates act at once, and are returned to |0>. The ancillas are
+  qubits after those of the circuit, in `n_ancilla_sets` sets of
+  N_TOFFOLI_ANCILLAS used by the Toffolis in turn; Toffolis sharing a set
+  can't overlap, so more sets trade qubits for depth.
+"""
+import numpy as np
+
+from .columnar import (
+    MAX_QUBITS_PER_OPERATION,
+    OPCODES,
+    ColumnarCircuit,
+    columnar_parts,
+)
+from .instrumentation import profiled
+
+N_TOFFOLI_ANCILLAS = 4
+TOFFOLI_ANCILLA_PREFIX = "toffoli_anc_"
+_CHUNK_SIZE = 1 << 16
+
+# Operations of the templates on the controls (0, 1), the target (2) and the
+# ancillas (3 to 6)
+_SEVEN_T_TEMPLATE = [
+    ("H", (2,)),
+    ("CNOT", (1, 2)),
+    ("T_DAG", (2,)),
+    ("CNOT", (0, 2)),
+    ("T", (2,)),
+    ("CNOT", (1, 2)),
+    ("T_DAG", (2,)),
+    ("CNOT", (0, 2)),
+    ("T", (1,)),
+    ("T", (2,)),
+    ("H", (2,)),
+    ("CNOT", (0, 1)),
+    ("T", (0,)),
+    ("T_DAG", (1,)),
+    ("CNOT", (0, 1)),
+]
+# The phase (-1)**(a b c) of a CCZ is exp(i pi/4 (a + b + c - a^b - a^c - b^c
+# + a^b^c)), so T is applied to the qubits and to a^b^c and T_DAG to the pairs
+_PARITIES = [
+    ("CNOT", (0, 3)),
+    ("CNOT", (1, 3)),
+    ("CNOT", (0, 4)),
+    ("CNOT", (2, 4)),
+    ("CNOT", (1, 5)),
+    ("CNOT", (2, 5)),
+    ("CNOT", (3, 6)),
+    ("CNOT", (2, 6)),
+]
+_T_DEPTH_1_TEMPLATE = (
+    [("H", (2,))]
+    + _PARITIES
+    + [
+        ("T", (0,)),
+        ("T", (1,)),
+        ("T", (2,)),
+        ("T_DAG", (3,)),
+        ("T_DAG", (4,)),
+        ("T_DAG", (5,)),
+        ("T", (6,)),
+    ]
+    + _PARITIES[::-1]
+    + [("H", (2,))]
+)
+DECOMPOSITIONS = {"7t": _SEVEN_T_TEMPLATE, "t_depth_1": _T_DEPTH_1_TEMPLATE}
+
+
+def _template_arrays(decomposition):
+    try:
+        template = DECOMPOSITIONS[decomposition]
+    except KeyError:
+        raise ValueError(f"Unknown Toffoli decomposition {decomposition}.")
+    opcodes = np.array([OPCODES[gate_name] for gate_name, _ in template], np.uint8)
+    # Template qubits, with the -1 of unused slots pointing at a column of -1
+    slots = np.full((len(template), MAX_QUBITS_PER_OPERATION), -1)
+    for row, (_, qubits) in enumerate(template):
+        slots[row, : len(qubits)] = qubits
+    return opcodes, slots
+
+
+def uses_ancillas(decomposition):
+    return decomposition == "t_depth_1"
+
+
+class ToffoliDecomposer:
+    """Replaces the Toffolis of consecutive chunks of operation arrays.
+
+    `n_qubits` is the number of qubits of the circuit, after which the
+    ancillas of the "t_depth_1" decomposition are placed.
+    """
+
+    def __init__(self, n_qubits, decomposition="7t", n_ancilla_sets=1):
+        self.template_opcodes, self.template_slots = _template_arrays(decomposition)
+        self.n_qubits = n_qubits
+        if not uses_ancillas(decomposition):
+            n_ancilla_sets = 0
+        elif n_ancilla_sets < 1:
+            raise ValueError("The decomposition needs at least one set of ancillas.")
+        self.n_ancilla_sets = n_ancilla_sets
+        self.n_ancillas = N_TOFFOLI_ANCILLAS * n_ancilla_sets
+        self.n_toffolis = 0
+
+    def decompose(self, opcodes, qubits, params):
+        """Opcode, qubit and param arrays with the Toffolis decomposed.
+
+        Also returns the index of the first operation replacing each one (and
+        the number of operations at the end), to map e.g. step offsets.
+        """
+        is_toffoli = opcodes == OPCODES["TOFFOLI"]
+        n_rows = np.where(is_toffoli, len(self.template_opcodes), 1)
+        offsets = np.zeros(len(opcodes) + 1, dtype=np.int64)
+        np.cumsum(n_rows, out=offsets[1:])
+        n_operations = int(offsets[-1])
+        new_opcodes = np.empty(n_operations, dtype=np.uint8)
+        new_qubits = np.empty((n_operations, MAX_QUBITS_PER_OPERATION), np.int32)
+        new_params = np.empty(n_operations, dtype=params.dtype)
+
+        kept = offsets[:-1][~is_toffoli]
+        new_opcodes[kept] = opcodes[~is_toffoli]
+        new_qubits[kept] = qubits[~is_toffoli]
+        new_params[kept] = params[~is_toffoli]
+
+        # Rows of the templates of all the Toffolis, and the qubits their
+        # template qubits map to, with -1 at the end for the unused slots
+        toffoli_qubits = qubits[is_toffoli]
+        n_toffolis = len(toffoli_qubits)
+        ancillas = np.empty((n_toffolis, 0), dtype=np.int64)
+        if self.n_ancilla_sets:
+            indices = self.n_toffolis + np.arange(n_toffolis)
+            ancilla_sets = indices % self.n_ancilla_sets
+            ancillas = (
+                self.n_qubits
+                + N_TOFFOLI_ANCILLAS * ancilla_sets[:, None]
+                + np.arange(N_TOFFOLI_ANCILLAS)
+            )
+        self.n_toffolis += n_toffolis
+        operands = np.column_stack([toffoli_qubits, ancillas, np.full(n_toffolis, -1)])
+        rows = (
+            offsets[:-1][is_toffoli][:, None] + np.arange(len(self.template_opcodes))
+        ).ravel()
+        new_opcodes[rows] = np.tile(self.template_opcodes, n_toffolis)
+        new_qubits[rows] = np.take_along_axis(
+            operands[:, None, :],
+            np.broadcast_to(
+                self.template_slots, (n_toffolis,) + self.template_slots.shape
+            ),
+            axis=2,
+        ).reshape(-1, MAX_QUBITS_PER_OPERATION)
+        new_params[rows] = np.nan
+        return new_opcodes, new_qubits, new_params, offsets
+
+    def decompose_circuit(self, circuit):
+        """A ColumnarCircuit with its Toffolis decomposed, and its steps kept."""
+        chunks = []
+        step_offsets = circuit.step_offsets
+        new_step_offsets = None if step_offsets is None else []
+        n_operations = 0
+        for start in range(0, max(len(circuit), 1), _CHUNK_SIZE):
+            chunk = circuit.operation_range(start, start + _CHUNK_SIZE)
+            *arrays, offsets = self.decompose(
+                np.asarray(chunk.opcodes),
+                np.asarray(chunk.qubits),
+                np.asarray(chunk.params),
+            )
+            if step_offsets is not None:
+                in_chunk = (step_offsets >= start) & (step_offsets < start + len(chunk))
+                new_step_offsets.extend(
+                    (n_operations + offsets[step_offsets[in_chunk] - start]).tolist()
+                )
+            n_operations += len(arrays[0])
+            chunks.append(arrays)
+        if step_offsets is not None:
+            new_step_offsets.append(n_operations)
+        return ColumnarCircuit(
+            *[np.concatenate(arrays) for arrays in zip(*chunks)],
+            n_qubits=self.n_qubits + self.n_ancillas,
+            step_offsets=new_step_offsets,
+            qubit_names=self.qubit_names(circuit.qubit_names),
+            measurement_keys=circuit.measurement_keys,
+        )
+
+    def decompose_chunk(self, chunk):
+        """Decomposes a ColumnarCircuit without Trotter steps, e.g. a chunk."""
+        *arrays, _ = self.decompose(
+            np.asarray(chunk.opcodes),
+            np.asarray(chunk.qubits),
+            np.asarray(chunk.params),
+        )
+        return ColumnarCircuit(
+            *arrays,
+            n_qubits=self.n_qubits + self.n_ancillas,
+            qubit_names=self.qubit_names(chunk.qubit_names),
+            measurement_keys=chunk.measurement_keys,
+        )
+
+    def qubit_names(self, qubit_names):
+        # Named qubits get named ancillas, LineQubits the following LineQubits
+        if qubit_names is None or not self.n_ancillas:
+            return qubit_names
+        return list(qubit_names) + [
+            f"{TOFFOLI_ANCILLA_PREFIX}{index}" for index in range(self.n_ancillas)
+        ]
+
+
+@profiled
+def decompose_toffolis(circuit, decomposition="7t", n_ancilla_sets=1):
+    """Clifford + T circuit with the Toffolis of `circuit` decomposed.
+
+    `circuit` is anything columnar.columnar_parts takes. Returns a
+    ColumnarCircuit, with the Trotter steps of a ColumnarCircuit or the
+    repetitions of a RepeatedCircuit (decomposed once) kept as steps.
+    """
+    parts = columnar_parts(circuit)
+    n_qubits = max([part.n_qubits for part, _ in parts], default=0)
+    decomposer = ToffoliDecomposer(n_qubits, decomposition, n_ancilla_sets)
+    decomposed_parts = []
+    for part, repetitions in parts:
+        decomposed_part = decomposer.decompose_circuit(part)
+        if repetitions > 1:
+            decomposed_part = decomposed_part.repeat(repetitions)
+        decomposed_parts.append(decomposed_part)
+    if len(decomposed_parts) == 1:
+        return decomposed_parts[0]
+    if not decomposed_parts:
+        return ColumnarCircuit.from_operations([], n_qubits=n_qubits)
+    return ColumnarCircuit.concatenate(decomposed_parts)
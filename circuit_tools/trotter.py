@@ -0,0 +1,103 @@
+"""Trotter circuits represented as a single step repeated a number of times."""
+from collections import Counter
+
+import cirq
+from orquestra.integrations.cirq.conversions import export_to_cirq
+from orquestra.quantum.circuits import Circuit
+
+from .evolution import fused_trotter_segments, time_evolution
+from .instrumentation import profiled
+
+
+class RepeatedCircuit:
+    """A circuit consisting of `block` repeated `repetitions` times.
+
+    Fused Trotter circuits also have a `prefix` before the repeated block and
+    a `suffix` after it. Transformations such as transpilation are applied
+    once to the block (and to the prefix and suffix) with `map_block`, and the
+    full circuit is only built when `unroll` is called.
+    """
+
+    def __init__(self, block, repetitions, prefix=None, suffix=None):
+        self.block = block
+        self.repetitions = repetitions
+        self.prefix = Circuit() if prefix is None else prefix
+        self.suffix = Circuit() if suffix is None else suffix
+
+    @property
+    def n_qubits(self):
+        return max(self.prefix.n_qubits, self.block.n_qubits, self.suffix.n_qubits)
+
+    def _parts(self):
+        return [self.prefix, self.block, self.suffix]
+
+    def map_block(self, function):
+        prefix, block, suffix = (
+            function(part) if part.operations else part for part in self._parts()
+        )
+        return RepeatedCircuit(block, self.repetitions, prefix, suffix)
+
+    def unroll(self):
+        return Circuit(
+            list(self.prefix.operations)
+            + list(self.block.operations) * self.repetitions
+            + list(self.suffix.operations)
+        )
+
+    def gate_counts(self):
+        counts = Counter()
+        for part, repetitions in zip(self._parts(), [1, self.repetitions, 1]):
+            for gate_operation in part.operations:
+                counts[gate_operation.gate.name] += repetitions
+        return +counts
+
+    @profiled
+    def to_cirq(self, unroll=False):
+        """Cirq version of the circuit, with the block in a CircuitOperation.
+
+        With `unroll=True` the fully unrolled circuit is returned instead, which
+        is the same as exporting the result of `unroll`.
+        """
+        if unroll:
+            return export_to_cirq(self.unroll())
+        cirq_block = export_to_cirq(self.block)
+        if self.repetitions == 1:
+            cirq_circuit = cirq_block
+        elif self.repetitions == 0 or not self.block.operations:
+            cirq_circuit = cirq.Circuit()
+        else:
+            cirq_circuit = cirq.Circuit(
+                cirq.CircuitOperation(cirq_block.freeze(), repetitions=self.repetitions)
+            )
+        if self.prefix.operations:
+            cirq_circuit = export_to_cirq(self.prefix) + cirq_circuit
+        if self.suffix.operations:
+            cirq_circuit = cirq_circuit + export_to_cirq(self.suffix)
+        return cirq_circuit
+
+
+def trotter_step_circuit(hamiltonian, time, n_trotter_steps):
+    # time_evolution with trotter_order=n_trotter_steps concatenates
+    # n_trotter_steps copies of exactly this circuit.
+    return time_evolution(hamiltonian, time=time / n_trotter_steps, trotter_order=1)
+
+
+def repeated_trotter_circuit(hamiltonian, time, n_trotter_steps, fuse=False):
+    """RepeatedCircuit of `n_trotter_steps` Trotter steps.
+
+    With `fuse` it is the fused circuit of `fused_trotter_segments`, whose
+    block covers two steps.
+    """
+    if fuse:
+        prefix, block, repetitions, suffix = fused_trotter_segments(
+            hamiltonian, time, n_trotter_steps
+        )
+        return RepeatedCircuit(
+            block.to_orquestra(),
+            repetitions,
+            prefix.to_orquestra(),
+            suffix.to_orquestra(),
+        )
+    return RepeatedCircuit(
+        trotter_step_circuit(hamiltonian, time, n_trotter_steps), n_trotter_steps
+    )
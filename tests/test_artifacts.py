@@ -0,0 +1,42 @@
+import importlib.util
+import os
+
+from circuit_tools.artifacts import ArtifactStore, WrittenFiles, code_version
+
+
+def _load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_code_version_covers_the_functions_a_stage_calls(tmp_path):
+    path = tmp_path / "script.py"
+    source = "def helper():\n    return {}\n\n\ndef stage():\n    return helper()\n"
+    path.write_text(source.format(1))
+    before = code_version(_load_module(path, "script").stage)
+    path.write_text(source.format(2))
+    after = code_version(_load_module(path, "script").stage)
+    assert before != after
+
+
+def test_written_files_are_only_current_in_their_directory(tmp_path, monkeypatch):
+    for directory in ("first", "second"):
+        (tmp_path / directory).mkdir()
+    monkeypatch.chdir(tmp_path / "first")
+    with open("circuit.json", "w") as f:
+        f.write("{}")
+    written_files = WrittenFiles(["circuit.json"])
+    store = ArtifactStore(str(tmp_path / "store"))
+    store.put("digest", written_files)
+
+    assert written_files.paths == [str(tmp_path / "first" / "circuit.json")]
+    found, result = store.get("digest")
+    assert found and result.paths == written_files.paths
+    # From another directory, the script has to write its files there
+    monkeypatch.chdir(tmp_path / "second")
+    assert store.get("digest") == (False, None)
+    monkeypatch.chdir(tmp_path / "first")
+    os.remove("circuit.json")
+    assert store.get("digest") == (False, None)
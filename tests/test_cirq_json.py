@@ -0,0 +1,148 @@
+import gzip
+import io
+import random
+import zipfile
+
+import cirq
+import pytest
+
+from circuit_tools.cirq_json import (
+    CirqJsonReader,
+    CirqJsonWriter,
+    iter_moments,
+    read_cirq_json_operations,
+    write_cirq_json,
+)
+from circuit_tools.columnar import encode_cirq_gate
+
+
+def _random_operations(rng, qubits, n_operations):
+    operations = []
+    for _ in range(n_operations):
+        draw = rng.random()
+        if draw < 0.2:
+            operations.append(cirq.TOFFOLI(*rng.sample(qubits, 3)))
+        elif draw < 0.5:
+            operations.append(cirq.CNOT(*rng.sample(qubits, 2)))
+        elif draw < 0.6:
+            operations.append(cirq.rz(rng.uniform(-3, 3)).on(rng.choice(qubits)))
+        else:
+            gate = rng.choice([cirq.H, cirq.T, cirq.S**-1, cirq.X])
+            operations.append(gate.on(rng.choice(qubits)))
+    return operations
+
+
+def _random_circuit(seed):
+    rng = random.Random(seed)
+    qubits = cirq.LineQubit.range(5)
+    circuit = cirq.Circuit(_random_operations(rng, qubits, 60))
+    step = cirq.CircuitOperation(
+        cirq.FrozenCircuit(_random_operations(rng, qubits, 10))
+    )
+    circuit += step.repeat(3)
+    circuit += cirq.measure(*qubits, key="result")
+    return circuit
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_writer_output_is_cirq_to_json(seed):
+    circuit = _random_circuit(seed)
+    f = io.StringIO()
+    write_cirq_json(circuit, f)
+    assert f.getvalue() == cirq.to_json(circuit)
+
+
+def test_writer_output_of_empty_circuits_is_cirq_to_json():
+    for circuit in [cirq.Circuit(), cirq.Circuit(cirq.Moment())]:
+        f = io.StringIO()
+        write_cirq_json(circuit, f)
+        assert f.getvalue() == cirq.to_json(circuit)
+
+
+def test_cached_texts_keep_the_order_of_interchangeable_qubits():
+    # TOFFOLI(a, b, c) equals TOFFOLI(b, a, c), but is written differently
+    a, b, c = cirq.LineQubit.range(3)
+    circuit = cirq.Circuit(cirq.TOFFOLI(a, b, c), cirq.TOFFOLI(b, a, c))
+    assert circuit[0].operations[0] == circuit[1].operations[0]
+    f = io.StringIO()
+    writer = CirqJsonWriter(f)
+    for moment in circuit:
+        writer.write_moment(moment)
+    writer.close()
+    assert f.getvalue() == cirq.to_json(circuit)
+
+
+def test_compressed_files_hold_cirq_to_json(tmp_path):
+    circuit = _random_circuit(0)
+    write_cirq_json(circuit, str(tmp_path / "circuit.json.gz"))
+    with gzip.open(tmp_path / "circuit.json.gz", "rt") as f:
+        assert f.read() == cirq.to_json(circuit)
+    write_cirq_json(circuit, str(tmp_path / "circuit.json.zip"))
+    with zipfile.ZipFile(tmp_path / "circuit.json.zip") as archive:
+        assert archive.namelist() == ["circuit.json"]
+        assert archive.read("circuit.json").decode() == cirq.to_json(circuit)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_iter_moments_places_operations_like_cirq(seed):
+    circuit = _random_circuit(seed)
+    operations = list(circuit.all_operations())
+    qubits = sorted(circuit.all_qubits())
+    assert cirq.Circuit(iter_moments(operations, qubits)) == cirq.Circuit(operations)
+
+
+def _readable_circuit(seed):
+    # The reader takes single qubit measurements only
+    circuit = _random_circuit(seed)[:-1]
+    qubits = sorted(circuit.all_qubits())
+    circuit += [cirq.measure(qubit, key=f"m{qubit.x}") for qubit in qubits]
+    return circuit
+
+
+def _expected_operations(circuit, measurement_keys):
+    # (gate name, qubit indices, params) of each operation, with the
+    # subcircuits unrolled
+    unrolled_circuit = cirq.unroll_circuit_op(circuit, tags_to_check=None)
+    for operation in unrolled_circuit.all_operations():
+        qubits = tuple(qubit.x for qubit in operation.qubits)
+        if cirq.is_measurement(operation):
+            key_index = measurement_keys.index(cirq.measurement_key_name(operation))
+            yield "MEASURE", qubits, (float(key_index),)
+        else:
+            gate_name, params = encode_cirq_gate(operation.gate)
+            yield gate_name, qubits, params
+
+
+@pytest.mark.parametrize("block_size", [16, 1000, 1 << 20])
+@pytest.mark.parametrize("seed", range(5))
+def test_reader_rebuilds_the_circuit(seed, block_size):
+    circuit = _readable_circuit(seed)
+    reader = CirqJsonReader(io.StringIO(cirq.to_json(circuit)), block_size=block_size)
+    assert cirq.Circuit(reader.moments()) == circuit
+    assert reader.n_moments == len(circuit)
+
+    reader = CirqJsonReader(io.StringIO(cirq.to_json(circuit)), block_size=block_size)
+    operations = list(reader)
+    assert reader.n_qubits == 5
+    assert reader.qubit_names is None
+    assert operations == list(_expected_operations(circuit, reader.measurement_keys))
+
+
+def test_reader_reads_compressed_files_and_named_qubits(tmp_path):
+    a, b = cirq.NamedQubit("b"), cirq.NamedQubit("a")
+    circuit = cirq.Circuit(cirq.H(a), cirq.CNOT(a, b), cirq.measure(b, key="z"))
+    path = str(tmp_path / "circuit.json.zip")
+    write_cirq_json(circuit, path)
+    assert list(read_cirq_json_operations(path, block_size=8)) == [
+        ("H", (0,), ()),
+        ("CNOT", (0, 1), ()),
+        ("MEASURE", (1,), (0.0,)),
+    ]
+
+
+def test_reader_rejects_truncated_files():
+    text = cirq.to_json(_readable_circuit(0))
+    # Cut in a moment, or between moments
+    for end in [len(text) // 2, text.index("},\n    {") + 2]:
+        with pytest.raises(ValueError):
+            list(CirqJsonReader(io.StringIO(text[:end]), block_size=64))
@@ -0,0 +1,152 @@
+import sys
+
+import cirq
+import numpy as np
+import pytest
+from openfermion import QubitOperator
+from orquestra.quantum.circuits import RZ, Circuit, H
+
+from circuit_tools.cirq_json import CirqJsonReader, open_circuit_file
+from circuit_tools.columnar import (
+    ColumnarCircuit,
+    load_circuit_artifact,
+    main,
+    save_circuit_artifact,
+)
+from circuit_tools.trotter import repeated_trotter_circuit
+
+
+def _random_hamiltonian(rng, n_qubits=4, n_terms=6):
+    hamiltonian = QubitOperator()
+    for _ in range(n_terms):
+        qubits = rng.choice(n_qubits, size=rng.integers(1, n_qubits + 1), replace=False)
+        term = [(int(qubit), str(rng.choice(list("XYZ")))) for qubit in qubits]
+        hamiltonian += QubitOperator(term, float(rng.normal()))
+    return hamiltonian
+
+
+def _assert_same_circuits(circuit, expected):
+    assert circuit.n_qubits == expected.n_qubits
+    np.testing.assert_array_equal(circuit.opcodes, expected.opcodes)
+    np.testing.assert_array_equal(circuit.qubits, expected.qubits)
+    np.testing.assert_allclose(circuit.params, expected.params, atol=1e-7)
+    if expected.step_offsets is None:
+        assert circuit.step_offsets is None
+    else:
+        np.testing.assert_array_equal(circuit.step_offsets, expected.step_offsets)
+
+
+def _in_moment_order(circuit):
+    # cirq JSON files list the operations moment by moment
+    return ColumnarCircuit.from_cirq(circuit.to_cirq())
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_trotter_circuits_round_trip_through_the_files(seed, tmp_path):
+    rng = np.random.default_rng(seed)
+    repeated_circuit = repeated_trotter_circuit(_random_hamiltonian(rng), 1.5, 7)
+    circuit = ColumnarCircuit.from_repeated_circuit(repeated_circuit)
+    assert circuit.n_steps == 7
+
+    columnar_path = str(tmp_path / "circuit.npcircuit")
+    save_circuit_artifact(circuit, columnar_path)
+    loaded_circuit = load_circuit_artifact(columnar_path)
+    assert isinstance(loaded_circuit.opcodes, np.memmap)
+    _assert_same_circuits(loaded_circuit, circuit)
+
+    # The steps are written as a repeated CircuitOperation and read back as steps
+    step = _in_moment_order(circuit.steps(0))
+    for file_name in ["circuit.json", "circuit.json.gz", "circuit.zip"]:
+        path = str(tmp_path / file_name)
+        save_circuit_artifact(loaded_circuit, path)
+        _assert_same_circuits(load_circuit_artifact(path), step.repeat(7))
+
+    qasm_path = str(tmp_path / "circuit.qasm")
+    save_circuit_artifact(loaded_circuit, qasm_path)
+    expected = ColumnarCircuit.concatenate([circuit])
+    _assert_same_circuits(load_circuit_artifact(qasm_path), expected)
+
+    # The cirq circuit with the step in a CircuitOperation is converted to steps
+    cirq_circuit = repeated_circuit.to_cirq()
+    _assert_same_circuits(ColumnarCircuit.from_cirq(cirq_circuit), step.repeat(7))
+
+
+def test_circuits_without_a_single_repeated_step_have_no_steps(tmp_path):
+    q0, q1 = cirq.LineQubit.range(2)
+    step = cirq.CircuitOperation(cirq.FrozenCircuit(cirq.H(q0), cirq.CNOT(q0, q1)))
+    for circuit in [
+        cirq.Circuit(cirq.X(q1), step.repeat(3)),
+        cirq.Circuit(step.repeat(3), step.repeat(2)),
+        cirq.Circuit(step),
+    ]:
+        unrolled_circuit = cirq.unroll_circuit_op(circuit, tags_to_check=None)
+        expected = ColumnarCircuit.from_cirq(unrolled_circuit)
+        _assert_same_circuits(ColumnarCircuit.from_cirq(circuit), expected)
+
+        path = str(tmp_path / "circuit.json")
+        cirq.to_json(circuit, path)
+        _assert_same_circuits(load_circuit_artifact(path), expected)
+        with open_circuit_file(path) as f:
+            assert cirq.Circuit(CirqJsonReader(f).moments()) == circuit
+
+
+def test_steps_and_operation_ranges_are_sliced_from_memory_maps(tmp_path):
+    rng = np.random.default_rng(0)
+    repeated_circuit = repeated_trotter_circuit(_random_hamiltonian(rng), 1.0, 10)
+    circuit = ColumnarCircuit.from_repeated_circuit(repeated_circuit)
+    path = str(tmp_path / "circuit.npcircuit")
+    circuit.save(path)
+    loaded_circuit = ColumnarCircuit.load(path)
+    step_length = len(circuit) // 10
+
+    operations = loaded_circuit.operation_range(5, 5 + 2 * step_length)
+    assert isinstance(operations.params, np.memmap)
+    assert operations.step_offsets is None
+    assert list(operations.iter_operations()) == list(
+        circuit.iter_operations()
+    )[5 : 5 + 2 * step_length]
+
+    steps = loaded_circuit.steps(3, 6)
+    assert isinstance(steps.qubits, np.memmap)
+    assert list(steps.step_offsets) == [step * step_length for step in range(4)]
+    _assert_same_circuits(steps, circuit.steps(0).repeat(3))
+    _assert_same_circuits(loaded_circuit.steps(9), circuit.steps(0))
+
+
+def test_complex_params_are_stored(tmp_path):
+    operations = [
+        ("H", (0,), ()),
+        ("RZ", (1,), (0.5,)),
+        ("RZ", (0,), (0.25 + 0.5j,)),
+        ("CNOT", (0, 1), ()),
+        ("RX", (1,), (-1.0,)),
+    ]
+    circuit = ColumnarCircuit.from_operations(operations)
+    assert circuit.params.dtype == np.complex128
+    assert list(circuit.iter_operations()) == operations
+
+    path = str(tmp_path / "circuit.npcircuit")
+    circuit.save(path)
+    assert list(ColumnarCircuit.load(path).iter_operations()) == operations
+
+    orquestra_circuit = Circuit([H(0), RZ(0.5)(1), RZ(0.25 + 0.5j)(0)])
+    orquestra_operations = ColumnarCircuit.from_orquestra(orquestra_circuit)
+    assert list(orquestra_operations.iter_operations()) == operations[:3]
+    real_circuit = ColumnarCircuit.from_operations(operations[:2])
+    assert real_circuit.params.dtype == np.float64
+
+
+def test_files_are_converted_from_the_command_line(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    repeated_circuit = repeated_trotter_circuit(_random_hamiltonian(rng), 1.0, 4)
+    json_path = str(tmp_path / "circuit.json.gz")
+    columnar_path = str(tmp_path / "circuit.npcircuit")
+    save_circuit_artifact(
+        ColumnarCircuit.from_repeated_circuit(repeated_circuit), json_path
+    )
+
+    monkeypatch.setattr(sys, "argv", ["columnar", json_path, columnar_path])
+    main()
+    expected = ColumnarCircuit.from_cirq(repeated_circuit.to_cirq())
+    assert expected.n_steps == 4
+    _assert_same_circuits(ColumnarCircuit.load(columnar_path), expected)
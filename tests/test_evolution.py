@@ -0,0 +1,266 @@
+import importlib.util
+import os
+
+import cirq
+import numpy as np
+import openfermion as of
+import pytest
+import scipy.linalg
+from orquestra.integrations.cirq.conversions import from_openfermion
+from orquestra.quantum.circuits import CNOT, RX, RZ, Circuit, H, X
+
+from circuit_tools.clifford_t import transpile_repeated_circuit
+from circuit_tools.evolution import (
+    order_terms_for_ladders,
+    pauli_evolution_circuit,
+    time_evolution,
+)
+from circuit_tools.fermi_hubbard import fermi_hubbard_pauli_table
+from circuit_tools.gridsynth import canonical_angle
+from circuit_tools.pauli import PauliTable, controlled_qubit_hamiltonian
+from circuit_tools.peephole import optimize_repeated_circuit
+from circuit_tools.resources import count_resources
+from circuit_tools.trotter import repeated_trotter_circuit
+from circuit_tools.trotter_error import commutator_error_bound
+
+
+def _fermi_hubbard_2x2_control_hamiltonian():
+    # The model of 2022_08_22_Zapata_fermi_hubbard_clifford_T on a 2x2 lattice
+    hamiltonian = fermi_hubbard_pauli_table(
+        2, 2, 1.0, 4.0, chemical_potential=0.5, spinless=True
+    )
+    return controlled_qubit_hamiltonian(hamiltonian, 4)
+
+
+def _rx_as_x(circuit):
+    return Circuit(
+        [
+            X(operation.qubit_indices[0]) if operation.gate.name == "RX" else operation
+            for operation in circuit.operations
+        ]
+    )
+
+
+def test_fermi_hubbard_2x2_clifford_t_pipeline(tmp_path, monkeypatch):
+    # Without the gridsynth binary in the working directory, the rotations are
+    # synthesized in-process
+    monkeypatch.chdir(tmp_path)
+    synthesis_accuracy = 1e-3
+    hamiltonian = order_terms_for_ladders(_fermi_hubbard_2x2_control_hamiltonian())
+    trotter_circuit = repeated_trotter_circuit(hamiltonian, 1.0, 2, fuse=True)
+    transpiled_circuit = transpile_repeated_circuit(trotter_circuit, synthesis_accuracy)
+    optimized_circuit = optimize_repeated_circuit(transpiled_circuit)
+
+    summary = count_resources(optimized_circuit)
+    assert summary["n_qubits"] == 5
+    assert summary["t_count"] > 0
+    assert set(summary["gate_counts"]) <= {"CNOT", "H", "S", "T", "X", "Z"}
+
+    # Each rotation is synthesized within the accuracy, and the other gates
+    # are exact up to a global phase. transpile_clifford_t writes the RX basis
+    # changes as X, so the reference does too.
+    n_rotations = trotter_circuit.gate_counts()["RZ"]
+    reference_circuit = trotter_circuit.map_block(_rx_as_x)
+    qubits = cirq.LineQubit.range(5)
+    expected = reference_circuit.to_cirq(unroll=True).unitary(qubits)
+    unitary = optimized_circuit.to_cirq(unroll=True).unitary(qubits)
+    phase = np.trace(expected.conj().T @ unitary)
+    phase /= abs(phase)
+    error = np.linalg.norm(unitary - phase * expected, 2)
+    assert error <= n_rotations * synthesis_accuracy
+
+
+def test_controlled_hamiltonian_has_real_coefficients():
+    table = PauliTable.from_qubit_operator(_fermi_hubbard_2x2_control_hamiltonian())
+    assert np.all(table.coefficients.imag == 0)
+
+
+def test_control_qubit_of_the_hamiltonian_is_rejected():
+    # Passing spinless positionally made the lattice spinful, with 8 qubits
+    hamiltonian = fermi_hubbard_pauli_table(2, 2, 1.0, 4.0, 0.5, True)
+    with pytest.raises(ValueError, match="control qubit 4"):
+        controlled_qubit_hamiltonian(hamiltonian, 4)
+
+
+def test_complex_angles_are_rejected_before_synthesis():
+    assert canonical_angle(0.25 + 0j) == "0.25"
+    with pytest.raises(ValueError, match="must be real"):
+        canonical_angle(-0.25j)
+
+
+_REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# Jordan-Wigner Hamiltonian of 2022_06_29_Zapata_H2_trotter (H2 at 0.8 Angstrom
+# in sto-3g), in the order of the terms openfermion computes
+_H2_TERMS = [
+    ((), -0.16733398905695235),
+    (((0, "Z"),), 0.16251648748871633),
+    (((1, "Z"),), 0.16251648748871628),
+    (((2, "Z"),), -0.19744293699755805),
+    (((3, "Z"),), -0.19744293699755805),
+    (((0, "Z"), (1, "Z")), 0.1658325372159039),
+    (((0, "Y"), (1, "X"), (2, "X"), (3, "Y")), 0.04615669588901529),
+    (((0, "Y"), (1, "Y"), (2, "X"), (3, "X")), -0.04615669588901529),
+    (((0, "X"), (1, "X"), (2, "Y"), (3, "Y")), -0.04615669588901529),
+    (((0, "X"), (1, "Y"), (2, "Y"), (3, "X")), 0.04615669588901529),
+    (((0, "Z"), (2, "Z")), 0.11720364720195843),
+    (((0, "Z"), (3, "Z")), 0.16336034309097375),
+    (((1, "Z"), (2, "Z")), 0.16336034309097375),
+    (((1, "Z"), (3, "Z")), 0.11720364720195843),
+    (((2, "Z"), (3, "Z")), 0.17169788392286725),
+]
+
+
+def _h2_hamiltonian():
+    hamiltonian = of.QubitOperator()
+    for term, coefficient in _H2_TERMS:
+        hamiltonian.terms[term] = np.complex128(coefficient)
+    return hamiltonian
+
+
+def _load_generating_script(directory):
+    path = os.path.join(_REPOSITORY, directory, "generating_script.py")
+    spec = importlib.util.spec_from_file_location(f"script_{directory}", path)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    return script
+
+
+def _reference_time_evolution_for_term(term, coefficient, time):
+    # The gadget of orquestra-quantum 0.3, which the scripts were pinned to:
+    # basis changes and their reversals in ascending qubit order
+    circuit = Circuit()
+    if not term:
+        return circuit
+    qubit_indices = [qubit for qubit, _ in term]
+    cnot_gates = []
+    for i, (qubit, letter) in enumerate(term):
+        if letter == "X":
+            circuit += H(qubit)
+        elif letter == "Y":
+            circuit += RX(np.pi / 2)(qubit)
+        if i == len(term) - 1:
+            central_gate = RZ(2 * time * coefficient)(qubit)
+        else:
+            cnot_gates.append(CNOT(qubit, qubit_indices[i + 1]))
+    for gate in cnot_gates + [central_gate] + cnot_gates[::-1]:
+        circuit += gate
+    for qubit, letter in term:
+        if letter == "X":
+            circuit += H(qubit)
+        elif letter == "Y":
+            circuit += RX(-np.pi / 2)(qubit)
+    return circuit
+
+
+def _reference_time_evolution(hamiltonian, time, trotter_order):
+    circuit = Circuit()
+    for _ in range(trotter_order):
+        for term, coefficient in hamiltonian.terms.items():
+            circuit += _reference_time_evolution_for_term(
+                term, coefficient, time / trotter_order
+            )
+    return circuit
+
+
+def _gates(circuit):
+    return [
+        (operation.gate.name, operation.qubit_indices, operation.gate.params)
+        for operation in circuit.operations
+    ]
+
+
+def test_h2_circuits_are_the_committed_ones(tmp_path):
+    directory = "2022_06_29_Zapata_H2_trotter"
+    script = _load_generating_script(directory)
+    hamiltonian = script.add_control_qubit_to_qubit_hamiltonian(_h2_hamiltonian(), 4)
+    n_steps = script.estimate_number_of_trotter_steps(1, 0.001)
+    for file_name, trotter_order in [
+        ("time_1_single_step.txt", 1),
+        ("time_1_error_0_001.txt", n_steps),
+    ]:
+        circuit = time_evolution(hamiltonian, time=1, trotter_order=trotter_order)
+        if trotter_order == 1:
+            expected = _reference_time_evolution(hamiltonian, 1, trotter_order)
+            assert _gates(circuit) == _gates(expected)
+        path = str(tmp_path / file_name)
+        script.save_qasm_circuit(script.mock_transpile_clifford_t(circuit), path)
+        with open(os.path.join(_REPOSITORY, directory, file_name)) as f:
+            expected_text = f.read()
+        with open(path) as f:
+            assert f.read() == expected_text
+
+
+@pytest.mark.parametrize("trotter_order", [1, 3])
+def test_fermi_hubbard_circuits_match_the_reference(trotter_order):
+    hamiltonian = of.jordan_wigner(of.fermi_hubbard(2, 2, 1.0, 4.0, 0.5, spinless=True))
+    hamiltonian = controlled_qubit_hamiltonian(hamiltonian, 4)
+    expected = _gates(_reference_time_evolution(hamiltonian, 0.7, trotter_order))
+    assert _gates(time_evolution(hamiltonian, 0.7, trotter_order)) == expected
+    # The same circuit from a PauliTable and from orquestra's PauliSum
+    table = PauliTable.from_qubit_operator(hamiltonian)
+    assert _gates(time_evolution(table, 0.7, trotter_order)) == expected
+    pauli_sum = from_openfermion(hamiltonian)
+    assert _gates(time_evolution(pauli_sum, 0.7, trotter_order)) == expected
+
+
+def test_complex_coefficients_give_complex_angles():
+    # Like the reference, the angles of terms with imaginary coefficients are
+    # kept complex instead of dropping the imaginary part
+    hamiltonian = of.jordan_wigner(of.fermi_hubbard(2, 1, 1.0, 2.0))
+    hamiltonian += of.QubitOperator("X0 Y2", 0.25j) + of.QubitOperator("Z1", 0.5 - 1j)
+    circuit = time_evolution(hamiltonian, 1.5, 2)
+    assert _gates(circuit) == _gates(_reference_time_evolution(hamiltonian, 1.5, 2))
+    assert any(
+        isinstance(param, complex) and param.imag
+        for _, _, params in _gates(circuit)
+        for param in params
+    )
+    pauli_sum = from_openfermion(hamiltonian)
+    assert _gates(time_evolution(pauli_sum, 1.5, 2)) == _gates(circuit)
+
+
+def _distance_up_to_global_phase(unitary, expected):
+    phase = np.trace(expected.conj().T @ unitary)
+    phase /= abs(phase)
+    return np.linalg.norm(unitary - phase * expected, 2)
+
+
+@pytest.mark.parametrize("n_steps", [1, 2, 3, 6])
+def test_fused_circuits_approximate_the_evolution(n_steps):
+    time = 1.0
+    hamiltonian = order_terms_for_ladders(
+        controlled_qubit_hamiltonian(_h2_hamiltonian(), 4)
+    )
+    table = PauliTable.from_qubit_operator(hamiltonian)
+    qubits = cirq.LineQubit.range(5)
+    fused_circuit = pauli_evolution_circuit(table, time, n_steps, fuse=True)
+    unfused_circuit = pauli_evolution_circuit(table, time, n_steps)
+    fused_unitary = fused_circuit.to_cirq().unitary(qubits)
+
+    # The fused circuit is the unfused one with every other step in the
+    # reverse order, without the gates which cancel
+    reversed_table = table.take(np.arange(table.n_terms)[::-1])
+    steps = [
+        pauli_evolution_circuit(
+            reversed_table if step % 2 else table, time / n_steps
+        ).to_cirq()
+        for step in range(n_steps)
+    ]
+    unfused_unitary = cirq.Circuit(steps).unitary(qubits)
+    assert _distance_up_to_global_phase(fused_unitary, unfused_unitary) < 1e-9
+
+    # And within the commutator bound of exp(-i H t)
+    exact = scipy.linalg.expm(
+        -1j * time * of.get_sparse_operator(hamiltonian, 5).toarray()
+    )
+    error = _distance_up_to_global_phase(fused_unitary, exact)
+    assert error <= commutator_error_bound(table) * time**2 / n_steps
+
+    fused_counts = fused_circuit.gate_counts()
+    unfused_counts = unfused_circuit.gate_counts()
+    assert fused_counts["CNOT"] < unfused_counts["CNOT"]
+    if n_steps > 1:
+        # The rotations at the step boundaries merge
+        assert fused_counts["RZ"] < unfused_counts["RZ"]
+    else:
+        assert fused_counts["RZ"] == unfused_counts["RZ"]
@@ -0,0 +1,41 @@
+import itertools
+
+import numpy as np
+import openfermion as of
+import pytest
+
+from circuit_tools.fermi_hubbard import fermi_hubbard_pauli_table
+from circuit_tools.pauli import PauliTable
+
+# (tunneling, coulomb, chemical_potential, magnetic_field)
+_PARAMETERS = [
+    (1.0, 4.0, 0.5, 0.0),
+    (0.7, 2.3, 0.0, 0.3),
+    (1.0, 0.0, 0.0, 0.0),
+    (0.0, 4.0, 0.5, 0.5),
+    (2.0, 3.0, 1.5, -0.5),
+]
+
+
+@pytest.mark.parametrize("size", [(1, 1), (1, 3), (2, 1), (2, 2), (3, 2), (4, 4)])
+@pytest.mark.parametrize("parameters", _PARAMETERS)
+def test_pauli_table_matches_openfermion(size, parameters):
+    for periodic, spinless, particle_hole_symmetry in itertools.product(
+        [True, False], repeat=3
+    ):
+        arguments = size + parameters
+        keywords = dict(
+            periodic=periodic,
+            spinless=spinless,
+            particle_hole_symmetry=particle_hole_symmetry,
+        )
+        table = fermi_hubbard_pauli_table(*arguments, **keywords)
+        expected = PauliTable.from_qubit_operator(
+            of.jordan_wigner(of.fermi_hubbard(*arguments, **keywords))
+        )
+        # The same terms, in the same order, with the same coefficients
+        assert table.n_qubits == expected.n_qubits
+        np.testing.assert_array_equal(table.x, expected.x)
+        np.testing.assert_array_equal(table.z, expected.z)
+        np.testing.assert_array_equal(table.coefficients, expected.coefficients)
+        np.testing.assert_array_equal(table.real, expected.real)
@@ -0,0 +1,103 @@
+import itertools
+import sys
+
+import pytest
+
+from circuit_tools import gridsynth
+from circuit_tools.gridsynth import GridsynthCache, GridsynthWorker, GridsynthWorkerPool
+
+
+def test_cache_persists_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with GridsynthCache(path) as cache:
+        assert cache.get(0.1, 1e-3) is None
+        cache.put(0.1, 1e-3, "HTSH")
+        assert cache.get(0.1, 1e-3) == "HTSH"
+        assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    with GridsynthCache(path) as cache:
+        assert len(cache) == 1
+        assert cache.get(0.1, 1e-3) == "HTSH"
+        # Entries are keyed on the accuracy too, and -0.0 is 0.0
+        assert cache.get(0.1, 1e-4) is None
+        cache.put(-0.0, 1e-3, "")
+        assert cache.get(0.0, 1e-3) == ""
+        assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_cache_evicts_the_least_recently_used_entries(tmp_path, monkeypatch):
+    # Each flush happens at a later time
+    clock = itertools.count()
+    monkeypatch.setattr(gridsynth.time, "time", lambda: next(clock))
+    path = str(tmp_path / "cache.sqlite")
+    with GridsynthCache(path, max_entries=2) as cache:
+        cache.put(0.1, 1e-3, "HT")
+        cache.flush()
+        cache.put(0.2, 1e-3, "HTT")
+        cache.flush()
+        # Using 0.1 makes 0.2 the least recently used entry
+        assert cache.get(0.1, 1e-3) == "HT"
+        cache.flush()
+        cache.put(0.3, 1e-3, "HTTT")
+        cache.flush()
+        assert len(cache) == 2
+
+    with GridsynthCache(path, max_entries=2) as cache:
+        assert cache.get(0.1, 1e-3) == "HT"
+        assert cache.get(0.2, 1e-3) is None
+        assert cache.get(0.3, 1e-3) == "HTTT"
+
+
+_FAKE_SERVER = """\
+import sys
+
+# Answers like gridsynth_server, with a sequence in matrix order depending on
+# the angle, and an error for angles it can't parse
+for line in sys.stdin:
+    angle, accuracy = line.split()
+    try:
+        n_t_gates = round(abs(float(angle)) * 10)
+    except ValueError:
+        print(f"error: cannot parse angle {angle}", flush=True)
+        continue
+    print("W" + "T" * n_t_gates + "HS", flush=True)
+"""
+
+
+def _fake_server(tmp_path):
+    path = tmp_path / "gridsynth_server"
+    path.write_text(f"#!{sys.executable}\n" + _FAKE_SERVER)
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_worker_answers_batches_in_order(tmp_path):
+    worker = GridsynthWorker(_fake_server(tmp_path), batch_size=2)
+    try:
+        angles = [0.1, 0.5, 0.2, 0.3, 0.0]
+        assert list(worker.synthesize(angles, 1e-3)) == [
+            (angle, "SH" + "T" * round(angle * 10)) for angle in angles
+        ]
+        # The worker keeps answering after a batch
+        assert list(worker.synthesize([0.4], 1e-3)) == [(0.4, "SHTTTT")]
+    finally:
+        worker.close()
+
+
+def test_worker_errors_are_raised(tmp_path):
+    worker = GridsynthWorker(_fake_server(tmp_path), batch_size=2)
+    try:
+        with pytest.raises(RuntimeError, match="failed for angle pi"):
+            list(worker.synthesize([0.1, "pi", 0.2], 1e-3))
+    finally:
+        worker.close()
+
+
+def test_worker_pool_synthesizes_with_all_workers(tmp_path):
+    angles = [index / 10 for index in range(7)]
+    with GridsynthWorkerPool(2, server_path=_fake_server(tmp_path)) as pool:
+        assert len(pool.workers) == 2
+        results = pool.synthesize(angles, 1e-3)
+    assert sorted(results) == [
+        (angle, "SH" + "T" * round(angle * 10)) for angle in angles
+    ]
@@ -0,0 +1,72 @@
+import numpy as np
+import openfermion as of
+import pytest
+
+from circuit_tools.hamiltonians import (
+    HamiltonianCache,
+    molecular_hamiltonians,
+    molecule_key,
+)
+
+_MOLECULE = ([("H", (0.0, 0.0, 0.0)), ("H", (0.0, 0.0, 0.74))], "sto-3g", 1, 0)
+
+
+def _hamiltonians(seed):
+    interaction_operator = of.random_interaction_operator(4, real=True, seed=seed)
+    qubit_operator = of.jordan_wigner(of.get_fermion_operator(interaction_operator))
+    return interaction_operator, qubit_operator
+
+
+def _assert_same_qubit_operator(qubit_operator, expected):
+    # The same terms in the same order, with real or complex coefficients alike
+    assert list(qubit_operator.terms.items()) == list(expected.terms.items())
+    assert [isinstance(value, complex) for value in qubit_operator.terms.values()] == [
+        isinstance(value, complex) for value in expected.terms.values()
+    ]
+
+
+@pytest.mark.parametrize("complex_coefficients", [False, True])
+def test_cache_round_trip(tmp_path, complex_coefficients):
+    path = str(tmp_path / "hamiltonians.h5")
+    interaction_operator, qubit_operator = _hamiltonians(0)
+    # Reversing the terms checks that their order is kept, not recomputed
+    qubit_operator.terms = dict(reversed(qubit_operator.terms.items()))
+    if complex_coefficients:
+        # The Jordan-Wigner transform gives complex coefficients
+        term = next(iter(qubit_operator.terms))
+        qubit_operator.terms[term] = np.complex128(0.5 + 0.25j)
+    else:
+        # Compressing makes them real
+        qubit_operator.compress()
+        assert all(isinstance(value, float) for value in qubit_operator.terms.values())
+    HamiltonianCache(path).put(*_MOLECULE, interaction_operator, qubit_operator)
+
+    cache = HamiltonianCache(path)
+    cached_interaction_operator, cached_qubit_operator = cache.get(*_MOLECULE)
+    assert cached_interaction_operator == interaction_operator
+    _assert_same_qubit_operator(cached_qubit_operator, qubit_operator)
+    assert cache.stats() == {"hits": 1, "misses": 0}
+
+    # Cache hits don't need pyscf
+    _, qubit_operator_again = molecular_hamiltonians(*_MOLECULE, cache=cache)
+    _assert_same_qubit_operator(qubit_operator_again, qubit_operator)
+
+
+def test_cache_is_keyed_by_the_whole_molecule(tmp_path):
+    geometry, basis, multiplicity, charge = _MOLECULE
+    cache = HamiltonianCache(str(tmp_path / "hamiltonians.h5"))
+    cache.put(*_MOLECULE, *_hamiltonians(0))
+    other_molecules = [
+        ([("H", (0.0, 0.0, 0.0)), ("H", (0.0, 0.0, 0.75))], basis, 1, 0),
+        ([("H", (0.0, 0.0, 0.74)), ("H", (0.0, 0.0, 0.0))], basis, 1, 0),
+        (geometry, "6-31g", multiplicity, charge),
+        (geometry, basis, 3, charge),
+        (geometry, basis, multiplicity, 1),
+    ]
+    keys = {molecule_key(*molecule) for molecule in [_MOLECULE] + other_molecules}
+    assert len(keys) == len(other_molecules) + 1
+    for molecule in other_molecules:
+        assert cache.get(*molecule) is None
+    # Integer and float coordinates are the same geometry
+    assert cache.get([("H", (0, 0, 0)), ("H", (0, 0, 0.74))], basis, 1, 0) is not None
+    assert cache.stats() == {"hits": 1, "misses": len(other_molecules)}
@@ -0,0 +1,217 @@
+import io
+import random
+
+import cirq
+import numpy as np
+import pytest
+
+import circuit_tools.icm as icm
+from circuit_tools.cirq_json import open_circuit_file
+from circuit_tools.columnar import ColumnarCircuit
+from circuit_tools.icm import ICM_TELEPORTED_GATES, write_icm_circuit
+from circuit_tools.resources import count_resources
+
+_GATES = {
+    "H": cirq.H,
+    "S": cirq.S,
+    "X": cirq.X,
+    "Z": cirq.Z,
+    "T": cirq.T,
+    "T_DAG": cirq.T**-1,
+    "CNOT": cirq.CNOT,
+    "CZ": cirq.CZ,
+}
+_MAX_ANCILLAS = 12
+
+
+def _random_operations(rng, n_qubits, n_operations, teleported_gates):
+    # At most _MAX_ANCILLAS teleported gates, so that the ICM circuit can be
+    # simulated
+    operations = []
+    n_teleported = 0
+    while len(operations) < n_operations:
+        gate_name = rng.choice(["H", "S", "T", "T_DAG", "X", "Z", "CNOT", "CZ", "RZ"])
+        if gate_name in teleported_gates:
+            if n_teleported == _MAX_ANCILLAS:
+                continue
+            n_teleported += 1
+        arity = 2 if gate_name in ("CNOT", "CZ") else 1
+        params = (rng.choice([0.1, -0.3]),) if gate_name == "RZ" else ()
+        qubits = tuple(rng.sample(range(n_qubits), arity))
+        operations.append((gate_name, qubits, params))
+    return operations
+
+
+def _cirq_gate(gate_name, params):
+    return cirq.rz(params[0]) if gate_name == "RZ" else _GATES[gate_name]
+
+
+def _random_state(rng):
+    state = np.array([complex(rng.gauss(0, 1), rng.gauss(0, 1)) for _ in range(2)])
+    return state / np.linalg.norm(state)
+
+
+def _product_state(states):
+    result = np.ones(1, dtype=np.complex128)
+    for state in states:
+        result = np.kron(result, state)
+    return result
+
+
+def _assert_equivalent(icm_circuit, summary, operations, n_qubits, teleported_gates):
+    # Runs the ICM circuit on random input states of the qubits, with the
+    # ancillas in the initial states recorded in the summary, and projects the
+    # measured wires on outcome 0: the wires carrying the qubits at the end
+    # then hold the output of the circuit on the same input states
+    rng = random.Random(len(operations))
+    input_states = [_random_state(rng) for _ in range(n_qubits)]
+    qubits = cirq.LineQubit.range(n_qubits)
+    expected = cirq.final_state_vector(
+        cirq.Circuit(
+            _cirq_gate(gate_name, params).on(*[qubits[qubit] for qubit in indices])
+            for gate_name, indices, params in operations
+        ),
+        initial_state=_product_state(input_states),
+        qubit_order=qubits,
+        dtype=np.complex128,
+    )
+
+    # G|+> for the gate G of each ancilla
+    ancilla_gates = {
+        character: _GATES[gate_name]
+        for gate_name, character in icm.ANCILLA_STATES.items()
+        if gate_name in _GATES
+    }
+    plus = np.array([1, 1]) / np.sqrt(2)
+    ancilla_states = [
+        cirq.unitary(ancilla_gates[character]) @ plus
+        for character in summary["ancilla_states"]
+    ]
+    wires = [cirq.NamedQubit(str(qubit)) for qubit in range(n_qubits)]
+    wires += [cirq.NamedQubit(f"anc_{index}") for index in range(len(ancilla_states))]
+    measured = set()
+    unitary_operations = []
+    for operation in icm_circuit.all_operations():
+        # Nothing acts on a wire after its measurement
+        assert not measured & set(operation.qubits)
+        if cirq.is_measurement(operation):
+            measured.update(operation.qubits)
+        else:
+            unitary_operations.append(operation)
+    state = cirq.final_state_vector(
+        cirq.Circuit(unitary_operations),
+        initial_state=_product_state(input_states + ancilla_states),
+        qubit_order=wires,
+        dtype=np.complex128,
+    ).reshape([2] * len(wires))
+    state = state[tuple(0 if wire in measured else slice(None) for wire in wires)]
+    # Each teleportation has outcome 0 with probability 1/2
+    assert len(measured) == len(ancilla_states)
+    assert np.isclose(np.linalg.norm(state) ** 2, 2.0 ** -len(measured))
+
+    # The qubits end up on the ancilla of their last teleportation
+    final_wires = wires[:n_qubits]
+    n_ancillas = 0
+    for gate_name, indices, _ in operations:
+        if gate_name in teleported_gates:
+            final_wires[indices[0]] = wires[n_qubits + n_ancillas]
+            n_ancillas += 1
+    unmeasured_wires = [wire for wire in wires if wire not in measured]
+    state = np.transpose(state, [unmeasured_wires.index(wire) for wire in final_wires])
+    cirq.testing.assert_allclose_up_to_global_phase(
+        state.reshape(-1) / np.linalg.norm(state), expected, atol=1e-8
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_icm_circuit_is_equivalent_to_the_circuit(seed, tmp_path, monkeypatch):
+    rng = random.Random(seed)
+    # Small chunks, so that wires and moments are carried between chunks
+    monkeypatch.setattr(icm, "_CHUNK_SIZE", rng.choice([1, 7, 1 << 16]))
+    n_qubits = rng.randint(2, 4)
+    teleported_gates = rng.choice([ICM_TELEPORTED_GATES, ("T", "T_DAG", "S", "Z")])
+    operations = _random_operations(
+        rng, n_qubits, rng.randint(1, 40), teleported_gates
+    )
+    path = str(tmp_path / rng.choice(["icm.json", "icm.json.gz"]))
+
+    summary = write_icm_circuit(
+        ColumnarCircuit.from_operations(operations, n_qubits=n_qubits),
+        path,
+        teleported_gates,
+    )
+
+    with open_circuit_file(path) as f:
+        text = f.read()
+    icm_circuit = cirq.read_json(json_text=text)
+    # The moments are those cirq gives the operations
+    assert text == cirq.to_json(cirq.Circuit(icm_circuit.all_operations()))
+    _assert_equivalent(icm_circuit, summary, operations, n_qubits, teleported_gates)
+
+    expected_summary = count_resources(icm_circuit)
+    for key in ("n_qubits", "n_operations", "cnot_count", "depth", "gate_counts"):
+        assert summary[key] == expected_summary[key]
+    assert "t_count" not in summary
+    assert summary["magic_state_count"] == sum(
+        gate_name in ("T", "T_DAG") for gate_name, _, _ in operations
+    )
+    assert summary["ancilla_states"] == "".join(
+        icm.ANCILLA_STATES[gate_name]
+        for gate_name, _, _ in operations
+        if gate_name in teleported_gates
+    )
+
+
+def test_cnots_stay_between_the_wires_carrying_their_qubits(tmp_path):
+    operations = [
+        ("X", (0,), ()),
+        ("T", (1,), ()),
+        ("H", (0,), ()),
+        ("CNOT", (0, 1), ()),
+        ("T_DAG", (0,), ()),
+    ]
+    path = str(tmp_path / "icm.json")
+    summary = write_icm_circuit(
+        ColumnarCircuit.from_operations(operations, n_qubits=2), path
+    )
+    q0, q1, anc_0, anc_1 = map(cirq.NamedQubit, ["0", "1", "anc_0", "anc_1"])
+    with open_circuit_file(path) as f:
+        icm_circuit = cirq.read_json(f)
+    assert list(icm_circuit.all_operations()) == [
+        cirq.X(q0),
+        cirq.CNOT(anc_0, q1),
+        cirq.measure(q1, key="1"),
+        cirq.H(q0),
+        cirq.CNOT(q0, anc_0),
+        cirq.CNOT(anc_1, q0),
+        cirq.measure(q0, key="0"),
+    ]
+    assert summary["gate_counts"] == {"CNOT": 3, "H": 1, "MEASURE": 2, "X": 1}
+    assert summary["magic_state_count"] == 2
+    assert summary["ancilla_states"] == "Tt"
+    assert summary["n_qubits"] == 4
+
+
+def test_only_diagonal_gates_are_teleported():
+    circuit = ColumnarCircuit.from_operations([("X", (0,), ())], n_qubits=1)
+    with pytest.raises(ValueError, match="not CNOT, X"):
+        write_icm_circuit(circuit, io.StringIO(), ("T", "T_DAG", "X", "CNOT"))
+    with pytest.raises(ValueError, match="T gates"):
+        write_icm_circuit(circuit, io.StringIO(), ("T",))
+
+
+def test_circuit_operations_are_converted_like_their_unrolled_circuits():
+    q0, q1 = cirq.LineQubit.range(2)
+    step = cirq.CircuitOperation(
+        cirq.FrozenCircuit(cirq.H(q0), cirq.T(q0), cirq.CNOT(q0, q1), cirq.T(q1))
+    )
+    circuit = cirq.Circuit(cirq.X(q1), step.repeat(3))
+    unrolled_circuit = cirq.unroll_circuit_op(circuit, tags_to_check=None)
+    files = [io.StringIO(), io.StringIO()]
+    summaries = [
+        write_icm_circuit(circuit, files[0]),
+        write_icm_circuit(unrolled_circuit, files[1]),
+    ]
+    assert files[0].getvalue() == files[1].getvalue()
+    assert summaries[0] == summaries[1]
+    assert summaries[0]["ancilla_states"] == "TT" * 3
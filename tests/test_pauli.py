@@ -0,0 +1,74 @@
+import numpy as np
+import openfermion as of
+import pytest
+
+from circuit_tools.pauli import PauliTable, add_control_qubit
+
+
+def _random_qubit_operator(rng, n_qubits, n_terms, complex_coefficients=False):
+    qubit_operator = of.QubitOperator()
+    for _ in range(n_terms):
+        term = tuple(
+            (qubit, "XYZ"[rng.integers(3)])
+            for qubit in range(n_qubits)
+            if rng.random() < 0.5
+        )
+        coefficient = float(rng.normal())
+        if complex_coefficients and rng.random() < 0.5:
+            coefficient += 1j * float(rng.normal())
+        qubit_operator += of.QubitOperator(term, coefficient)
+    return qubit_operator
+
+
+def _assert_same_terms(table, qubit_operator):
+    # Same terms, in the same order, with the same coefficients and types
+    terms = list(table.to_qubit_operator().terms.items())
+    expected_terms = list(qubit_operator.terms.items())
+    assert [term for term, _ in terms] == [term for term, _ in expected_terms]
+    for (_, coefficient), (_, expected) in zip(terms, expected_terms):
+        assert coefficient == pytest.approx(expected, abs=1e-12)
+        assert isinstance(coefficient, complex) == isinstance(expected, complex)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_products_with_paulis_match_qubit_operators(seed):
+    rng = np.random.default_rng(seed)
+    qubit_operator = _random_qubit_operator(rng, 6, 40, complex_coefficients=True)
+    table = PauliTable.from_qubit_operator(qubit_operator)
+    _assert_same_terms(table, qubit_operator)
+    for qubit in (0, 3, 7):
+        for letter in "XYZ":
+            _assert_same_terms(
+                table.multiply_by_pauli(qubit, letter),
+                qubit_operator * of.QubitOperator(((qubit, letter),)),
+            )
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sums_and_compression_match_qubit_operators(seed):
+    rng = np.random.default_rng(seed)
+    # Few qubits, so that the operators share terms
+    first = _random_qubit_operator(rng, 3, 20, complex_coefficients=True)
+    second = _random_qubit_operator(rng, 4, 20)
+    table = PauliTable.concatenate(
+        [PauliTable.from_qubit_operator(first), PauliTable.from_qubit_operator(second)]
+    ).combine_like_terms()
+    _assert_same_terms(table, first + second)
+
+    expected = first + second
+    expected.compress(abs_tol=0.5)
+    _assert_same_terms(table.compress(abs_tol=0.5), expected)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_controlled_hamiltonian_matches_qubit_operators(seed):
+    rng = np.random.default_rng(seed)
+    hamiltonian = _random_qubit_operator(rng, 5, 30)
+    control_qubit = 5
+    # The QubitOperator expression the generating scripts used
+    ancilla_z = 0.5 * of.QubitOperator(f"Z{control_qubit}")
+    expected = ancilla_z + 0.5 * hamiltonian + hamiltonian * ancilla_z
+    expected.compress()
+    table = PauliTable.from_qubit_operator(hamiltonian)
+    table = add_control_qubit(table, control_qubit)
+    _assert_same_terms(table, expected)
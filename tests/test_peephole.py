@@ -0,0 +1,52 @@
+import random
+
+import cirq
+import pytest
+from orquestra.integrations.cirq.conversions import export_to_cirq
+from orquestra.quantum.circuits import CNOT, RX, Circuit, H, I, S, T, X, Z
+
+from circuit_tools.peephole import optimize_clifford_t
+
+_ONE_QUBIT_GATES = [H, X, Z, S, S.dagger, T, T.dagger, I]
+
+
+def _random_clifford_t_circuit(rng, n_qubits, n_operations):
+    # Few qubits and many phases and CNOTs, so that most rules of the
+    # optimizer apply, with a few rotations blocking their qubits
+    operations = []
+    for _ in range(n_operations):
+        draw = rng.random()
+        if draw < 0.3:
+            control, target = rng.sample(range(n_qubits), 2)
+            operations.append(CNOT(control, target))
+        elif draw < 0.33:
+            operations.append(RX(rng.uniform(0, 3))(rng.randrange(n_qubits)))
+        else:
+            gate = rng.choice(_ONE_QUBIT_GATES)
+            operations.append(gate(rng.randrange(n_qubits)))
+    return Circuit(operations, n_qubits=n_qubits)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_optimized_circuit_has_the_same_unitary(seed):
+    rng = random.Random(seed)
+    n_qubits = 3
+    circuit = _random_clifford_t_circuit(rng, n_qubits, 200)
+    optimized_circuit = optimize_clifford_t(circuit)
+    assert optimized_circuit.n_qubits == n_qubits
+    assert len(optimized_circuit.operations) < len(circuit.operations)
+
+    qubits = cirq.LineQubit.range(n_qubits)
+    assert cirq.allclose_up_to_global_phase(
+        export_to_cirq(optimized_circuit).unitary(qubits),
+        export_to_cirq(circuit).unitary(qubits),
+        atol=1e-8,
+    )
+
+
+def test_redundant_gates_are_removed():
+    circuit = Circuit(
+        [H(0), H(0), T(1), CNOT(1, 0), T(1), X(0), CNOT(1, 0), X(0), S.dagger(1)],
+        n_qubits=2,
+    )
+    assert optimize_clifford_t(circuit).operations == []
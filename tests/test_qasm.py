@@ -0,0 +1,94 @@
+import io
+import os
+
+import cirq
+import numpy as np
+import pytest
+from openfermion import QubitOperator
+from orquestra.quantum.circuits import Circuit, H
+
+from circuit_tools.columnar import ColumnarCircuit
+from circuit_tools.evolution import time_evolution
+from circuit_tools.qasm import format_qasm_param, write_qasm_circuit
+
+_REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _qasm(circuit):
+    f = io.StringIO()
+    write_qasm_circuit(circuit, f)
+    return f.getvalue()
+
+
+def test_circuit_operations_are_written_repeated():
+    q0, q1 = cirq.LineQubit.range(2)
+    step = cirq.CircuitOperation(cirq.FrozenCircuit(cirq.H(q0), cirq.CNOT(q0, q1)))
+    assert _qasm(cirq.Circuit(step.repeat(3))) == (
+        'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[2];\n'
+        + "h q[0];\ncx q[0],q[1];\n" * 3
+    )
+
+    # Mapped, inverted and nested subcircuits, between other operations
+    q2 = cirq.LineQubit(2)
+    outer = cirq.CircuitOperation(cirq.FrozenCircuit(cirq.T(q1), step.repeat(2)))
+    circuit = cirq.Circuit(
+        cirq.X(q2),
+        outer.repeat(2),
+        step.with_qubit_mapping({q0: q2, q1: q0}).repeat(-1),
+        cirq.measure(q0, key="m"),
+    )
+    unrolled_circuit = cirq.unroll_circuit_op(circuit, deep=True, tags_to_check=None)
+    assert _qasm(circuit) == _qasm(unrolled_circuit)
+    assert "creg c[1];\n" in _qasm(circuit)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (0.0, "0"),
+        (1e-15, "0"),
+        (1e-10, "1e-10"),
+        (0.002, "0.002"),
+        (-0.123, "-0.123"),
+        (0.1234567891, "0.12345679"),
+        (np.pi / 4, "pi/4"),
+        (-np.pi / 4, "-pi/4"),
+        (np.pi / 2, "pi/2"),
+        (np.pi / 2 + 1e-7, "pi/2"),
+        (-np.pi / 2, "-pi/2"),
+        (3 * np.pi / 4, "3*pi/4"),
+        (-7 * np.pi / 4, "-7*pi/4"),
+        (np.pi, "pi"),
+        (-2 * np.pi, "-2*pi"),
+        (np.pi**2, "9.8696044"),
+        (1 / np.pi, "1/(1*pi)"),
+        (-2 / (3 * np.pi), "-2/(3*pi)"),
+        (100.0, "100"),
+    ],
+)
+def test_params_are_formatted_like_qiskit(value, expected):
+    assert format_qasm_param(value) == expected
+
+
+def test_toy_circuit_is_the_committed_one():
+    # Rebuilds 2022_04_11_zapata_toy_trotter/time_1_error_0_001.txt without
+    # zquantum: the Hadamard test of exp(-i(X0 + Z0)) with 1000 Trotter steps,
+    # controlling everything but the Hadamards as create_hadamard_test_circuit does
+    hamiltonian = QubitOperator("X0") + QubitOperator("Z0")
+    unitary_circuit = time_evolution(hamiltonian, time=1, trotter_order=1000)
+    circuit = Circuit([H(0)])
+    for operation in unitary_circuit.operations:
+        if operation.gate.name == "H":
+            circuit += operation
+        else:
+            qubits = [qubit + 1 for qubit in operation.qubit_indices]
+            circuit += operation.gate.controlled(1)(0, *qubits)
+    circuit += H(0)
+
+    path = os.path.join(
+        _REPOSITORY, "2022_04_11_zapata_toy_trotter", "time_1_error_0_001.txt"
+    )
+    with open(path) as f:
+        expected = f.read()
+    assert _qasm(circuit) == expected
+    assert _qasm(ColumnarCircuit.from_orquestra(circuit)) == expected
@@ -0,0 +1,21 @@
+import cirq
+
+from circuit_tools.resources import count_resources
+
+
+def test_circuit_operations_are_expanded():
+    a, b, c = cirq.LineQubit.range(3)
+    inner = cirq.FrozenCircuit(cirq.T(a), cirq.CNOT(a, b))
+    outer = cirq.FrozenCircuit(cirq.H(b), cirq.CircuitOperation(inner, repetitions=2))
+    circuit = cirq.Circuit(
+        cirq.CircuitOperation(outer, repetitions=3, qubit_map={a: c}).with_tags("x"),
+        cirq.CircuitOperation(inner, repetitions=-1),
+    )
+    unrolled_circuit = cirq.unroll_circuit_op(circuit, deep=True, tags_to_check=None)
+    assert count_resources(circuit) == count_resources(unrolled_circuit)
+    assert count_resources(circuit)["gate_counts"] == {
+        "CNOT": 7,
+        "H": 3,
+        "T": 6,
+        "T_DAG": 1,
+    }
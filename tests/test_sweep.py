@@ -0,0 +1,46 @@
+from circuit_tools.gridsynth import combine_cache_stats
+from circuit_tools.sweep import Sweep
+
+
+class _CountingCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def _lookup(value, cache=None):
+    cache.misses += 1
+    return value
+
+
+def _add(first, second, cache=None):
+    cache.hits += 2
+    return first + second
+
+
+def _run(jobs):
+    sweep = Sweep()
+    first = sweep.stage(_lookup, 1)
+    second = sweep.stage(_lookup, 2)
+    for offset in range(3):
+        sweep.stage(_add, sweep.stage(_add, first, second), offset)
+    results = sweep.run(jobs, {"cache": _CountingCache})
+    return results, combine_cache_stats(sweep.resource_stats["cache"])
+
+
+def test_resource_stats_are_collected_from_every_process():
+    # The lookups and the shared addition run in the main process, the other
+    # additions in worker processes with jobs=2
+    for jobs in (1, 2):
+        results, stats = _run(jobs)
+        assert sorted(results) == [3, 4, 5]
+        assert stats == {"hits": 8, "misses": 2, "hit_rate": 0.8}
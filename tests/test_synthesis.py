@@ -0,0 +1,55 @@
+import random
+
+import cirq
+import numpy as np
+import pytest
+
+from circuit_tools.synthesis import exact_rz_sequence, synthesize_rz_natively
+
+_GATE_UNITARIES = {
+    "H": cirq.unitary(cirq.H),
+    "S": cirq.unitary(cirq.S),
+    "T": cirq.unitary(cirq.T),
+    "X": cirq.unitary(cirq.X),
+}
+
+
+def _sequence_unitary(gate_sequence):
+    # The gates are in circuit order, so each one multiplies from the left
+    unitary = np.eye(2)
+    for gate in gate_sequence:
+        unitary = _GATE_UNITARIES[gate] @ unitary
+    return unitary
+
+
+def _distance_up_to_global_phase(unitary, expected):
+    phase = np.trace(expected.conj().T @ unitary)
+    phase /= abs(phase)
+    return np.linalg.norm(unitary - phase * expected, 2)
+
+
+@pytest.mark.parametrize("synthesis_accuracy", [1e-2, 1e-4, 1e-6, 1e-10])
+@pytest.mark.parametrize("seed", range(20))
+def test_native_synthesis_is_within_the_accuracy(seed, synthesis_accuracy):
+    angle = random.Random(seed).uniform(-2 * np.pi, 2 * np.pi)
+    gate_sequence = synthesize_rz_natively(angle, synthesis_accuracy)
+    assert set(gate_sequence) <= set(_GATE_UNITARIES)
+    # About 3 log2(1 / accuracy) T gates, like gridsynth
+    assert gate_sequence.count("T") <= 4 * np.log2(1 / synthesis_accuracy) + 10
+    distance = _distance_up_to_global_phase(
+        _sequence_unitary(gate_sequence), cirq.unitary(cirq.rz(angle))
+    )
+    assert distance <= synthesis_accuracy
+
+
+@pytest.mark.parametrize("j", range(-8, 9))
+def test_multiples_of_pi_over_4_are_exact(j):
+    angle = j * np.pi / 4
+    gate_sequence = exact_rz_sequence(angle)
+    assert gate_sequence == synthesize_rz_natively(angle, 1e-3)
+    assert gate_sequence.count("T") <= 1
+    distance = _distance_up_to_global_phase(
+        _sequence_unitary(gate_sequence), cirq.unitary(cirq.rz(angle))
+    )
+    assert distance < 1e-12
+    assert exact_rz_sequence(angle + 1e-3) is None
@@ -0,0 +1,74 @@
+import cirq
+import numpy as np
+import pytest
+
+from circuit_tools.columnar import ColumnarCircuit
+from circuit_tools.random_circuits import random_circuit
+from circuit_tools.toffoli import N_TOFFOLI_ANCILLAS, decompose_toffolis
+
+
+def _toffoli_circuit():
+    return ColumnarCircuit.from_operations([("TOFFOLI", (0, 1, 2), ())], n_qubits=3)
+
+
+def test_seven_t_decomposition_is_a_toffoli():
+    decomposed_circuit = decompose_toffolis(_toffoli_circuit(), "7t")
+    assert decomposed_circuit.n_qubits == 3
+    assert decomposed_circuit.gate_counts() == {
+        "CNOT": 6,
+        "H": 2,
+        "T": 4,
+        "T_DAG": 3,
+    }
+    assert cirq.allclose_up_to_global_phase(
+        decomposed_circuit.to_cirq().unitary(cirq.LineQubit.range(3)),
+        cirq.unitary(cirq.TOFFOLI),
+    )
+
+
+def test_t_depth_1_decomposition_is_a_toffoli_on_clean_ancillas():
+    decomposed_circuit = decompose_toffolis(_toffoli_circuit(), "t_depth_1")
+    n_qubits = 3 + N_TOFFOLI_ANCILLAS
+    assert decomposed_circuit.n_qubits == n_qubits
+    unitary = decomposed_circuit.to_cirq().unitary(cirq.LineQubit.range(n_qubits))
+    # The ancillas are the last, least significant qubits. Starting from |0>
+    # they must end in |0>, with a Toffoli on the other qubits.
+    clean = [index << N_TOFFOLI_ANCILLAS for index in range(8)]
+    np.testing.assert_allclose(
+        unitary[np.ix_(clean, clean)], cirq.unitary(cirq.TOFFOLI), atol=1e-8
+    )
+
+
+@pytest.mark.parametrize("decomposition", ["7t", "t_depth_1"])
+@pytest.mark.parametrize("seed", range(5))
+def test_decomposed_random_circuits_act_like_the_original(seed, decomposition):
+    n_qubits = 4
+    circuit = random_circuit(n_qubits, 12, clifford_gates=("H", "CNOT", "S"), seed=seed)
+    assert circuit.gate_counts()["TOFFOLI"] > 0
+    decomposed_circuit = decompose_toffolis(circuit, decomposition, n_ancilla_sets=2)
+    assert "TOFFOLI" not in decomposed_circuit.gate_counts()
+    n_ancillas = decomposed_circuit.n_qubits - n_qubits
+    qubits = cirq.LineQubit.range(decomposed_circuit.n_qubits)
+    # Columns of the unitaries on the data qubits, with the ancillas starting
+    # in |0>, which must end in |0> too
+    expected = []
+    columns = []
+    for index in range(2**n_qubits):
+        expected.append(
+            cirq.final_state_vector(
+                circuit.to_cirq(),
+                initial_state=index,
+                qubit_order=qubits[:n_qubits],
+                dtype=np.complex128,
+            )
+        )
+        state = cirq.final_state_vector(
+            decomposed_circuit.to_cirq(),
+            initial_state=index << n_ancillas,
+            qubit_order=qubits,
+            dtype=np.complex128,
+        )
+        columns.append(state[:: 2**n_ancillas])
+    assert cirq.allclose_up_to_global_phase(
+        np.array(columns), np.array(expected), atol=1e-8
+    )
@@ -0,0 +1,109 @@
+import numpy as np
+import openfermion as of
+import pytest
+import scipy.linalg
+
+from circuit_tools import trotter_error
+from circuit_tools.pauli import PauliTable
+from circuit_tools.trotter_error import commutator_error_bound, number_of_trotter_steps
+
+_N_QUBITS = 4
+
+
+def _random_hamiltonian(rng, n_terms):
+    hamiltonian = of.QubitOperator((), float(rng.normal()))
+    for _ in range(n_terms):
+        term = tuple(
+            (qubit, "XYZ"[rng.integers(3)])
+            for qubit in range(_N_QUBITS)
+            if rng.random() < 0.5
+        )
+        hamiltonian += of.QubitOperator(term, float(rng.normal()))
+    return hamiltonian
+
+
+def _term_matrices(hamiltonian):
+    return [
+        coefficient
+        * of.get_sparse_operator(of.QubitOperator(term), _N_QUBITS).toarray()
+        for term, coefficient in hamiltonian.terms.items()
+    ]
+
+
+def _trotter_unitary(hamiltonian, time, n_steps, order):
+    # The first order formula applies the terms in order, and the second order
+    # one forwards and then backwards for half the step
+    terms = _term_matrices(hamiltonian)
+    if order == 1:
+        factors = [scipy.linalg.expm(-1j * term * time / n_steps) for term in terms]
+    else:
+        halves = [scipy.linalg.expm(-0.5j * term * time / n_steps) for term in terms]
+        factors = halves + halves[::-1]
+    step = np.eye(2**_N_QUBITS)
+    for factor in factors:
+        step = factor @ step
+    return np.linalg.matrix_power(step, n_steps)
+
+
+@pytest.mark.parametrize("order", [1, 2])
+@pytest.mark.parametrize("seed", range(10))
+def test_bounds_hold_against_brute_force_errors(seed, order):
+    rng = np.random.default_rng(seed)
+    hamiltonian = _random_hamiltonian(rng, 8)
+    bound = commutator_error_bound(hamiltonian, order)
+    assert bound > 0
+    exact = scipy.linalg.expm(-1j * sum(_term_matrices(hamiltonian)))
+    for n_steps in (1, 3, 10):
+        error = np.linalg.norm(
+            _trotter_unitary(hamiltonian, 1.0, n_steps, order) - exact, 2
+        )
+        assert error <= bound / n_steps**order
+
+
+def test_bound_vanishes_for_commuting_terms():
+    hamiltonian = of.QubitOperator("Z0 Z1", 0.5) + of.QubitOperator("Y0 Y1", -1.0)
+    hamiltonian += of.QubitOperator("X0 X1", 0.3) + of.QubitOperator((), 2.0)
+    assert commutator_error_bound(hamiltonian, 1) == 0
+    assert commutator_error_bound(hamiltonian, 2) == 0
+    with pytest.raises(ValueError):
+        commutator_error_bound(hamiltonian, 3)
+
+
+def _brute_force_later_weights(table):
+    codes = [dict(term) for term in table.to_qubit_operator().terms]
+    weights = np.abs(table.coefficients)
+    later_weights = np.zeros(len(codes))
+    for i, first in enumerate(codes):
+        for j in range(i + 1, len(codes)):
+            second = codes[j]
+            n_different = sum(
+                first[qubit] != second[qubit] for qubit in first.keys() & second.keys()
+            )
+            if n_different % 2:
+                later_weights[i] += weights[j]
+    return later_weights
+
+
+@pytest.mark.parametrize("pairs_per_block", [1, 30, 100, 1 << 23])
+def test_weights_are_the_same_for_any_block_size(monkeypatch, pairs_per_block):
+    monkeypatch.setattr(trotter_error, "_PAIRS_PER_BLOCK", pairs_per_block)
+    table = PauliTable.from_qubit_operator(
+        _random_hamiltonian(np.random.default_rng(0), 40)
+    )
+    np.testing.assert_allclose(
+        trotter_error._later_anticommuting_weights(table),
+        _brute_force_later_weights(table),
+    )
+
+
+def test_number_of_trotter_steps():
+    # 1 * 2**2 / 0.5 is exactly 8 steps
+    assert number_of_trotter_steps(1.0, 2.0, 0.5) == 8
+    assert number_of_trotter_steps(1.0, 2.0, 0.49) == 9
+    # sqrt(1 * 2**3 / 0.5) is exactly 4 steps
+    assert number_of_trotter_steps(1.0, 2.0, 0.5, order=2) == 4
+    assert number_of_trotter_steps(0.0, 2.0, 0.5) == 1
+    for order in (1, 2):
+        n_steps = number_of_trotter_steps(0.37, 1.3, 1e-3, order)
+        assert 0.37 * 1.3 ** (order + 1) / n_steps**order <= 1e-3
+        assert 0.37 * 1.3 ** (order + 1) / (n_steps - 1) ** order > 1e-3